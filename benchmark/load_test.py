@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/9/13 5:30 PM 
+# @Author : yangyuxin
+# @File : load_test.py
+# 这个代码文件对本机的 query_service 做压力测试，多个连接同时发出请求，输出吞吐量和延迟分位数
+# 不指定服务地址时，用合成路网在本进程的另一个线程里启动一个服务
+#
+# python benchmark/load_test.py --synthetic 10000 --connections 16 --requests 20000
+# python benchmark/load_test.py --unix /tmp/road_query.sock --bbox 116.3,39.8,116.5,40.0 --op route
+# python benchmark/load_test.py --unix /tmp/road_query.sock --bbox 116.3,39.8,116.5,40.0 --op distance --link-num 500000
+
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+import compact_topology
+import query_service
+import synthetic_data
+
+
+DEFAULT_CONNECTIONS = 16
+DEFAULT_IN_FLIGHT = 4  # requests waiting for answer on one connection
+DEFAULT_REQUESTS = 10000
+PERCENTILES = [50, 90, 95, 99, 99.9]
+
+
+class LocalServer(object):
+    """
+    query service on synthetic roads, running in its own thread and event loop
+    """
+    def __init__(self, link_num, seed=0, max_batch=query_service.BATCH_SIZE, max_wait=query_service.BATCH_WAIT):
+        self.lines = synthetic_data.make_road_lines(link_num, seed)
+        coords = np.array([point for line in self.lines for point in line], dtype=np.float64)
+        offsets = np.concatenate(([0], np.cumsum([len(line) for line in self.lines]))).astype(np.int64)
+        topology = compact_topology.CompactTopology.from_lines(coords, offsets)
+        self.server = query_service.QueryServer(query_service.QueryEngine(topology), max_batch, max_wait)
+        self.loop = asyncio.new_event_loop()
+        self.address = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.start(port=0))
+        self.address = self.server.get_address()
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self.address
+
+    def stop(self):
+        future = asyncio.run_coroutine_threadsafe(self.server.close(), self.loop)
+        future.result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def make_requests(op, points, count, seed=0, link_num=0):
+    """
+    :param op: query_service.OP_*
+    :param points: [(longitude, latitude)] requests are made from
+    :param count: count of requests
+    :param seed: random seed
+    :param link_num: link count of service topology, links of distance requests are drawn from it
+    :return: [request dict]
+    """
+    rng = random.Random(seed)
+    requests = list()
+    for _ in range(count):
+        if op == query_service.OP_ROUTE:
+            requests.append({'op': op, 'source': list(rng.choice(points)), 'target': list(rng.choice(points))})
+        elif op == query_service.OP_DISTANCE:
+            requests.append({'op': op, 'point': list(rng.choice(points)), 'link': rng.randrange(link_num)})
+        else:
+            requests.append({'op': op, 'point': list(rng.choice(points))})
+    return requests
+
+
+def make_bbox_points(bbox, count, seed=0):
+    rng = np.random.RandomState(seed)
+    lons = rng.uniform(bbox[0], bbox[2], size=count)
+    lats = rng.uniform(bbox[1], bbox[3], size=count)
+    return list(zip(lons.tolist(), lats.tolist()))
+
+
+async def run_connection(address, requests, in_flight, latencies, errors):
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(address[0], address[1])
+    send_times = dict()
+    position = 0
+    received = 0
+    try:
+        while received < len(requests):
+            # keep in_flight requests waiting on this connection
+            while position < len(requests) and position - received < in_flight:
+                request = dict(requests[position])
+                request['id'] = position
+                send_times[position] = time.perf_counter()
+                writer.write((json.dumps(request) + '\n').encode('utf-8'))
+                position += 1
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("connection closed by query service")
+            response = json.loads(line.decode('utf-8'))
+            latencies.append(time.perf_counter() - send_times.pop(response['id']))
+            if 'error' in response:
+                errors.append(response['error'])
+            received += 1
+    finally:
+        writer.close()
+
+
+async def run_load(address, requests, connections, in_flight):
+    """
+    :return: latencies of all requests in second, error messages, total seconds
+    """
+    latencies = list()
+    errors = list()
+    parts = [requests[i::connections] for i in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*[run_connection(address, part, in_flight, latencies, errors) for part in parts if part])
+    return latencies, errors, time.perf_counter() - start
+
+
+async def fetch_stats(address):
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(address[0], address[1])
+    writer.write(b'{"id": 0, "op": "stats"}\n')
+    await writer.drain()
+    response = json.loads((await reader.readline()).decode('utf-8'))
+    writer.close()
+    return response.get('result')
+
+
+def format_report(op, latencies, errors, seconds, stats=None):
+    lines = ['op: %s' % op,
+             'requests: %d, errors: %d, time: %.3fs, throughput: %.1f/s'
+             % (len(latencies), len(errors), seconds, len(latencies) / seconds if seconds > 0.0 else 0.0)]
+    if latencies:
+        values = np.array(latencies) * 1000.0
+        lines.append('latency ms: ' + ', '.join('p%s %.3f' % (p, np.percentile(values, p)) for p in PERCENTILES)
+                     + ', max %.3f' % values.max())
+    if stats and op in stats and stats[op]['batches']:
+        lines.append('server batches: %d, mean batch size: %.1f'
+                     % (stats[op]['batches'], stats[op]['requests'] / float(stats[op]['batches'])))
+    if errors:
+        lines.append('first error: %s' % errors[0])
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='load test of local road query service')
+    parser.add_argument('--unix', help='unix socket path of running service')
+    parser.add_argument('--host', default='127.0.0.1', help='tcp host of running service')
+    parser.add_argument('--port', type=int, help='tcp port of running service')
+    parser.add_argument('--synthetic', type=int, default=10000,
+                        help='links of synthetic roads when a local service is started')
+    parser.add_argument('--bbox', help='min_lon,min_lat,max_lon,max_lat of request points for running service')
+    parser.add_argument('--op', default=query_service.OP_NEAREST,
+                        choices=[query_service.OP_NEAREST, query_service.OP_DISTANCE, query_service.OP_ROUTE])
+    parser.add_argument('--link-num', type=int,
+                        help='link count of running service, needed by distance op')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='count of requests')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS, help='concurrent connections')
+    parser.add_argument('--in-flight', type=int, default=DEFAULT_IN_FLIGHT, help='waiting requests of a connection')
+    parser.add_argument('--max-batch', type=int, default=query_service.BATCH_SIZE, help='batch size of local service')
+    parser.add_argument('--max-wait', type=float, default=query_service.BATCH_WAIT,
+                        help='batch wait of local service, second')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    local = None
+    if args.unix or args.port:
+        address = args.unix if args.unix else (args.host, args.port)
+        if not args.bbox:
+            print('--bbox is needed to make request points for a running service')
+            return 2
+        if args.op == query_service.OP_DISTANCE and not args.link_num:
+            print('--link-num is needed to make distance requests for a running service')
+            return 2
+        bbox = [float(value) for value in args.bbox.split(',')]
+        points = make_bbox_points(bbox, min(args.requests, 100000), args.seed)
+        link_num = args.link_num
+    else:
+        local = LocalServer(args.synthetic, args.seed, args.max_batch, args.max_wait)
+        address = local.start()
+        points, _ = synthetic_data.make_gps_points(min(args.requests, 100000), local.lines, args.seed)
+        link_num = len(local.lines)
+
+    requests = make_requests(args.op, points, args.requests, args.seed, link_num)
+    try:
+        latencies, errors, seconds = asyncio.run(run_load(address, requests, max(1, args.connections),
+                                                          max(1, args.in_flight)))
+        stats = asyncio.run(fetch_stats(address))
+    finally:
+        if local is not None:
+            local.stop()
+    print(format_report(args.op, latencies, errors, seconds, stats))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
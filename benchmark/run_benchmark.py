@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/8/9 4:05 PM 
+# @Author : yangyuxin
+# @File : run_benchmark.py
+# 这个代码文件对距离、角度和拓扑构建的常用函数做基准测试，输出吞吐量和内存峰值
+# 结果可以保存为基线文件，之后的运行和基线比较，判断升级后是变快还是变慢
+#
+# python benchmark/run_benchmark.py --scales 1000,10000 --save-baseline baseline.json
+# python benchmark/run_benchmark.py --scales 1000,10000 --baseline baseline.json
+
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+import angle_process
+import distance_process
+import topo_process_framework
+import synthetic_data
+
+
+DEFAULT_SCALES = [1000, 10000, 100000]  # items of every case, up to 10000000
+DEFAULT_REPEAT = 3  # best time of repeats is reported
+SPLIT_LENGTH = 50.0  # part length of split_line_by_length, metre
+BASELINE_VERSION = 1
+
+
+class BenchmarkData(object):
+    """
+    synthetic lines and gps points of one scale, made on first use
+    """
+    def __init__(self, scale, seed=0):
+        self.scale = scale
+        self.seed = seed
+        self._lines = None
+        self._points = None
+        self._point_lines = None
+
+    def get_lines(self):
+        if self._lines is None:
+            self._lines = synthetic_data.make_road_lines(self.scale, self.seed)
+        return self._lines
+
+    def get_points(self):
+        """
+        :return: [gps point], [line of every point]
+        """
+        if self._points is None:
+            lines = self.get_lines()
+            self._points, line_indexes = synthetic_data.make_gps_points(self.scale, lines, self.seed)
+            self._point_lines = [lines[i] for i in line_indexes]
+        return self._points, self._point_lines
+
+
+def prepare_point_distance(data):
+    points, _ = data.get_points()
+    pairs = list(zip(points, points[1:] + points[:1]))
+
+    def run():
+        for point1, point2 in pairs:
+            distance_process.calc_point_distance(point1, point2)
+        return len(pairs)
+    return run
+
+
+def prepare_distance_array(data):
+    points, _ = data.get_points()
+    points = np.array(points, dtype=np.float64)
+    others = np.roll(points, 1, axis=0)
+
+    def run():
+        distance_process.calc_distance_array(points[:, 0], points[:, 1], others[:, 0], others[:, 1])
+        return points.shape[0]
+    return run
+
+
+def prepare_nearest_point(data):
+    points, point_lines = data.get_points()
+    pairs = list(zip(points, point_lines))
+
+    def run():
+        for point, line in pairs:
+            distance_process.calc_nearest_point_on_line(point, line)
+        return len(pairs)
+    return run
+
+
+def prepare_nearest_point_info(data):
+    points, point_lines = data.get_points()
+    pairs = list(zip(points, point_lines))
+
+    def run():
+        for point, line in pairs:
+            distance_process.calc_nearest_point_info(point, line)
+        return len(pairs)
+    return run
+
+
+def prepare_split_line(data):
+    lines = data.get_lines()
+
+    def run():
+        for line in lines:
+            distance_process.split_line_by_length(line, SPLIT_LENGTH)
+        return len(lines)
+    return run
+
+
+def prepare_line_angle(data):
+    lines = data.get_lines()
+
+    def run():
+        for line in lines:
+            angle_process.calc_line_angle(line)
+        return len(lines)
+    return run
+
+
+def prepare_init_topology(data, grid_snap=False):
+    features = synthetic_data.lines_to_features(data.get_lines())
+
+    def run():
+        topo = topo_process_framework.TopoFramework(features)
+        topo.init_topology(grid_snap=grid_snap)
+        return len(topo.link_list)
+    return run
+
+
+# case name: function(BenchmarkData) -> run function, run function returns count of handled items
+CASES = [
+    ('calc_point_distance', prepare_point_distance),
+    ('calc_distance_array', prepare_distance_array),
+    ('calc_nearest_point_on_line', prepare_nearest_point),
+    ('calc_nearest_point_info', prepare_nearest_point_info),
+    ('split_line_by_length', prepare_split_line),
+    ('calc_line_angle', prepare_line_angle),
+    ('init_topology', prepare_init_topology),
+    ('init_topology_grid_snap', lambda data: prepare_init_topology(data, True)),
+]
+
+
+def measure(run, repeat, trace_memory=True):
+    """
+    :param run: run function of case
+    :param repeat: times of timing
+    :param trace_memory: run once more under tracemalloc to get peak memory
+    :return: items, best seconds, peak memory bytes (None if not traced)
+    """
+    best = None
+    items = 0
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = time.perf_counter()
+        items = run()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    peak = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return items, best, peak
+
+
+def run_cases(scales, case_names=None, repeat=DEFAULT_REPEAT, trace_memory=True, seed=0, log=None):
+    """
+    :param scales: items of every case, e.g. [1000, 10000]
+    :param case_names: names in CASES, None runs all cases
+    :param repeat: times of timing
+    :param trace_memory: report peak memory
+    :param seed: random seed of synthetic data
+    :param log: function(result) called after every case
+    :return: [result dict]
+    """
+    results = list()
+    for scale in scales:
+        data = BenchmarkData(scale, seed)
+        for name, prepare in CASES:
+            if case_names and name not in case_names:
+                continue
+            try:
+                items, seconds, peak = measure(prepare(data), repeat, trace_memory)
+            except Exception as e:
+                # a broken case is reported, other cases still run
+                result = {'case': name, 'scale': scale, 'error': '%s: %s' % (type(e).__name__, e)}
+            else:
+                result = {
+                    'case': name,
+                    'scale': scale,
+                    'items': items,
+                    'seconds': seconds,
+                    'throughput': items / seconds if seconds > 0.0 else float('inf'),
+                    'peak_memory': peak,
+                }
+            results.append(result)
+            if log:
+                log(result)
+    return results
+
+
+def get_environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def save_baseline(results, path):
+    with open(path, 'w') as baseline_file:
+        json.dump({'version': BASELINE_VERSION, 'environment': get_environment(), 'results': results},
+                  baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """
+    :param path: baseline json file
+    :return: {(case, scale): result dict}
+    """
+    with open(path, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError("unsupported baseline version: %s" % baseline.get('version'))
+    return dict(((result['case'], result['scale']), result) for result in baseline['results'])
+
+
+def compare_baseline(results, baseline):
+    """
+    :param results: results of run_cases
+    :param baseline: result of load_baseline
+    :return: {(case, scale): throughput of result / throughput of baseline}
+    """
+    ratios = dict()
+    for result in results:
+        key = (result['case'], result['scale'])
+        base = baseline.get(key)
+        if 'error' in result or base is None or not base.get('throughput'):
+            continue
+        ratios[key] = result['throughput'] / base['throughput']
+    return ratios
+
+
+def format_memory(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024.0:
+            return '%.1f%s' % (size, unit)
+        size /= 1024.0
+    return '%.1fGB' % size
+
+
+def format_result(result, ratio=None):
+    if 'error' in result:
+        return '%-28s %10d   failed: %s' % (result['case'], result['scale'], result['error'])
+    line = '%-28s %10d %10.4fs %14.1f/s %10s' % (result['case'], result['scale'], result['seconds'],
+                                                  result['throughput'], format_memory(result['peak_memory']))
+    if ratio is not None:
+        line += '   %.2fx baseline' % ratio
+    return line
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='benchmark of distance, angle and topology functions')
+    parser.add_argument('--scales', default=','.join(str(scale) for scale in DEFAULT_SCALES),
+                        help='comma separated items of every case, e.g. 1000,10000,10000000')
+    parser.add_argument('--cases', default='', help='comma separated case names, empty runs all cases')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='times of timing, best is reported')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of synthetic data')
+    parser.add_argument('--precision', type=int, default=distance_process.PRECISION_HAVERSINE,
+                        help='distance precision tier, distance_process.PRECISION_*')
+    parser.add_argument('--no-memory', action='store_true', help='skip peak memory measuring')
+    parser.add_argument('--baseline', help='baseline json file to compare with')
+    parser.add_argument('--save-baseline', help='write results into this baseline json file')
+    parser.add_argument('--min-ratio', type=float, default=None,
+                        help='exit with 1 if any case is slower than this ratio of baseline, e.g. 0.9')
+    parser.add_argument('--list', action='store_true', help='list case names')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        for name, _ in CASES:
+            print(name)
+        return 0
+
+    scales = [int(float(scale)) for scale in args.scales.split(',') if scale]
+    case_names = [name for name in args.cases.split(',') if name]
+    unknown = set(case_names) - set(name for name, _ in CASES)
+    if unknown:
+        print('unknown cases: %s' % ', '.join(sorted(unknown)))
+        return 2
+    baseline = load_baseline(args.baseline) if args.baseline else dict()
+    distance_process.set_precision(args.precision)
+
+    print('%-28s %10s %11s %16s %10s' % ('case', 'scale', 'time', 'throughput', 'peak'))
+
+    def log(result):
+        key = (result['case'], result['scale'])
+        ratio = compare_baseline([result], baseline).get(key)
+        print(format_result(result, ratio))
+        sys.stdout.flush()
+
+    results = run_cases(scales, case_names, args.repeat, not args.no_memory, args.seed, log)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+
+    if args.min_ratio is not None and baseline:
+        slow = [key for key, ratio in compare_baseline(results, baseline).items() if ratio < args.min_ratio]
+        for case, scale in sorted(slow):
+            print('slower than baseline: %s at %d' % (case, scale))
+        if slow:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/8/9 3:20 PM 
+# @Author : yangyuxin
+# @File : synthetic_data.py
+# 这个代码文件生成基准测试用的合成路网和 GPS 点，同一个随机种子生成的数据完全相同
+
+
+import math
+import ogr
+import numpy as np
+import data_define as df
+import distance_process
+import file_operator
+
+
+CENTER_LON = 116.4  # center of synthetic data
+CENTER_LAT = 39.9
+BLOCK_SIZE = 200.0  # distance between two grid nodes, metre
+MAX_SHAPE_POINTS = 4  # max shape points inside one link
+NODE_JITTER = 0.2  # node offset in block size
+GPS_OFFSET = 30.0  # max distance from gps point to road, metre
+
+
+def calc_grid_shape(link_num):
+    """
+    :param link_num: count of links
+    :return: columns, rows of grid nodes that give about link_num links
+    """
+    # a grid of n * n nodes has 2 * n * (n - 1) links
+    side = int(math.ceil(math.sqrt(link_num / 2.0))) + 1
+    return side, side
+
+
+def make_road_lines(link_num, seed=0):
+    """
+    grid road network with jittered nodes and shape points
+    :param link_num: count of links
+    :param seed: random seed
+    :return: [line], line is [(longitude, latitude)]
+    """
+    rng = np.random.RandomState(seed)
+    cols, rows = calc_grid_shape(link_num)
+    lon_step, lat_step = distance_process.calc_degree_buffer(np.array([CENTER_LAT]), BLOCK_SIZE)
+    lon_step = float(lon_step[0])
+    lat_step = float(lat_step[0])
+    jitter = rng.uniform(-NODE_JITTER, NODE_JITTER, size=(rows, cols, 2))
+    node_lons = CENTER_LON + (np.arange(cols)[None, :] - cols / 2.0 + jitter[:, :, 0]) * lon_step
+    node_lats = CENTER_LAT + (np.arange(rows)[:, None] - rows / 2.0 + jitter[:, :, 1]) * lat_step
+
+    lines = list()
+    for row in range(rows):
+        for col in range(cols):
+            for next_row, next_col in ((row, col + 1), (row + 1, col)):
+                if len(lines) >= link_num:
+                    return lines
+                if next_row >= rows or next_col >= cols:
+                    continue
+                s_point = (float(node_lons[row, col]), float(node_lats[row, col]))
+                e_point = (float(node_lons[next_row, next_col]), float(node_lats[next_row, next_col]))
+                shape_num = rng.randint(0, MAX_SHAPE_POINTS + 1)
+                percents = np.sort(rng.uniform(0.1, 0.9, size=shape_num))
+                offsets = rng.uniform(-0.05, 0.05, size=(shape_num, 2))
+                line = [s_point]
+                for percent, offset in zip(percents.tolist(), offsets.tolist()):
+                    lon = s_point[df.INDEX_LON] + (e_point[df.INDEX_LON] - s_point[df.INDEX_LON]) * percent
+                    lat = s_point[df.INDEX_LAT] + (e_point[df.INDEX_LAT] - s_point[df.INDEX_LAT]) * percent
+                    line.append((lon + offset[0] * lon_step, lat + offset[1] * lat_step))
+                line.append(e_point)
+                lines.append(line)
+    return lines
+
+
+def make_gps_points(point_num, lines, seed=0):
+    """
+    points scattered around road lines
+    :param point_num: count of points
+    :param lines: road lines of make_road_lines
+    :param seed: random seed
+    :return: [(longitude, latitude)], index of line every point is made from
+    """
+    rng = np.random.RandomState(seed + 1)
+    line_indexes = rng.randint(0, len(lines), size=point_num)
+    percents = rng.uniform(0.0, 1.0, size=point_num)
+    lon_buffer, lat_buffer = distance_process.calc_degree_buffer(np.array([CENTER_LAT]), GPS_OFFSET)
+    offsets = rng.uniform(-1.0, 1.0, size=(point_num, 2)) * np.array([lon_buffer[0], lat_buffer[0]])
+    points = list()
+    for line_index, percent, offset in zip(line_indexes.tolist(), percents.tolist(), offsets.tolist()):
+        s_point = lines[line_index][0]
+        e_point = lines[line_index][-1]
+        lon = s_point[df.INDEX_LON] + (e_point[df.INDEX_LON] - s_point[df.INDEX_LON]) * percent + offset[0]
+        lat = s_point[df.INDEX_LAT] + (e_point[df.INDEX_LAT] - s_point[df.INDEX_LAT]) * percent + offset[1]
+        points.append((lon, lat))
+    return points, line_indexes.tolist()
+
+
+def lines_to_features(lines):
+    """
+    :param lines: [line]
+    :return: in memory road features [ogr.Feature], can be used as road layer of TopoFramework
+    """
+    features = list()
+    for line in lines:
+        geometry = ogr.Geometry(ogr.wkbLineString)
+        for point in line:
+            geometry.AddPoint(point[df.INDEX_LON], point[df.INDEX_LAT])
+        features.append(file_operator.create_feature({}, geometry))
+    return features
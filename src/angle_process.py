@@ -7,8 +7,9 @@
 
 
 import math
-import copy
+import numpy as np
 import data_define as df
+import instrument
 
 
 def eqaul(a, b):
@@ -55,12 +56,9 @@ def calc_line_angle(line):
         if delta_lon > 0.0:
             return degree(math.atan(delta_lon / delta_lat))
         else:
-            return 360.0 - degree(math.atan(delta_lon / delta_lat))
+            return 360.0 + degree(math.atan(delta_lon / delta_lat))
     else:
-        if delta_lon > 0.0:
-            return 180.0 - degree(math.atan(delta_lon / delta_lat))
-        else:
-            return 180.0 + degree(math.atan(delta_lon / delta_lat))
+        return 180.0 + degree(math.atan(delta_lon / delta_lat))
 
     return 0.0
 
@@ -74,10 +72,40 @@ def calc_line2line_angle(line1, line2):
     """
     angle1 = calc_line_angle(line1)
     angle2 = calc_line_angle(line2)
-    if not (angle1 and angle2):
+    if angle1 is None or angle2 is None:
         return None
 
     angle = angle2 - angle1
     if angle < 0.0:
         angle += 360.0
     return angle
+
+
+def calc_angle_array(s_lons, s_lats, e_lons, e_lats):
+    """
+    vectorized version of calc_line_angle with start points and end points
+    :param s_lons: longitudes of start points
+    :param s_lats: latitudes of start points
+    :param e_lons: longitudes of end points
+    :param e_lats: latitudes of end points
+    :return: angle from north, clockwise, in [0, 360). the unit is degree. 0 if start and end are same
+    """
+    delta_lon = np.asarray(e_lons, dtype=np.float64) - np.asarray(s_lons, dtype=np.float64)
+    delta_lat = np.asarray(e_lats, dtype=np.float64) - np.asarray(s_lats, dtype=np.float64)
+    angles = np.degrees(np.arctan2(delta_lon, delta_lat)) % 360.0
+    same = (np.abs(delta_lon) < 0.000000001) & (np.abs(delta_lat) < 0.000000001)
+    return np.where(same, 0.0, angles)
+
+
+def calc_turn_angle_array(angles1, angles2):
+    """
+    vectorized version of calc_line2line_angle with line angles
+    :param angles1: angles of first lines
+    :param angles2: angles of second lines
+    :return: angle from first line to second line, clockwise, in [0, 360). the unit is degree
+    """
+    return (np.asarray(angles2, dtype=np.float64) - np.asarray(angles1, dtype=np.float64)) % 360.0
+
+
+# counted functions are wrapped when GEO_INSTRUMENT is set, even if instrument is not imported by caller
+instrument.register(__name__)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/7/19 10:50 AM 
+# @Author : yangyuxin
+# @File : batch_process.py
+# 这个代码文件用多进程对整个图层的要素做同一种几何计算
+# 要素按块切分，以坐标数组的形式传给子进程，结果按原顺序合并
+
+
+import multiprocessing
+import numpy as np
+import data_define as df
+import distance_process
+import angle_process
+import file_operator
+import instrument
+import simplify_process
+
+
+CHUNK_SIZE = 20000  # features of one chunk
+
+OPERATION_LINE = 'line'  # operation is func(line, *args)
+OPERATION_POINT_LINE = 'point_line'  # operation is func(point, line, *args)
+
+# operation name: (module name, function name, operation kind)
+OPERATIONS = {
+    'calc_line_length': ('distance_process', 'calc_line_length', OPERATION_LINE),
+    'split_line_by_length': ('distance_process', 'split_line_by_length', OPERATION_LINE),
+    'get_start_part_by_length': ('distance_process', 'get_start_part_by_length', OPERATION_LINE),
+    'get_end_part_by_length': ('distance_process', 'get_end_part_by_length', OPERATION_LINE),
+    'get_start_part_by_percent': ('distance_process', 'get_start_part_by_percent', OPERATION_LINE),
+    'get_end_part_by_percent': ('distance_process', 'get_end_part_by_percent', OPERATION_LINE),
+    'calc_nearest_point_on_line': ('distance_process', 'calc_nearest_point_on_line', OPERATION_POINT_LINE),
+    'calc_point_to_line_distance': ('distance_process', 'calc_point_to_line_distance', OPERATION_POINT_LINE),
+    'calc_nearest_point_info': ('distance_process', 'calc_nearest_point_info', OPERATION_POINT_LINE),
+    'calc_line_angle': ('angle_process', 'calc_line_angle', OPERATION_LINE),
+    'simplify_line': ('simplify_process', 'simplify_line', OPERATION_LINE),
+}
+
+MODULES = {
+    'distance_process': distance_process,
+    'angle_process': angle_process,
+    'simplify_process': simplify_process,
+}
+
+
+def get_operation(name):
+    """
+    :param name: operation name in OPERATIONS
+    :return: function, operation kind
+    """
+    if name not in OPERATIONS:
+        raise ValueError("unknown operation: %s" % name)
+    module_name, func_name, kind = OPERATIONS[name]
+    return getattr(MODULES[module_name], func_name), kind
+
+
+def split_chunks(coords, offsets, points=None, chunk_size=CHUNK_SIZE):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param points: one point of every line, numpy array of shape (m, 2)
+    :param chunk_size: lines of one chunk
+    :return: generator of (coords, offsets, points) of every chunk, offsets start from 0
+    """
+    line_num = offsets.shape[0] - 1
+    for start in range(0, line_num, chunk_size):
+        end = min(start + chunk_size, line_num)
+        chunk_offsets = offsets[start:end + 1]
+        chunk_coords = coords[chunk_offsets[0]:chunk_offsets[-1]]
+        chunk_points = points[start:end] if points is not None else None
+        yield chunk_coords, chunk_offsets - chunk_offsets[0], chunk_points
+
+
+def init_worker(precision, instrumented):
+    """
+    worker processes start with the precision tier and instrumentation of the parent process,
+    they are module globals and are lost when workers are spawned
+    :param precision: distance_process precision tier
+    :param instrumented: True if instrumentation is enabled
+    """
+    distance_process.set_precision(precision)
+    if instrumented:
+        instrument.enable()
+
+
+def run_chunk(task):
+    """
+    :param task: (operation name, args, coords, offsets, points)
+    :return: results of every line in chunk
+    """
+    name, args, coords, offsets, points = task
+    if name == 'calc_line_length' and not args:
+        return distance_process.calc_lines_length(coords, offsets).tolist()
+
+    func, kind = get_operation(name)
+    coord_list = [(lon, lat) for lon, lat in coords.tolist()]
+    offset_list = offsets.tolist()
+    results = list()
+    for i in range(len(offset_list) - 1):
+        line = coord_list[offset_list[i]:offset_list[i + 1]]
+        if kind == OPERATION_POINT_LINE:
+            point = (float(points[i, df.INDEX_LON]), float(points[i, df.INDEX_LAT]))
+            results.append(func(point, line, *args))
+        else:
+            results.append(func(line, *args))
+    return results
+
+
+def run_line_operation(coords, offsets, operation, args=(), points=None, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param operation: operation name in OPERATIONS
+    :param args: extra arguments of operation, same for every line
+    :param points: one point of every line, needed by point line operation
+    :param processes: worker process count, None uses all cpus, 1 runs in current process
+    :param chunk_size: lines of one chunk
+    :return: [result] of every line, in line order
+    """
+    _, kind = get_operation(operation)
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if kind == OPERATION_POINT_LINE:
+        if points is None:
+            raise ValueError("operation %s needs one point of every line" % operation)
+        points = distance_process.to_point_array(points)
+
+    args = tuple(args)
+    tasks = ((operation, args, chunk_coords, chunk_offsets, chunk_points)
+             for chunk_coords, chunk_offsets, chunk_points in split_chunks(coords, offsets, points, chunk_size))
+    results = list()
+    if processes == 1:
+        for task in tasks:
+            results.extend(run_chunk(task))
+        return results
+
+    pool = multiprocessing.Pool(processes, init_worker, (distance_process.get_precision(), instrument.is_enabled()))
+    try:
+        for chunk_results in pool.imap(run_chunk, tasks):
+            results.extend(chunk_results)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def run_layer_operation(layer, operation, args=(), points=None, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    :param layer: line layer, e.g. FileReader.get_lyr_file()
+    :param operation: operation name in OPERATIONS
+    :param args: extra arguments of operation, same for every feature
+    :param points: one point of every feature, needed by point line operation
+    :param processes: worker process count, None uses all cpus, 1 runs in current process
+    :param chunk_size: features of one chunk
+    :return: fids of features, [result] of every feature, in layer order
+    """
+    columns = file_operator.read_layer_columns(layer, list())
+    results = run_line_operation(columns.coords, columns.offsets, operation, args, points, processes, chunk_size)
+    return columns.fids.tolist(), results
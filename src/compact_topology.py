@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/6/28 9:05 PM 
+# @Author : yangyuxin
+# @File : compact_topology.py
+# 这个代码是紧凑的拓扑表示，节点和道路都用整数编号，邻接关系用 CSR 数组保存
+# 原始要素只在需要时按 FID 读取
+
+
+import numpy as np
+import data_define as df
+import distance_process
+import endpoint_snap
+import file_operator
+import spatial_index
+import topo_process_framework
+
+
+NO_NODE = -1  # node id of unmatched link endpoint
+
+
+def read_line_buffer(road_layer):
+    """
+    :param road_layer: road layer or iterable of ogr.Feature
+    :return: coords numpy array of shape (n, 2), offsets, fids of features
+    """
+    coord_list = list()
+    offsets = [0]
+    fids = list()
+    for feature in road_layer:
+        geometry = feature.GetGeometryRef()
+        points = geometry.GetPoints() if geometry is not None else None
+        points = points if points else list()
+        coord_list.extend((point[df.INDEX_LON], point[df.INDEX_LAT]) for point in points)
+        offsets.append(len(coord_list))
+        fids.append(feature.GetFID())
+    coords = np.array(coord_list, dtype=np.float64).reshape(-1, 2)
+    return coords, np.array(offsets, dtype=np.int64), np.array(fids, dtype=np.int64)
+
+
+class CompactTopology(object):
+    """
+    topology stored in numpy arrays.
+    node and link are identified by integer id, the index in arrays.
+    adjacency of node i is node_links[node_link_offsets[i]:node_link_offsets[i + 1]].
+    """
+    def __init__(self, link_snodes, link_enodes, node_points, link_lengths,
+                 link_fids=None, coords=None, coord_offsets=None, layer=None, features=None, adjacency=None):
+        """
+        :param link_snodes: start node id of every link, NO_NODE if unmatched
+        :param link_enodes: end node id of every link, NO_NODE if unmatched
+        :param node_points: node points, numpy array of shape (n, 2)
+        :param link_lengths: length of every link. the unit is metre
+        :param link_fids: feature id of every link in layer
+        :param coords: points of all links, numpy array of shape (n, 2)
+        :param coord_offsets: link i is coords[coord_offsets[i]:coord_offsets[i + 1]]
+        :param layer: road layer, link feature is read from it by fid when asked
+        :param features: link features, used when layer is None
+        :param adjacency: (node_link_offsets, node_links, node_neighbours) built before, None builds them
+        """
+        self.link_snodes = np.asarray(link_snodes, dtype=np.int64)
+        self.link_enodes = np.asarray(link_enodes, dtype=np.int64)
+        self.node_points = np.asarray(node_points, dtype=np.float64).reshape(-1, 2)
+        self.link_lengths = np.asarray(link_lengths, dtype=np.float64)
+        self.link_fids = np.asarray(link_fids, dtype=np.int64) if link_fids is not None else None
+        self.coords = coords
+        self.coord_offsets = coord_offsets
+        self.layer = layer
+        self.features = features
+        if adjacency is None:
+            self._build_adjacency()
+        else:
+            self.node_link_offsets, self.node_links, self.node_neighbours = adjacency
+
+    def _build_adjacency(self):
+        link_ids = np.arange(self.get_link_num(), dtype=np.int64)
+        ends = np.concatenate((self.link_snodes, self.link_enodes))
+        links = np.concatenate((link_ids, link_ids))
+        others = np.concatenate((self.link_enodes, self.link_snodes))
+        valid = ends != NO_NODE
+        ends = ends[valid]
+        order = np.argsort(ends, kind='stable')
+        counts = np.bincount(ends, minlength=self.get_node_num())
+        self.node_link_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.node_links = links[valid][order]
+        self.node_neighbours = others[valid][order]
+
+    @classmethod
+    def from_lines(cls, coords, offsets, snap_tolerance=df.SAME_POINT_DISTANCE,
+                   link_fids=None, layer=None, features=None):
+        """
+        build topology from line buffer, link endpoints are snapped into nodes
+        :param coords: points of all lines, numpy array of shape (n, 2)
+        :param offsets: line i is coords[offsets[i]:offsets[i + 1]], every line has at least one point
+        :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+        :return: CompactTopology
+        """
+        coords = distance_process.to_point_array(coords)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        s_points = coords[offsets[:-1]]
+        e_points = coords[offsets[1:] - 1]
+        endpoints = np.empty((2 * s_points.shape[0], 2), dtype=np.float64)
+        endpoints[0::2] = s_points
+        endpoints[1::2] = e_points
+        groups, group_firsts = endpoint_snap.snap_points(endpoints[:, 0], endpoints[:, 1], snap_tolerance)
+        link_lengths = distance_process.calc_lines_length(coords, offsets)
+        return cls(groups[0::2], groups[1::2], endpoints[group_firsts], link_lengths,
+                   link_fids, coords, offsets, layer, features)
+
+    @classmethod
+    def from_layer(cls, road_layer, snap_tolerance=df.SAME_POINT_DISTANCE):
+        """
+        build topology from road layer without Node and Link objects
+        :param road_layer: road layer, kept for lazy feature access
+        :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+        :return: CompactTopology
+        """
+        columns = file_operator.read_layer_columns(road_layer, list())
+        coords, offsets, fids = columns.coords, columns.offsets, columns.fids
+        # features without points can not be linked
+        valid = offsets[1:] > offsets[:-1]
+        if not np.all(valid):
+            lengths = (offsets[1:] - offsets[:-1])[valid]
+            offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            fids = fids[valid]
+        return cls.from_lines(coords, offsets, snap_tolerance, fids, road_layer)
+
+    @classmethod
+    def from_framework(cls, topo, layer=None):
+        """
+        convert TopoFramework or TopoFrameWork2 output
+        :param topo: topology framework after init_topology
+        :param layer: road layer for lazy feature access. None keeps link features of topo
+        :return: CompactTopology
+        """
+        node_ids = dict()
+        node_points = list()
+        for node in topo.get_nodes():
+            node_ids[id(node)] = len(node_points)
+            point = node.feature.GetGeometryRef().GetPoint(0)
+            node_points.append((point[df.INDEX_LON], point[df.INDEX_LAT]))
+
+        link_snodes = list()
+        link_enodes = list()
+        features = list()
+        for link in topo.get_links():
+            link_snodes.append(node_ids[id(link.snode)] if link.snode else NO_NODE)
+            link_enodes.append(node_ids[id(link.enode)] if link.enode else NO_NODE)
+            features.append(link.feature)
+        coords, offsets, fids = read_line_buffer(features)
+        link_lengths = distance_process.calc_lines_length(coords, offsets)
+        return cls(link_snodes, link_enodes, np.array(node_points, dtype=np.float64).reshape(-1, 2),
+                   link_lengths, fids, coords, offsets, layer, None if layer is not None else features)
+
+    def get_link_num(self):
+        return self.link_snodes.shape[0]
+
+    def get_node_num(self):
+        return self.node_points.shape[0]
+
+    def get_link_boxes(self):
+        """
+        :return: box of every link [x_min, y_min, x_max, y_max], numpy array of shape (n, 4)
+        """
+        if self.coords is None:
+            boxes = np.zeros((self.get_link_num(), 4), dtype=np.float64)
+            for i in range(self.get_link_num()):
+                boxes[i] = topo_process_framework.get_feature_box(self.get_link_feature(i))
+            return boxes
+        return spatial_index.calc_line_boxes(self.coords, self.coord_offsets)
+
+    def get_node_degrees(self):
+        """
+        :return: count of connected links of every node, numpy array
+        """
+        return np.diff(self.node_link_offsets)
+
+    def get_node_links(self, node_id):
+        """
+        :param node_id: node id
+        :return: connected link ids of node, numpy array
+        """
+        return self.node_links[self.node_link_offsets[node_id]:self.node_link_offsets[node_id + 1]]
+
+    def get_node_neighbours(self, node_id):
+        """
+        :param node_id: node id
+        :return: node ids at other end of connected links, numpy array
+        """
+        return self.node_neighbours[self.node_link_offsets[node_id]:self.node_link_offsets[node_id + 1]]
+
+    def get_link_points(self, link_id):
+        """
+        :param link_id: link id
+        :return: link line [points]
+        """
+        if self.coords is None:
+            feature = self.get_link_feature(link_id)
+            return feature.GetGeometryRef().GetPoints() if feature else None
+        part = self.coords[self.coord_offsets[link_id]:self.coord_offsets[link_id + 1]]
+        return [(lon, lat) for lon, lat in part.tolist()]
+
+    def get_link_feature(self, link_id):
+        """
+        :param link_id: link id
+        :return: link feature, ogr.Feature. None if feature source is not kept
+        """
+        if self.layer is not None and self.link_fids is not None:
+            return self.layer.GetFeature(int(self.link_fids[link_id]))
+        if self.features is not None:
+            return self.features[link_id]
+        return None
+
+    def get_node_feature(self, node_id):
+        """
+        :param node_id: node id
+        :return: node feature created from node point, ogr.Feature
+        """
+        point = self.node_points[node_id].tolist()
+        return file_operator.create_feature({}, topo_process_framework.point_to_geometry(point))
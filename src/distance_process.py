@@ -8,10 +8,31 @@
 
 import math
 import copy
+import contextlib
+import numpy as np
 import data_define as df
+import instrument
 
 
 EARTH_RADIUS = 6378137  # metre
+DISTANCE_CHUNK_SIZE = 1024  # rows of distance matrix computed at one time
+NEAREST_CHUNK_ELEMENTS = 1 << 20  # point-segment pairs computed at one time
+
+# precision tiers of distance
+# haversine: exact spherical distance
+# equirectangular: plane with cos of mean latitude of two points. error is below 1 mm within 1 km,
+#     below 1 cm within 10 km under latitude 70. it grows with square of distance, do not use it over 50 km
+# local planar: plane with cos of center latitude of the LOCAL_BAND_SIZE latitude band holding the mean latitude,
+#     cos is computed once for a band. error of east west part is below tan(latitude) * LOCAL_BAND_SIZE / 2 in radian,
+#     0.07% at latitude 40
+# the tier is global, callers needing exact distance pass PRECISION_HAVERSINE, see also precision_scope
+PRECISION_HAVERSINE = 0
+PRECISION_EQUIRECTANGULAR = 1
+PRECISION_LOCAL_PLANAR = 2
+LOCAL_BAND_SIZE = 0.1  # degree of latitude band sharing one projection in local planar tier
+
+current_precision = PRECISION_HAVERSINE  # tier used when precision argument is None, see set_precision
+band_cos_cache = dict()  # band row: cos of band center latitude
 
 
 def rad(d):
@@ -30,6 +51,74 @@ def degree(r):
     return r * 180.0 / math.pi
 
 
+def set_precision(precision):
+    """
+    :param precision: PRECISION_HAVERSINE, PRECISION_EQUIRECTANGULAR or PRECISION_LOCAL_PLANAR.
+                      distance, nearest point, length and split functions use it by default
+    :return: last precision
+    """
+    global current_precision
+    if precision not in (PRECISION_HAVERSINE, PRECISION_EQUIRECTANGULAR, PRECISION_LOCAL_PLANAR):
+        raise ValueError("unknown precision: %s" % precision)
+    last_precision = current_precision
+    current_precision = precision
+    return last_precision
+
+
+def get_precision():
+    return current_precision
+
+
+@contextlib.contextmanager
+def precision_scope(precision):
+    """
+    with distance_process.precision_scope(distance_process.PRECISION_EQUIRECTANGULAR):
+        ...
+    the tier is global, other threads see it inside the block too
+    :param precision: precision used inside the block, last precision is restored at the end
+    """
+    last_precision = set_precision(precision)
+    try:
+        yield
+    finally:
+        set_precision(last_precision)
+
+
+def calc_band_cos(lat):
+    """
+    :param lat: latitude
+    :return: cos of center latitude of local planar latitude band holding lat
+    """
+    row = int(math.floor(lat / LOCAL_BAND_SIZE))
+    cos_lat = band_cos_cache.get(row)
+    if cos_lat is None:
+        cos_lat = math.cos(rad((row + 0.5) * LOCAL_BAND_SIZE))
+        band_cos_cache[row] = cos_lat
+    return cos_lat
+
+
+def calc_projection_cos(lat1, lat2, precision):
+    """
+    :param lat1: latitude of first point
+    :param lat2: latitude of second point
+    :param precision: PRECISION_EQUIRECTANGULAR or PRECISION_LOCAL_PLANAR
+    :return: longitude scale of plane projection
+    """
+    if precision == PRECISION_LOCAL_PLANAR:
+        return calc_band_cos((lat1 + lat2) / 2.0)
+    return math.cos(rad((lat1 + lat2) / 2.0))
+
+
+def calc_projection_cos_array(lats1, lats2, precision):
+    """
+    vectorized version of calc_projection_cos
+    """
+    mid_lats = (np.asarray(lats1, dtype=np.float64) + np.asarray(lats2, dtype=np.float64)) / 2.0
+    if precision == PRECISION_LOCAL_PLANAR:
+        mid_lats = (np.floor(mid_lats / LOCAL_BAND_SIZE) + 0.5) * LOCAL_BAND_SIZE
+    return np.cos(mid_lats * math.pi / 180.0)
+
+
 def lonlat_to_xyz(lon, lat):
     """
     :param lon: longitude
@@ -49,16 +138,15 @@ def xyz_to_lonlat(x, y, z):
     :param x: x in three dimension space
     :param y: y in three dimension space
     :param z: z in three dimension space
-    :return: longitude, latitude
+    :return: longitude, latitude in degree
     """
-    rad_lat = math.asin(z)
-    if y == 0.0 or math.cos(rad_lat) == 0.0:
-        rad_lon = 0.0
-    else:
-        rad_lon = math.acos(z / math.cos(rad_lat))
-        if math.asin(y / math.cos(rad_lat)) < 0.0:
-            rad_lon = - rad_lon
-    return rad_lon, rad_lat
+    norm = math.sqrt(x * x + y * y + z * z)
+    if norm == 0.0:
+        return 0.0, 0.0
+    # z is clamped, rounding of a unit vector may make it a little larger than 1
+    rad_lat = math.asin(max(-1.0, min(1.0, z / norm)))
+    rad_lon = math.atan2(y, x)
+    return degree(rad_lon), degree(rad_lat)
 
 
 def calc_cross_product(vector1, vector2):
@@ -117,17 +205,23 @@ def is_same_point(point1, point2):
     """
     :param point1: first point (longitude, latitude)
     :param point2: second point (longitude, latitude)
-    :return:
+    :return: True if distance is not larger than SAME_POINT_DISTANCE, always haversine
     """
-    return calc_point_distance(point1, point2) <= df.SAME_POINT_DISTANCE
+    return calc_point_distance(point1, point2, PRECISION_HAVERSINE) <= df.SAME_POINT_DISTANCE
 
 
-def calc_point_distance(point1, point2):
+def calc_point_distance(point1, point2, precision=None):
     """
     :param point1: first point
     :param point2: second point
+    :param precision: PRECISION_*, None uses current precision
     :return: distance of two point. the unit is metre
     """
+    if precision is None:
+        precision = current_precision
+    if precision != PRECISION_HAVERSINE:
+        return calc_plane_distance(point1, point2, precision)
+
     radLat1 = rad(point1[df.INDEX_LAT])
     radlng1 = rad(point1[df.INDEX_LON])
     radLat2 = rad(point2[df.INDEX_LAT])
@@ -140,6 +234,333 @@ def calc_point_distance(point1, point2):
     return s
 
 
+def calc_plane_distance(point1, point2, precision=PRECISION_EQUIRECTANGULAR):
+    """
+    :param point1: first point
+    :param point2: second point
+    :param precision: PRECISION_EQUIRECTANGULAR or PRECISION_LOCAL_PLANAR
+    :return: distance of two point on projection plane. the unit is metre
+    """
+    lat1 = point1[df.INDEX_LAT]
+    lat2 = point2[df.INDEX_LAT]
+    mid_lat = (lat1 + lat2) / 2.0
+    if precision == PRECISION_LOCAL_PLANAR:
+        cos_lat = band_cos_cache.get(math.floor(mid_lat / LOCAL_BAND_SIZE))
+        if cos_lat is None:
+            cos_lat = calc_band_cos(mid_lat)
+    else:
+        cos_lat = math.cos(mid_lat * math.pi / 180.0)
+    x = (point2[df.INDEX_LON] - point1[df.INDEX_LON]) * cos_lat
+    y = lat2 - lat1
+    s = math.sqrt(x * x + y * y) * (EARTH_RADIUS * math.pi / 180.0)
+    s = (s * 10000 + 0.5) / 10000
+    return s
+
+
+def to_point_array(points):
+    """
+    :param points: points [(longitude, latitude)] or numpy array
+    :return: numpy array of shape (n, 2), columns are longitude and latitude
+    """
+    array = np.asarray(points, dtype=np.float64)
+    if array.size == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    if array.ndim == 1:
+        array = array.reshape(1, -1)
+    return array[:, [df.INDEX_LON, df.INDEX_LAT]]
+
+
+def calc_distance_array(lons1, lats1, lons2, lats2, precision=None):
+    """
+    vectorized version of calc_point_distance, arrays are broadcast together
+    :param lons1: longitudes of first points
+    :param lats1: latitudes of first points
+    :param lons2: longitudes of second points
+    :param lats2: latitudes of second points
+    :param precision: PRECISION_*, None uses current precision
+    :return: distances array. the unit is metre
+    """
+    if precision is None:
+        precision = current_precision
+    if precision != PRECISION_HAVERSINE:
+        cos_lats = calc_projection_cos_array(lats1, lats2, precision)
+        x = (np.asarray(lons2, dtype=np.float64) - np.asarray(lons1, dtype=np.float64)) * cos_lats
+        y = np.asarray(lats2, dtype=np.float64) - np.asarray(lats1, dtype=np.float64)
+        s = np.sqrt(x * x + y * y) * (EARTH_RADIUS * math.pi / 180.0)
+        return (s * 10000 + 0.5) / 10000
+
+    radLat1 = np.asarray(lats1, dtype=np.float64) * math.pi / 180.0
+    radlng1 = np.asarray(lons1, dtype=np.float64) * math.pi / 180.0
+    radLat2 = np.asarray(lats2, dtype=np.float64) * math.pi / 180.0
+    radlng2 = np.asarray(lons2, dtype=np.float64) * math.pi / 180.0
+    a = radLat1 - radLat2
+    b = radlng1 - radlng2
+    h = np.sin(a / 2) ** 2 + np.cos(radLat1) * np.cos(radLat2) * np.sin(b / 2) ** 2
+    s = 2 * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+    s = s * EARTH_RADIUS
+    s = (s * 10000 + 0.5) / 10000
+    return s
+
+
+def calc_degree_buffer(lats, distance):
+    """
+    :param lats: latitudes of points
+    :param distance: buffer distance. the unit is metre
+    :return: longitude buffers, latitude buffers in degree, every box of them covers distance
+    """
+    lat_buffer = distance / (EARTH_RADIUS * math.pi / 180.0)
+    cos_lats = np.cos(np.minimum(np.abs(np.asarray(lats, dtype=np.float64)) + lat_buffer, 90.0) * math.pi / 180.0)
+    lon_buffer = np.minimum(lat_buffer / np.maximum(cos_lats, df.ZERO_THRESHOLD), 180.0)
+    return lon_buffer, np.full_like(lon_buffer, lat_buffer)
+
+
+def calc_buffer_boxes(points, distances):
+    """
+    :param points: points, numpy array of shape (n, 2)
+    :param distances: buffer distance, a number or one for every point. the unit is metre
+    :return: box of every point covering distance, numpy array of shape (n, 4)
+    """
+    lon_buffers, lat_buffers = calc_degree_buffer(points[:, df.INDEX_LAT], distances)
+    return np.stack((points[:, df.INDEX_LON] - lon_buffers, points[:, df.INDEX_LAT] - lat_buffers,
+                     points[:, df.INDEX_LON] + lon_buffers, points[:, df.INDEX_LAT] + lat_buffers), axis=1)
+
+
+def calc_points_distance(points1, points2, precision=None):
+    """
+    :param points1: first points [(longitude, latitude)]
+    :param points2: second points [(longitude, latitude)], same size as points1
+    :param precision: PRECISION_*, None uses current precision
+    :return: distance of every point pair, numpy array. the unit is metre
+    """
+    array1 = to_point_array(points1)
+    array2 = to_point_array(points2)
+    if array1.shape[0] != array2.shape[0]:
+        raise ValueError("points size mismatch: %d != %d" % (array1.shape[0], array2.shape[0]))
+    return calc_distance_array(array1[:, 0], array1[:, 1], array2[:, 0], array2[:, 1], precision)
+
+
+def calc_point_to_points_distance(point, points, precision=None):
+    """
+    :param point: point (longitude, latitude)
+    :param points: points [(longitude, latitude)]
+    :param precision: PRECISION_*, None uses current precision
+    :return: distance from point to every point, numpy array. the unit is metre
+    """
+    array = to_point_array(points)
+    return calc_distance_array(point[df.INDEX_LON], point[df.INDEX_LAT], array[:, 0], array[:, 1], precision)
+
+
+def calc_distance_matrix(points1, points2, chunk_size=DISTANCE_CHUNK_SIZE, precision=None):
+    """
+    :param points1: row points [(longitude, latitude)]
+    :param points2: column points [(longitude, latitude)]
+    :param chunk_size: rows computed at one time, limits temporary memory
+    :param precision: PRECISION_*, None uses current precision
+    :return: distance matrix of shape (len(points1), len(points2)). the unit is metre
+    """
+    array1 = to_point_array(points1)
+    array2 = to_point_array(points2)
+    matrix = np.empty((array1.shape[0], array2.shape[0]), dtype=np.float64)
+    chunk_size = max(1, int(chunk_size))
+    for start in range(0, array1.shape[0], chunk_size):
+        chunk = array1[start:start + chunk_size]
+        matrix[start:start + chunk.shape[0]] = calc_distance_array(chunk[:, 0:1], chunk[:, 1:2],
+                                                                   array2[:, 0], array2[:, 1], precision)
+    return matrix
+
+
+def lonlat_to_xyz_array(lons, lats):
+    """
+    vectorized version of lonlat_to_xyz
+    :param lons: longitudes
+    :param lats: latitudes
+    :return: numpy array of shape (n, 3), x, y, z in three dimension space
+    """
+    rad_lon = np.asarray(lons, dtype=np.float64) * math.pi / 180.0
+    rad_lat = np.asarray(lats, dtype=np.float64) * math.pi / 180.0
+    cos_lat = np.cos(rad_lat)
+    return np.stack((cos_lat * np.cos(rad_lon), cos_lat * np.sin(rad_lon), np.sin(rad_lat)), axis=-1)
+
+
+def xyz_array_to_lonlat(xyz):
+    """
+    :param xyz: numpy array of shape (n, 3) in three dimension space
+    :return: numpy array of shape (n, 2), longitude and latitude in degree
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    norm = np.sqrt(np.sum(xyz * xyz, axis=-1))
+    norm = np.where(norm > 0.0, norm, 1.0)
+    lon = np.arctan2(xyz[..., 1], xyz[..., 0]) * 180.0 / math.pi
+    lat = np.arcsin(np.clip(xyz[..., 2] / norm, -1.0, 1.0)) * 180.0 / math.pi
+    return np.stack((lon, lat), axis=-1)
+
+
+def calc_vector_angles(vectors1, vectors2):
+    """
+    :param vectors1: unit vectors, numpy array of shape (n, 3)
+    :param vectors2: unit vectors, numpy array of shape (n, 3)
+    :return: angle between every vector pair in radian, accurate for small angle
+    """
+    cross = np.cross(vectors1, vectors2)
+    return np.arctan2(np.sqrt(np.sum(cross * cross, axis=-1)), np.sum(vectors1 * vectors2, axis=-1))
+
+
+def calc_segment_distances(p_xyz, s_xyz, e_xyz):
+    """
+    spherical distance from every point to its great circle segment
+    :param p_xyz: points, unit vectors of shape (n, 3)
+    :param s_xyz: segment start points, unit vectors of shape (n, 3)
+    :param e_xyz: segment end points, unit vectors of shape (n, 3)
+    :return: distances array. the unit is metre
+    """
+    normal = np.cross(s_xyz, e_xyz)
+    normal_length = np.sqrt(np.sum(normal * normal, axis=-1))
+    valid = normal_length > df.SAME_POINT_DISTANCE / EARTH_RADIUS
+    unit_normal = normal / np.where(valid, normal_length, 1.0)[:, None]
+    # point projects inside segment when it is on the inner side of both segment ends
+    inside = (valid & (np.sum(p_xyz * np.cross(unit_normal, s_xyz), axis=-1) >= 0.0)
+              & (np.sum(p_xyz * np.cross(e_xyz, unit_normal), axis=-1) >= 0.0))
+    cross_angles = np.arcsin(np.minimum(np.abs(np.sum(p_xyz * unit_normal, axis=-1)), 1.0))
+    end_angles = np.minimum(calc_vector_angles(p_xyz, s_xyz), calc_vector_angles(p_xyz, e_xyz))
+    return np.where(inside, cross_angles, end_angles) * EARTH_RADIUS
+
+
+def calc_nearest_points_on_line(points, line, chunk_size=None, precision=None):
+    """
+    vectorized nearest point on line for many points, all segments are handled at once
+    :param points: points [(longitude, latitude)]
+    :param line: line [points]
+    :param chunk_size: points computed at one time, default keeps NEAREST_CHUNK_ELEMENTS pairs
+    :param precision: PRECISION_*, None uses current precision
+    :return: nearest points array (n, 2), segment index array (n,), distance array (n,). None if line is empty
+    """
+    if precision is None:
+        precision = current_precision
+    array = to_point_array(points)
+    line_array = to_point_array(line)
+    point_num = array.shape[0]
+    if line_array.shape[0] == 0:
+        return None
+    if line_array.shape[0] == 1:
+        nearest = np.repeat(line_array, point_num, axis=0)
+        indexes = np.zeros(point_num, dtype=np.int64)
+        distances = calc_distance_array(array[:, 0], array[:, 1], nearest[:, 0], nearest[:, 1], precision)
+        return nearest, indexes, distances
+
+    segment_num = line_array.shape[0] - 1
+    if chunk_size is None:
+        chunk_size = max(1, NEAREST_CHUNK_ELEMENTS // segment_num)
+    if precision != PRECISION_HAVERSINE:
+        nearest, indexes = calc_plane_nearest_points(array, line_array, chunk_size, precision)
+        distances = calc_distance_array(array[:, 0], array[:, 1], nearest[:, 0], nearest[:, 1], precision)
+        return nearest, indexes, distances
+
+    s_xyz = lonlat_to_xyz_array(line_array[:-1, 0], line_array[:-1, 1])
+    e_xyz = lonlat_to_xyz_array(line_array[1:, 0], line_array[1:, 1])
+    normal = np.cross(s_xyz, e_xyz)
+    normal_length = np.sqrt(np.sum(normal * normal, axis=1))
+    # segment shorter than same point distance is handled as its start point
+    valid = normal_length > df.SAME_POINT_DISTANCE / EARTH_RADIUS
+    unit_normal = normal / np.where(valid, normal_length, 1.0)[:, None]
+    unit_normal[~valid] = 0.0
+    s_side = np.cross(unit_normal, s_xyz)
+    e_side = np.cross(e_xyz, unit_normal)
+
+    nearest = np.empty((point_num, 2), dtype=np.float64)
+    indexes = np.empty(point_num, dtype=np.int64)
+    for start in range(0, point_num, chunk_size):
+        chunk = array[start:start + chunk_size]
+        rows = np.arange(chunk.shape[0])
+        p_xyz = lonlat_to_xyz_array(chunk[:, 0], chunk[:, 1])
+        # cosine of angle between point and its projection on every great circle
+        dot = np.dot(p_xyz, unit_normal.T)
+        cos_inside = np.sqrt(np.maximum(1.0 - dot * dot, 0.0))
+        inside = (valid & (cos_inside > df.ZERO_THRESHOLD)
+                  & (np.dot(p_xyz, s_side.T) >= 0.0) & (np.dot(p_xyz, e_side.T) >= 0.0))
+        cos_s = np.dot(p_xyz, s_xyz.T)
+        cos_e = np.where(valid, np.dot(p_xyz, e_xyz.T), -1.0)
+        cos_best = np.where(inside, cos_inside, np.maximum(cos_s, cos_e))
+        best = np.argmax(cos_best, axis=1)
+
+        best_inside = inside[rows, best]
+        best_is_end = ~best_inside & (cos_e[rows, best] > cos_s[rows, best])
+        chunk_nearest = np.where(best_is_end[:, None], line_array[best + 1], line_array[best])
+        if np.any(best_inside):
+            in_rows = rows[best_inside]
+            in_best = best[best_inside]
+            t_xyz = (p_xyz[in_rows]
+                     - dot[in_rows, in_best][:, None] * unit_normal[in_best])
+            chunk_nearest[in_rows] = xyz_array_to_lonlat(t_xyz)
+        nearest[start:start + chunk.shape[0]] = chunk_nearest
+        indexes[start:start + chunk.shape[0]] = best
+
+    distances = calc_distance_array(array[:, 0], array[:, 1], nearest[:, 0], nearest[:, 1], precision)
+    return nearest, indexes, distances
+
+
+def calc_plane_nearest_points(array, line_array, chunk_size, precision=PRECISION_EQUIRECTANGULAR):
+    """
+    nearest points on projection plane, the plane of every point uses its own latitude
+    :param array: points, numpy array of shape (n, 2)
+    :param line_array: line points, numpy array of shape (m, 2), m >= 2
+    :param chunk_size: points computed at one time
+    :param precision: PRECISION_EQUIRECTANGULAR or PRECISION_LOCAL_PLANAR
+    :return: nearest points array (n, 2), segment index array (n,)
+    """
+    point_num = array.shape[0]
+    s_points = line_array[:-1]
+    deltas = line_array[1:] - s_points
+    cos_lats = calc_projection_cos_array(array[:, 1], array[:, 1], precision)
+    nearest = np.empty((point_num, 2), dtype=np.float64)
+    indexes = np.empty(point_num, dtype=np.int64)
+    for start in range(0, point_num, chunk_size):
+        chunk = array[start:start + chunk_size]
+        chunk_cos = cos_lats[start:start + chunk_size, None]
+        rows = np.arange(chunk.shape[0])
+        # point and segment vectors in degree of latitude, relative to segment start
+        px = (chunk[:, 0:1] - s_points[:, 0]) * chunk_cos
+        py = chunk[:, 1:2] - s_points[:, 1]
+        dx = deltas[:, 0] * chunk_cos
+        dy = np.broadcast_to(deltas[:, 1], dx.shape)
+        square = dx * dx + dy * dy
+        valid = square > 0.0
+        t = np.where(valid, (px * dx + py * dy) / np.where(valid, square, 1.0), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        ex = px - t * dx
+        ey = py - t * dy
+        best = np.argmin(ex * ex + ey * ey, axis=1)
+        nearest[start:start + chunk.shape[0]] = s_points[best] + t[rows, best][:, None] * deltas[best]
+        indexes[start:start + chunk.shape[0]] = best
+    return nearest, indexes
+
+
+def calc_nearest_point_info(point, line, precision=None):
+    """
+    :param point: point (longitude, latitude)
+    :param line: line [points]
+    :param precision: PRECISION_*, None uses current precision
+    :return: nearest point on line (longitude, latitude), segment index, distance. None if line is empty
+    """
+    result = calc_nearest_points_on_line([point], line, None, precision)
+    if result is None:
+        return None
+    nearest, indexes, distances = result
+    return (float(nearest[0, 0]), float(nearest[0, 1])), int(indexes[0]), float(distances[0])
+
+
+def calc_points_to_line_distance(points, line, precision=None):
+    """
+    :param points: points [(longitude, latitude)]
+    :param line: line [points]
+    :param precision: PRECISION_*, None uses current precision
+    :return: distance of every point and line, numpy array. the unit is metre. None if line is empty
+    """
+    result = calc_nearest_points_on_line(points, line, None, precision)
+    if result is None:
+        return None
+    return result[2]
+
+
 def calc_nearest_point_on_line(point, line):
     """
     :param point: point (longitude, latitude)
@@ -181,6 +602,8 @@ def calc_nearest_point_on_line_segment(point, s_point, e_point):
         return copy.deepcopy(s_point)
     if is_same_point(point, e_point):
         return copy.deepcopy(e_point)
+    if current_precision != PRECISION_HAVERSINE:
+        return calc_plane_nearest_point_on_segment(point, s_point, e_point, current_precision)
 
     s_xyz = lonlat_to_xyz(s_point[df.INDEX_LON], s_point[df.INDEX_LAT])
     e_xyz = lonlat_to_xyz(e_point[df.INDEX_LON], e_point[df.INDEX_LAT])
@@ -190,13 +613,38 @@ def calc_nearest_point_on_line_segment(point, s_point, e_point):
     if is_same_direction(p_xyz, q_xyz):
         return s_point
 
-    t_vector = calc_cross_product(p_xyz, q_xyz)
+    # point is between the planes through q and the segment ends, its projection is inside the segment
+    if calc_dot_product(p_xyz, calc_cross_product(q_xyz, s_xyz)) < 0.0 \
+            or calc_dot_product(p_xyz, calc_cross_product(e_xyz, q_xyz)) < 0.0:
+        if calc_dot_product(p_xyz, s_xyz) >= calc_dot_product(p_xyz, e_xyz):
+            return s_point
+        return e_point
+
+    # projection on the great circle of the segment is q x (p x q)
+    t_vector = calc_cross_product(q_xyz, calc_cross_product(p_xyz, q_xyz))
     k = 1.0 / calc_euclid_distance(t_vector)
-    t_xyz = (k * t_vector[0], k * t_vector[1], k * t_vector[2])
-    t_point = xyz_to_lonlat(t_xyz[0], t_xyz[1], t_xyz[2])
-    if calc_point_distance(s_point, t_point) + calc_point_distance(e_point, t_point) > calc_point_distance(s_point, e_point):
-        t_point = (-t_point[df.INDEX_LON], -t_point[df.INDEX_LAT])
-    return t_point
+    return xyz_to_lonlat(k * t_vector[0], k * t_vector[1], k * t_vector[2])
+
+
+def calc_plane_nearest_point_on_segment(point, s_point, e_point, precision=PRECISION_EQUIRECTANGULAR):
+    """
+    :param point: point (longitude, latitude)
+    :param s_point: start point of line segment (longitude, latitude)
+    :param e_point: end point of line segment (longitude, latitude)
+    :param precision: PRECISION_EQUIRECTANGULAR or PRECISION_LOCAL_PLANAR
+    :return: point on line segment (longitude, latitude) on projection plane of point
+    """
+    cos_lat = calc_projection_cos(point[df.INDEX_LAT], point[df.INDEX_LAT], precision)
+    d_lon = e_point[df.INDEX_LON] - s_point[df.INDEX_LON]
+    d_lat = e_point[df.INDEX_LAT] - s_point[df.INDEX_LAT]
+    dx = d_lon * cos_lat
+    square = dx * dx + d_lat * d_lat
+    if square <= 0.0:
+        return s_point
+    px = (point[df.INDEX_LON] - s_point[df.INDEX_LON]) * cos_lat
+    py = point[df.INDEX_LAT] - s_point[df.INDEX_LAT]
+    t = min(max((px * dx + py * d_lat) / square, 0.0), 1.0)
+    return s_point[df.INDEX_LON] + t * d_lon, s_point[df.INDEX_LAT] + t * d_lat
 
 
 def calc_point_to_line_distance(point, line):
@@ -223,6 +671,32 @@ def calc_line_length(line):
     return length
 
 
+def calc_lines_length(coords, offsets, precision=None):
+    """
+    vectorized calc_line_length of many lines stored in one buffer
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param precision: PRECISION_*, None uses current precision
+    :return: length of every line, numpy array. the unit is metre
+    """
+    coords = to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    line_num = offsets.shape[0] - 1
+    lengths = np.zeros(max(line_num, 0), dtype=np.float64)
+    if coords.shape[0] <= 1 or line_num <= 0:
+        return lengths
+
+    segment_lengths = calc_distance_array(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1], precision)
+    # segment from last point of one line to first point of next line is not a part of line
+    boundaries = offsets[1:-1] - 1
+    segment_lengths[boundaries[(boundaries >= 0) & (boundaries < segment_lengths.shape[0])]] = 0.0
+    starts = offsets[:-1]
+    has_segment = offsets[1:] - starts >= 2
+    if np.any(has_segment):
+        lengths[has_segment] = np.add.reduceat(segment_lengths, starts[has_segment])
+    return lengths
+
+
 def split_line_by_length(line, length):
     """
     :param line: line [points]
@@ -374,3 +848,7 @@ def calc_mid_point_by_percent(s_point, e_point, percent):
     m_lon = s_lon + percent * d_lon
     m_lat = s_lat + percent * d_lat
     return m_lon, m_lat
+
+
+# counted functions are wrapped when GEO_INSTRUMENT is set, even if instrument is not imported by caller
+instrument.register(__name__)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/6/21 4:40 PM 
+# @Author : yangyuxin
+# @File : endpoint_snap.py
+# 这个代码文件用网格哈希把距离在容差内的点聚合成同一个点，用来快速生成拓扑节点
+# 容差的单位为米，与 data_define.SAME_POINT_DISTANCE 一致
+
+
+import math
+import numpy as np
+import data_define as df
+import distance_process
+import spatial_index
+
+
+# half of the eight neighbour cells, the other half is covered by symmetry
+NEIGHBOUR_CELL_OFFSETS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+MAX_CELL_LATITUDE = 89.0  # cos(latitude) is clamped at this latitude when sizing cells
+
+
+def calc_connected_labels(item_num, items1, items2):
+    """
+    union find over item pairs
+    :param item_num: count of items
+    :param items1: first item indexes of pairs
+    :param items2: second item indexes of pairs
+    :return: label of every item, the label is the smallest item index of its group
+    """
+    labels = np.arange(item_num, dtype=np.int64)
+    items1 = np.asarray(items1, dtype=np.int64)
+    items2 = np.asarray(items2, dtype=np.int64)
+    if items1.shape[0] == 0:
+        return labels
+    while True:
+        roots1 = labels[items1]
+        roots2 = labels[items2]
+        unmerged = roots1 != roots2
+        if not np.any(unmerged):
+            return labels
+        roots1 = roots1[unmerged]
+        roots2 = roots2[unmerged]
+        min_roots = np.minimum(roots1, roots2)
+        np.minimum.at(labels, roots1, min_roots)
+        np.minimum.at(labels, roots2, min_roots)
+        # pointer jumping until every item points to its root
+        while True:
+            next_labels = labels[labels]
+            if np.array_equal(next_labels, labels):
+                break
+            labels = next_labels
+
+
+def calc_cell_size(lats, tolerance):
+    """
+    :param lats: latitudes of points
+    :param tolerance: snap tolerance. the unit is metre
+    :return: longitude cell size, latitude cell size in degree. every cell is not smaller than tolerance
+    """
+    lat_cell = tolerance / (distance_process.EARTH_RADIUS * math.pi / 180.0)
+    max_lat = min(float(np.max(np.abs(lats))), MAX_CELL_LATITUDE) if len(lats) else 0.0
+    lon_cell = lat_cell / math.cos(distance_process.rad(max_lat))
+    return lon_cell, lat_cell
+
+
+def calc_cell_keys(cols, rows):
+    """
+    :param cols: longitude cell indexes
+    :param rows: latitude cell indexes
+    :return: packed int64 cell keys
+    """
+    return (np.asarray(cols, dtype=np.int64) << 32) + (np.asarray(rows, dtype=np.int64) + (1 << 31))
+
+
+def find_near_pairs(lons, lats, tolerance=df.SAME_POINT_DISTANCE):
+    """
+    :param lons: longitudes of points
+    :param lats: latitudes of points
+    :param tolerance: max distance of pair. the unit is metre
+    :return: first point indexes, second point indexes of all pairs not farther than tolerance
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if lons.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    lon_cell, lat_cell = calc_cell_size(lats, tolerance)
+    cols = np.floor(lons / lon_cell).astype(np.int64)
+    rows = np.floor(lats / lat_cell).astype(np.int64)
+    keys = calc_cell_keys(cols, rows)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    cell_keys, cell_starts = np.unique(sorted_keys, return_index=True)
+    cell_ends = np.append(cell_starts[1:], sorted_keys.shape[0])
+    point_cells = np.searchsorted(cell_keys, sorted_keys)
+
+    items1_list = list()
+    items2_list = list()
+    # pairs in same cell, every sorted position pairs with positions behind it
+    positions = np.arange(sorted_keys.shape[0])
+    others, owners = spatial_index.expand_ranges(positions + 1, cell_ends[point_cells])
+    items1_list.append(owners)
+    items2_list.append(others)
+    # pairs with neighbour cells
+    for col_offset, row_offset in NEIGHBOUR_CELL_OFFSETS:
+        neighbour_keys = calc_cell_keys(cols[order] + col_offset, rows[order] + row_offset)
+        neighbour_cells = np.searchsorted(cell_keys, neighbour_keys)
+        neighbour_cells = np.minimum(neighbour_cells, cell_keys.shape[0] - 1)
+        found = cell_keys[neighbour_cells] == neighbour_keys
+        starts = np.where(found, cell_starts[neighbour_cells], 0)
+        ends = np.where(found, cell_ends[neighbour_cells], 0)
+        others, owners = spatial_index.expand_ranges(starts, ends)
+        items1_list.append(owners)
+        items2_list.append(others)
+
+    items1 = order[np.concatenate(items1_list)]
+    items2 = order[np.concatenate(items2_list)]
+    distances = distance_process.calc_distance_array(lons[items1], lats[items1], lons[items2], lats[items2],
+                                                     distance_process.PRECISION_HAVERSINE)
+    near = distances <= tolerance
+    return items1[near], items2[near]
+
+
+def snap_points(lons, lats, tolerance=df.SAME_POINT_DISTANCE):
+    """
+    group points not farther than tolerance, groups are chained by transitivity
+    :param lons: longitudes of points
+    :param lats: latitudes of points
+    :param tolerance: snap tolerance. the unit is metre. 0 only groups points with same coordinate
+    :return: group index of every point, first point index of every group.
+             groups are ordered by their first point
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if tolerance > 0.0:
+        items1, items2 = find_near_pairs(lons, lats, tolerance)
+        labels = calc_connected_labels(lons.shape[0], items1, items2)
+        group_firsts, groups = np.unique(labels, return_inverse=True)
+        return groups.reshape(-1), group_firsts
+
+    if lons.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    _, firsts, groups = np.unique(np.stack((lons, lats), axis=1), axis=0,
+                                  return_index=True, return_inverse=True)
+    groups = groups.reshape(-1)
+    # renumber groups by their first point
+    order = np.argsort(firsts, kind='stable')
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(order.shape[0])
+    return ranks[groups], firsts[order]
@@ -6,12 +6,23 @@
 
 import os
 import sys
+import struct
 import ogr
+import numpy as np
+import data_define as df
+import instrument
+
+
+TRANSACTION_BATCH_SIZE = 10000  # features committed in one transaction
+COLUMN_CHUNK_SIZE = 100000  # features of one chunk in columnar reading
+EMPTY_COORDS = np.empty((0, 2), dtype=np.float64)
+
+featuredefn_cache = dict()  # field names: ogr.FeatureDefn
 
 
 def create_feature(field_dict, geometry):
-    field_names = field_dict.keys()
-    feat_defn = create_featuredefn(field_names)
+    field_names = tuple(field_dict.keys())
+    feat_defn = get_featuredefn(field_names)
     feature = ogr.Feature(feat_defn)
     for key, value in field_dict.items():
         feature.SetField(key, value)
@@ -19,6 +30,16 @@ def create_feature(field_dict, geometry):
     return feature
 
 
+def get_featuredefn(field_names):
+    # feature definitions of same field names are shared
+    field_names = tuple(field_names)
+    feat_defn = featuredefn_cache.get(field_names)
+    if feat_defn is None:
+        feat_defn = create_featuredefn(field_names)
+        featuredefn_cache[field_names] = feat_defn
+    return feat_defn
+
+
 def create_featuredefn(field_names):
     feat_defn = ogr.FeatureDefn()
     fieldDef_list = create_fieldDef_list(field_names)
@@ -64,14 +85,194 @@ def create_miffile(file_path, fieldDef_list) :
     return ds_file
 
 
+class FeatureColumns(object):
+    """
+    columnar features, geometry points of row i are coords[offsets[i]:offsets[i + 1]].
+    a row is a feature, or one line part of multi part feature
+    """
+    def __init__(self, fids, coords, offsets, columns):
+        """
+        :param fids: feature ids, numpy array
+        :param coords: points of all features, numpy array of shape (n, 2)
+        :param offsets: point offsets of features, numpy array
+        :param columns: {field name: numpy array of field values}
+        """
+        self.fids = fids
+        self.coords = coords
+        self.offsets = offsets
+        self.columns = columns
+
+    def __len__(self):
+        return self.fids.shape[0]
+
+    def get_points(self, index):
+        """
+        :param index: row index in columns
+        :return: geometry points [(longitude, latitude)]
+        """
+        part = self.coords[self.offsets[index]:self.offsets[index + 1]]
+        return [(lon, lat) for lon, lat in part.tolist()]
+
+
+def geometry_to_coords(geometry):
+    """
+    :param geometry: ogr.Geometry of one line part, or points
+    :return: points of geometry, numpy array of shape (n, 2)
+    """
+    parts = geometry_to_parts(geometry)
+    if len(parts) > 1:
+        # joining parts would make a segment from end of one part to start of next
+        raise ValueError("geometry has %d line parts, use geometry_to_parts" % len(parts))
+    return parts[0] if parts else np.empty((0, 2), dtype=np.float64)
+
+
+def geometry_to_parts(geometry):
+    """
+    :param geometry: ogr.Geometry
+    :return: [points of every part, numpy array of shape (n, 2)]. every line of multi line and every ring of
+             polygon is one part, points of multi point are one part. empty list if geometry is empty
+    """
+    if geometry is None or geometry.IsEmpty():
+        return list()
+
+    # read line string coordinates from wkb buffer without python tuples
+    wkb = geometry.ExportToWkb()
+    byte_order = '<' if bytearray(wkb[0:1])[0] == 1 else '>'
+    geometry_type = struct.unpack(byte_order + 'I', wkb[1:5])[0]
+    if geometry_type & 0x80000000:
+        dimension = 3
+        geometry_type &= 0xff
+    else:
+        dimension = (2, 3, 3, 4)[geometry_type // 1000] if geometry_type < 4000 else 2
+        geometry_type %= 1000
+    if geometry_type == ogr.wkbLineString:
+        point_num = struct.unpack(byte_order + 'I', wkb[5:9])[0]
+        values = np.frombuffer(wkb, dtype=byte_order + 'f8', count=point_num * dimension, offset=9)
+        return [values.reshape(point_num, dimension)[:, [df.INDEX_LON, df.INDEX_LAT]].astype(np.float64)]
+
+    points = geometry.GetPoints()
+    if points:
+        return [np.array([(point[df.INDEX_LON], point[df.INDEX_LAT]) for point in points], dtype=np.float64)]
+    parts = list()
+    for i in range(geometry.GetGeometryCount()):
+        parts.extend(geometry_to_parts(geometry.GetGeometryRef(i)))
+    if geometry_type == ogr.wkbMultiPoint and parts:
+        return [np.concatenate(parts)]
+    return parts
+
+
+def to_column(values, field_type):
+    """
+    :param values: field values
+    :param field_type: ogr field type
+    :return: numpy array, null value is nan in real column. integer column with null is object column
+    """
+    if field_type == ogr.OFTReal:
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    if field_type in (ogr.OFTInteger, getattr(ogr, 'OFTInteger64', ogr.OFTInteger)) and None not in values:
+        return np.array(values, dtype=np.int64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def iter_layer_columns(layer, chunk_size=COLUMN_CHUNK_SIZE, field_names=None, box=None, where=None,
+                       layer_where=None):
+    """
+    every line part of multi part feature is one row, rows of one feature have the same fid and field values
+    :param layer: ogr layer
+    :param chunk_size: features of one chunk, None reads all features into one chunk
+    :param field_names: fields read into columns, None reads all fields
+    :param box: spatial filter [x_min, y_min, x_max, y_max], evaluated by driver. it replaces spatial filter of layer
+                while reading, the filter of layer is restored at the end
+    :param where: attribute filter, sql where clause, evaluated by driver. it replaces attribute filter of layer
+                  while reading
+    :param layer_where: attribute filter of layer restored at the end when where is given. ogr can not return
+                        it from layer, see FileReader.set_attribute_filter
+    :return: generator of FeatureColumns, one for every chunk
+    """
+    layer_defn = layer.GetLayerDefn()
+    all_names = [layer_defn.GetFieldDefn(i).GetName() for i in range(layer_defn.GetFieldCount())]
+    field_names = all_names if field_names is None else list(field_names)
+    field_indexes = [layer_defn.GetFieldIndex(name) for name in field_names]
+    field_types = [layer_defn.GetFieldDefn(index).GetType() for index in field_indexes]
+
+    layer_filter = None
+    if box is not None:
+        layer_filter = layer.GetSpatialFilter()
+        # filter geometry is owned by layer and replaced below
+        layer_filter = layer_filter.Clone() if layer_filter is not None else None
+        layer.SetSpatialFilterRect(box[0], box[1], box[2], box[3])
+    if where is not None:
+        layer.SetAttributeFilter(where)
+    # fields not asked are not parsed by driver
+    layer.SetIgnoredFields([name for name in all_names if name not in field_names])
+    layer.ResetReading()
+    try:
+        while True:
+            fids = list()
+            parts = list()
+            counts = list()
+            values = [list() for _ in field_names]
+            # iterating layer resets reading, so features are read one by one
+            while chunk_size is None or len(fids) < chunk_size:
+                feature = layer.GetNextFeature()
+                if feature is None:
+                    break
+                fid = feature.GetFID()
+                feature_values = [feature.GetField(index) for index in field_indexes]
+                # feature without geometry is one row without point
+                for coords in geometry_to_parts(feature.GetGeometryRef()) or [EMPTY_COORDS]:
+                    fids.append(fid)
+                    parts.append(coords)
+                    counts.append(coords.shape[0])
+                    for i, value in enumerate(feature_values):
+                        values[i].append(value)
+            if not fids:
+                break
+            coords = np.concatenate(parts) if parts else np.empty((0, 2), dtype=np.float64)
+            offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+            columns = dict((name, to_column(column_values, field_type))
+                           for name, column_values, field_type in zip(field_names, values, field_types))
+            yield FeatureColumns(np.array(fids, dtype=np.int64), coords, offsets, columns)
+            if chunk_size is None or len(fids) < chunk_size:
+                break
+    finally:
+        if box is not None:
+            layer.SetSpatialFilter(layer_filter)
+        if where is not None:
+            layer.SetAttributeFilter(layer_where)
+        layer.SetIgnoredFields([])
+        layer.ResetReading()
+
+
+def read_layer_columns(layer, field_names=None, box=None, where=None, layer_where=None):
+    """
+    :param layer: ogr layer
+    :param field_names: fields read into columns, None reads all fields
+    :param box: spatial filter [x_min, y_min, x_max, y_max]
+    :param where: attribute filter, sql where clause
+    :param layer_where: attribute filter of layer restored at the end, see iter_layer_columns
+    :return: FeatureColumns of all filtered features
+    """
+    for columns in iter_layer_columns(layer, None, field_names, box, where, layer_where):
+        return columns
+    field_names = list() if field_names is None else list(field_names)
+    return FeatureColumns(np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=np.float64),
+                          np.zeros(1, dtype=np.int64),
+                          dict((name, np.empty(0, dtype=object)) for name in field_names))
+
+
 class FileReader(object):
     def __init__(self, file_path):
         self.ds_file = ogr.Open(file_path)
-        if self.ds_file:
+        self.lyr_file = None
+        self.attribute_filter = None  # ogr can not return attribute filter of layer
+        if self.ds_file is not None:
             self.lyr_file = self.ds_file.GetLayerByIndex(0)
 
     def is_valid(self):
-        return self.ds_file and self.lyr_file
+        return self.ds_file is not None and self.lyr_file is not None
 
     def get_lyr_file(self):
         if not self.is_valid():
@@ -80,25 +281,58 @@ class FileReader(object):
         self.lyr_file.ResetReading()
         return self.lyr_file
 
+    def set_attribute_filter(self, where):
+        """
+        :param where: attribute filter of layer, sql where clause. None removes filter
+        """
+        if not self.is_valid():
+            return
+        self.lyr_file.SetAttributeFilter(where)
+        self.attribute_filter = where
+
     def get_field_def_list(self):
         if not self.is_valid():
             return None
 
         field_def_list = []
-        feature = self.lyr_file.GetNextFeature()
-        for i in range(feature.GetFieldCount()):
-            field_def_list.append(feature.GetFieldDefnRef(i))
+        layer_defn = self.lyr_file.GetLayerDefn()
+        for i in range(layer_defn.GetFieldCount()):
+            field_def_list.append(layer_defn.GetFieldDefn(i))
         return field_def_list
 
+    def read_columns(self, field_names=None, box=None, where=None):
+        """
+        :param field_names: fields read into columns, None reads all fields
+        :param box: spatial filter [x_min, y_min, x_max, y_max]
+        :param where: attribute filter, sql where clause
+        :return: FeatureColumns of all filtered features
+        """
+        if not self.is_valid():
+            return None
+        return read_layer_columns(self.lyr_file, field_names, box, where, self.attribute_filter)
+
+    def iter_columns(self, chunk_size=COLUMN_CHUNK_SIZE, field_names=None, box=None, where=None):
+        """
+        :param chunk_size: features of one chunk
+        :param field_names: fields read into columns, None reads all fields
+        :param box: spatial filter [x_min, y_min, x_max, y_max]
+        :param where: attribute filter, sql where clause
+        :return: generator of FeatureColumns, one for every chunk
+        """
+        if not self.is_valid():
+            return iter(list())
+        return iter_layer_columns(self.lyr_file, chunk_size, field_names, box, where, self.attribute_filter)
+
 
 class FileWriter(object):
     def __init__(self, file_path, field_def_list):
         self.ds_file = create_miffile(file_path, field_def_list)
-        if self.ds_file:
+        self.lyr_file = None
+        if self.ds_file is not None:
             self.lyr_file = self.ds_file.GetLayerByIndex(0)
 
     def is_valid(self):
-        return self.ds_file and self.lyr_file
+        return self.ds_file is not None and self.lyr_file is not None
 
     def write_feature(self, feature):
         if not self.is_valid():
@@ -106,5 +340,82 @@ class FileWriter(object):
         self.lyr_file.CreateFeature(feature)
         return True
 
+    def write_features(self, records, batch_size=TRANSACTION_BATCH_SIZE):
+        """
+        write many features with one reused feature object
+        :param records: iterable of (field_dict, geometry)
+        :param batch_size: features committed in one transaction, if layer supports transaction
+        :return: count of written features
+        """
+        if not self.is_valid():
+            return 0
+
+        feat_defn = self.lyr_file.GetLayerDefn()
+        feature = ogr.Feature(feat_defn)
+        field_indexes = dict()
+        last_set_indexes = set()
+        use_transaction = self.lyr_file.TestCapability(ogr.OLCTransactions)
+        batch_size = max(1, int(batch_size))
+        count = 0
+        if use_transaction:
+            self.lyr_file.StartTransaction()
+        try:
+            for field_dict, geometry in records:
+                set_indexes = set()
+                for key, value in field_dict.items():
+                    index = field_indexes.get(key)
+                    if index is None:
+                        index = feat_defn.GetFieldIndex(key)
+                        field_indexes[key] = index
+                    if index >= 0:
+                        feature.SetField(index, value)
+                        set_indexes.add(index)
+                # reused feature must not keep fields of last record
+                for index in last_set_indexes - set_indexes:
+                    feature.UnsetField(index)
+                last_set_indexes = set_indexes
+                feature.SetFID(ogr.NullFID)
+                feature.SetGeometry(geometry)
+                self.lyr_file.CreateFeature(feature)
+                count += 1
+                if use_transaction and count % batch_size == 0:
+                    self.lyr_file.CommitTransaction()
+                    self.lyr_file.StartTransaction()
+        except Exception:
+            if use_transaction:
+                self.lyr_file.RollbackTransaction()
+            raise
+        if use_transaction:
+            self.lyr_file.CommitTransaction()
+        return count
+
+
+def iter_point_records(points, columns):
+    """
+    :param points: points, numpy array of shape (n, 2)
+    :param columns: {field name: values aligned with points}
+    :return: generator of (field_dict, point geometry) for FileWriter.write_features
+    """
+    names = list(columns.keys())
+    values = [np.asarray(columns[name]).tolist() for name in names]
+    for i, point in enumerate(np.asarray(points).reshape(-1, 2).tolist()):
+        geometry = ogr.Geometry(ogr.wkbPoint)
+        geometry.AddPoint(point[df.INDEX_LON], point[df.INDEX_LAT])
+        yield dict((name, column[i]) for name, column in zip(names, values)), geometry
+
+
+def write_records(file_path, field_names, records):
+    """
+    :param file_path: output file path
+    :param field_names: field names of layer
+    :param records: iterable of (field_dict, geometry)
+    :return: count of written features, None if file can not be created
+    """
+    writer = FileWriter(file_path, create_fieldDef_list(field_names))
+    if not writer.is_valid():
+        return None
+    return writer.write_features(records)
 
 
+# counted functions are wrapped when GEO_INSTRUMENT is set, even if instrument is not imported by caller
+instrument.register(__name__)
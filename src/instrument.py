@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/8/16 10:20 AM 
+# @Author : yangyuxin
+# @File : instrument.py
+# 这个代码文件统计常用函数的调用次数、累计耗时和处理数量，用来定位变慢的调用
+# 默认关闭，关闭时函数不被替换，拓扑构建的阶段统计只多一次判断
+# 设置环境变量 GEO_INSTRUMENT=1 后，导入任意一个被统计的模块时开启，GEO_INSTRUMENT_REPORT=文件路径 在退出时写出 json 报告
+# seconds 是包含内部被统计函数的耗时，self_seconds 扣除了内部被统计函数的耗时
+
+
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import importlib
+import threading
+
+
+ENV_ENABLE = 'GEO_INSTRUMENT'  # "1" enables instrumentation when a counted module is imported
+ENV_REPORT = 'GEO_INSTRUMENT_REPORT'  # json report path written at exit
+REPORT_VERSION = 2
+
+# modules whose public functions are counted, counted modules call register at the end of import
+FUNCTION_MODULES = ['distance_process', 'angle_process']
+# tiny helpers called inside counted functions, timing them costs more than they do
+SKIPPED_FUNCTIONS = set(['distance_process.rad', 'distance_process.degree',
+                         'angle_process.eqaul', 'angle_process.degree'])
+# classes whose methods are counted, (module name, class name, [method names])
+IO_METHODS = [
+    ('file_operator', 'FileReader', ['__init__', 'read_columns', 'iter_columns']),
+    ('file_operator', 'FileWriter', ['__init__', 'write_feature', 'write_features']),
+]
+
+
+def _count_first(args, result):
+    return len(args[0])
+
+
+def _count_pairs(args, result):
+    return len(args[0]) * len(args[1])
+
+
+def _count_lines(args, result):
+    return max(0, len(args[1]) - 1)
+
+
+def _count_result(args, result):
+    return len(result) if result is not None else 0
+
+
+def _count_written(args, result):
+    return result if result else 0
+
+
+# name: function(args, result) -> items, other functions count one item per call
+ITEM_COUNTERS = {
+    'distance_process.to_point_array': _count_first,
+    'distance_process.calc_distance_array': _count_first,
+    'distance_process.calc_degree_buffer': _count_first,
+    'distance_process.calc_buffer_boxes': _count_first,
+    'distance_process.calc_points_distance': _count_first,
+    'distance_process.calc_point_to_points_distance': lambda args, result: len(args[1]),
+    'distance_process.calc_distance_matrix': _count_pairs,
+    'distance_process.lonlat_to_xyz_array': _count_first,
+    'distance_process.xyz_array_to_lonlat': _count_first,
+    'distance_process.calc_segment_distances': _count_first,
+    'distance_process.calc_nearest_points_on_line': _count_first,
+    'distance_process.calc_points_to_line_distance': _count_first,
+    'distance_process.calc_lines_length': _count_lines,
+    'angle_process.calc_angle_array': _count_first,
+    'angle_process.calc_turn_angle_array': _count_first,
+    'FileReader.read_columns': _count_result,
+    'FileWriter.write_features': _count_written,
+}
+# iterator results, every item of iterator is counted by len
+ITERATOR_RESULTS = set(['FileReader.iter_columns'])
+
+_stats = dict()  # name: [calls, seconds, items, self seconds]
+_originals = list()  # (owner, attribute name, original value)
+_lock = threading.Lock()
+_local = threading.local()  # seconds of counted calls inside every running counted call of thread
+_ready_modules = set()  # counted modules whose import is finished
+_patched_modules = set()
+_enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name, seconds, items=1, calls=1, self_seconds=None):
+    """
+    :param name: name of function or phase
+    :param seconds: time cost, including counted calls inside
+    :param items: count of handled items
+    :param calls: count of calls
+    :param self_seconds: time cost without counted calls inside, None is same as seconds
+    """
+    if self_seconds is None:
+        self_seconds = seconds
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            _stats[name] = [calls, seconds, items, self_seconds]
+        else:
+            stat[0] += calls
+            stat[1] += seconds
+            stat[2] += items
+            stat[3] += self_seconds
+
+
+def _timed_call(func, args, kwargs):
+    """
+    :return: result, seconds, self seconds. time of counted calls inside is added to the caller
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = list()
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        inner_seconds = stack.pop()
+        if stack:
+            stack[-1] += seconds
+    return result, seconds, seconds - inner_seconds
+
+
+def _wrap_iterator(name, iterator):
+    while True:
+        try:
+            item, seconds, self_seconds = _timed_call(next, (iterator,), {})
+        except StopIteration:
+            return
+        record(name, seconds, len(item), 0, self_seconds)
+        yield item
+
+
+def _wrap(name, func, is_method=False):
+    counter = ITEM_COUNTERS.get(name)
+    is_iterator = name in ITERATOR_RESULTS
+
+    def wrapper(*args, **kwargs):
+        result, seconds, self_seconds = _timed_call(func, args, kwargs)
+        if is_iterator:
+            record(name, seconds, 0, 1, self_seconds)
+            return _wrap_iterator(name, iter(result))
+        items = 1
+        if counter:
+            # methods count items without self
+            try:
+                items = counter(args[1:] if is_method else args, result)
+            except (IndexError, TypeError):
+                pass
+        record(name, seconds, items, 1, self_seconds)
+        return result
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.instrumented = func
+    return wrapper
+
+
+def _patch(owner, attribute, name, is_method=False):
+    original = getattr(owner, attribute)
+    _originals.append((owner, attribute, original))
+    setattr(owner, attribute, _wrap(name, original, is_method))
+
+
+def get_module_names():
+    names = list(FUNCTION_MODULES)
+    for module_name, _, _ in IO_METHODS:
+        if module_name not in names:
+            names.append(module_name)
+    return names
+
+
+def _patch_module(module_name):
+    if module_name in _patched_modules:
+        return
+    _patched_modules.add(module_name)
+    module = sys.modules[module_name]
+    if module_name in FUNCTION_MODULES:
+        for attribute, func in sorted(vars(module).items()):
+            if attribute.startswith('_') or not inspect.isfunction(func) or func.__module__ != module_name:
+                continue
+            name = '%s.%s' % (module_name, attribute)
+            if name not in SKIPPED_FUNCTIONS:
+                _patch(module, attribute, name)
+    for io_module_name, class_name, method_names in IO_METHODS:
+        if io_module_name != module_name:
+            continue
+        cls = getattr(module, class_name)
+        for method_name in method_names:
+            _patch(cls, method_name, '%s.%s' % (class_name, method_name), True)
+
+
+def enable():
+    """
+    replace counted functions by timing wrappers, callers using module.function see the wrappers.
+    a counted module still being imported is patched when it calls register
+    """
+    global _enabled
+    with _lock:
+        if _enabled:
+            return
+        _enabled = True
+    for module_name in get_module_names():
+        if module_name in _ready_modules:
+            _patch_module(module_name)
+        elif module_name not in sys.modules:
+            importlib.import_module(module_name)
+
+
+def enable_from_env():
+    """
+    enable instrumentation if environment variable GEO_INSTRUMENT is set
+    """
+    if os.environ.get(ENV_ENABLE, '') not in ('', '0'):
+        enable()
+
+
+def register(module_name):
+    """
+    called at the end of counted modules, so GEO_INSTRUMENT works without importing instrument in caller
+    :param module_name: name of counted module
+    """
+    _ready_modules.add(module_name)
+    if _enabled:
+        _patch_module(module_name)
+    else:
+        enable_from_env()
+
+
+def disable():
+    """
+    restore original functions, collected stats are kept
+    """
+    global _enabled
+    with _lock:
+        if not _enabled:
+            return
+        _enabled = False
+    while _originals:
+        owner, attribute, original = _originals.pop()
+        setattr(owner, attribute, original)
+    _patched_modules.clear()
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+class NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase(object):
+    """
+    timing of one block, items can be set inside the block
+    """
+    def __init__(self, name, items=0):
+        self.name = name
+        self.items = items
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start, self.items)
+        return False
+
+
+def phase(name, items=0):
+    """
+    with instrument.phase('init_topology.index', len(links)):
+        ...
+    :param name: phase name
+    :param items: count of handled items
+    :return: context manager, does nothing if instrumentation is off
+    """
+    if not _enabled:
+        return NULL_PHASE
+    return Phase(name, items)
+
+
+def get_stats():
+    """
+    :return: {name: {'calls': n, 'seconds': s, 'items': n, 'self_seconds': s}}
+    """
+    with _lock:
+        return dict((name, {'calls': stat[0], 'seconds': stat[1], 'items': stat[2], 'self_seconds': stat[3]})
+                    for name, stat in _stats.items())
+
+
+def format_summary(limit=None):
+    """
+    :param limit: max lines, None shows all
+    :return: text table ordered by cumulative time
+    """
+    stats = sorted(get_stats().items(), key=lambda item: item[1]['seconds'], reverse=True)
+    if limit is not None:
+        stats = stats[:limit]
+    lines = ['%-48s %10s %12s %12s %12s %14s' % ('name', 'calls', 'seconds', 'self', 'items', 'items/s')]
+    for name, stat in stats:
+        rate = stat['items'] / stat['seconds'] if stat['seconds'] > 0.0 else 0.0
+        lines.append('%-48s %10d %12.6f %12.6f %12d %14.1f' % (name, stat['calls'], stat['seconds'],
+                                                                stat['self_seconds'], stat['items'], rate))
+    return '\n'.join(lines)
+
+
+def write_report(file_path):
+    """
+    :param file_path: json report path
+    """
+    with open(file_path, 'w') as report_file:
+        json.dump({'version': REPORT_VERSION, 'pid': os.getpid(), 'stats': get_stats()},
+                  report_file, indent=2, sort_keys=True)
+
+
+def _write_report_at_exit():
+    file_path = os.environ.get(ENV_REPORT)
+    if file_path and _stats:
+        write_report(file_path)
+
+
+atexit.register(_write_report_at_exit)
+enable_from_env()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/8/30 2:45 PM 
+# @Author : yangyuxin
+# @File : intersect_process.py
+# 这个代码文件查找道路之间的交叉点，候选线段对用线段的 R 树自连接得到，再用向量化的线段相交判断
+# 可以在交叉点打断道路并生成节点，得到平面化的路网拓扑
+
+
+import numpy as np
+import data_define as df
+import distance_process
+import file_operator
+import spatial_index
+import compact_topology
+
+
+SEGMENT_CHUNK_SIZE = 65536  # segments whose candidate pairs are tested at one time
+POSITION_EPSILON = 0.000000001  # segment parameter closer than it to 0 or 1 is at segment end
+
+
+def get_line_segments(offsets):
+    """
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :return: start coord index of every segment, line index of every segment
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    segment_nums = np.maximum(offsets[1:] - offsets[:-1] - 1, 0)
+    segment_starts, segment_lines = spatial_index.expand_ranges(offsets[:-1], offsets[:-1] + segment_nums)
+    return segment_starts, segment_lines
+
+
+def calc_segment_intersections(s_points1, e_points1, s_points2, e_points2):
+    """
+    vectorized segment intersection on longitude latitude plane. intersection is kept by affine projection,
+    so it is the same on local metre plane. parallel segments are not intersected
+    :param s_points1: start points of first segments, numpy array of shape (n, 2)
+    :param e_points1: end points of first segments, numpy array of shape (n, 2)
+    :param s_points2: start points of second segments, numpy array of shape (n, 2)
+    :param e_points2: end points of second segments, numpy array of shape (n, 2)
+    :return: is intersected, parameter on first segments, parameter on second segments
+    """
+    r = e_points1 - s_points1
+    s = e_points2 - s_points2
+    qp = s_points2 - s_points1
+    denominators = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    scale = np.maximum(np.abs(r).sum(axis=1) * np.abs(s).sum(axis=1), df.ZERO_THRESHOLD ** 2)
+    parallel = np.abs(denominators) <= scale * df.ZERO_THRESHOLD
+    safe = np.where(parallel, 1.0, denominators)
+    t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / safe
+    u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / safe
+    hit = (~parallel & (t >= -POSITION_EPSILON) & (t <= 1.0 + POSITION_EPSILON)
+           & (u >= -POSITION_EPSILON) & (u <= 1.0 + POSITION_EPSILON))
+    return hit, np.clip(t, 0.0, 1.0), np.clip(u, 0.0, 1.0)
+
+
+def find_intersections(coords, offsets, chunk_size=SEGMENT_CHUNK_SIZE):
+    """
+    all crossing and touching points between lines, and of one line with itself.
+    points where ends of both lines meet are already nodes and are not returned
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param chunk_size: segments whose candidate pairs are tested at one time, limits temporary memory
+    :return: first line indexes, second line indexes, positions on first lines, positions on second lines,
+             intersection points numpy array of shape (k, 2).
+             position is segment index in line plus parameter on segment, vertex i of line is at position i
+    """
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    segment_starts, segment_lines = get_line_segments(offsets)
+    empty = np.empty(0, dtype=np.int64)
+    if segment_starts.shape[0] == 0:
+        return empty, empty, np.empty(0), np.empty(0), np.empty((0, 2))
+
+    s_points = coords[segment_starts]
+    e_points = coords[segment_starts + 1]
+    boxes = np.concatenate((np.minimum(s_points, e_points), np.maximum(s_points, e_points)), axis=1)
+    tree = spatial_index.PackedRTree(boxes)
+    line_ends = offsets[1:] - offsets[:-1] - 1
+
+    results = list()
+    for start in range(0, segment_starts.shape[0], chunk_size):
+        queries, segments = tree.query_batch(boxes[start:start + chunk_size])
+        queries = queries + start
+        # every pair once, segments sharing a vertex in one line are not tested
+        keep = segments > queries
+        same_line = segment_lines[queries] == segment_lines[segments]
+        keep &= ~(same_line & (segments == queries + 1))
+        queries = queries[keep]
+        segments = segments[keep]
+        hit, t, u = calc_segment_intersections(s_points[queries], e_points[queries],
+                                               s_points[segments], e_points[segments])
+        queries = queries[hit]
+        segments = segments[hit]
+        t = t[hit]
+        u = u[hit]
+        lines1 = segment_lines[queries]
+        lines2 = segment_lines[segments]
+        positions1 = segment_starts[queries] - offsets[lines1] + t
+        positions2 = segment_starts[segments] - offsets[lines2] + u
+        positions1 = snap_positions(positions1)
+        positions2 = snap_positions(positions2)
+        # ends of both lines meet, they are joined by node already
+        at_end1 = (positions1 == 0.0) | (positions1 == line_ends[lines1])
+        at_end2 = (positions2 == 0.0) | (positions2 == line_ends[lines2])
+        keep = ~(at_end1 & at_end2)
+        points = s_points[queries] + t[:, None] * (e_points[queries] - s_points[queries])
+        # point at a vertex is the vertex itself
+        at_vertex1 = positions1 == np.floor(positions1)
+        points[at_vertex1] = coords[offsets[lines1[at_vertex1]] + positions1[at_vertex1].astype(np.int64)]
+        results.append((lines1[keep], lines2[keep], positions1[keep], positions2[keep], points[keep]))
+
+    lines1 = np.concatenate([result[0] for result in results])
+    lines2 = np.concatenate([result[1] for result in results])
+    positions1 = np.concatenate([result[2] for result in results])
+    positions2 = np.concatenate([result[3] for result in results])
+    points = np.concatenate([result[4] for result in results])
+    # crossing at a shared vertex is found by every segment pair around it
+    keys = np.stack((lines1, lines2, np.round(positions1 / POSITION_EPSILON),
+                     np.round(positions2 / POSITION_EPSILON)), axis=1)
+    _, firsts = np.unique(keys, axis=0, return_index=True)
+    firsts = np.sort(firsts)
+    return lines1[firsts], lines2[firsts], positions1[firsts], positions2[firsts], points[firsts]
+
+
+def snap_positions(positions):
+    """
+    :param positions: positions on lines
+    :return: positions, the ones near a vertex are moved onto it
+    """
+    rounded = np.round(positions)
+    return np.where(np.abs(positions - rounded) <= POSITION_EPSILON, rounded, positions)
+
+
+def split_lines(coords, offsets, line_indexes, positions, points):
+    """
+    split lines at positions, every split point is the end of one part and the start of next part
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param line_indexes: line index of every split
+    :param positions: position of every split on its line, see find_intersections
+    :param points: split points, numpy array of shape (k, 2)
+    :return: new coords, new offsets, source line index of every new line
+    """
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    line_indexes = np.asarray(line_indexes, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.float64)
+    points = distance_process.to_point_array(points)
+    line_num = offsets.shape[0] - 1
+    line_ends = offsets[1:] - offsets[:-1] - 1
+    # split at line ends does not make new part
+    inner = (positions > 0.0) & (positions < line_ends[line_indexes])
+    line_indexes = line_indexes[inner]
+    positions = positions[inner]
+    points = points[inner]
+    order = np.lexsort((positions, line_indexes))
+    line_indexes = line_indexes[order]
+    positions = positions[order]
+    points = points[order]
+    split_bounds = np.searchsorted(line_indexes, np.arange(line_num + 1))
+
+    coord_parts = list()
+    offset_list = [0]
+    parents = list()
+    total = 0
+    copy_start = 0
+    for line in np.unique(line_indexes).tolist():
+        # lines without split are copied in one block
+        if copy_start < line:
+            block = coords[offsets[copy_start]:offsets[line]]
+            coord_parts.append(block)
+            offset_list.extend((offsets[copy_start + 1:line + 1] - offsets[copy_start] + total).tolist())
+            parents.extend(range(copy_start, line))
+            total += block.shape[0]
+        copy_start = line + 1
+
+        line_coords = coords[offsets[line]:offsets[line + 1]]
+        part_start = 0
+        part_head = line_coords[0:1]
+        last_position = None
+        for position, point in zip(positions[split_bounds[line]:split_bounds[line + 1]].tolist(),
+                                   points[split_bounds[line]:split_bounds[line + 1]]):
+            if last_position is not None and position - last_position <= POSITION_EPSILON:
+                continue
+            last_position = position
+            vertex = int(np.floor(position))
+            # part is head point, vertices after part start up to split, split point
+            part = np.concatenate((part_head, line_coords[part_start + 1:vertex + 1], point[None, :]))
+            if position == vertex:
+                part = np.concatenate((part_head, line_coords[part_start + 1:vertex], point[None, :]))
+            coord_parts.append(part)
+            total += part.shape[0]
+            offset_list.append(total)
+            parents.append(line)
+            part_start = vertex
+            part_head = point[None, :]
+        part = np.concatenate((part_head, line_coords[part_start + 1:]))
+        coord_parts.append(part)
+        total += part.shape[0]
+        offset_list.append(total)
+        parents.append(line)
+
+    if copy_start < line_num:
+        block = coords[offsets[copy_start]:offsets[line_num]]
+        coord_parts.append(block)
+        offset_list.extend((offsets[copy_start + 1:] - offsets[copy_start] + total).tolist())
+        parents.extend(range(copy_start, line_num))
+    new_coords = np.concatenate(coord_parts) if coord_parts else np.empty((0, 2), dtype=np.float64)
+    return new_coords, np.array(offset_list, dtype=np.int64), np.array(parents, dtype=np.int64)
+
+
+def planarize_lines(coords, offsets, snap_tolerance=df.SAME_POINT_DISTANCE, link_fids=None):
+    """
+    split lines at all intersections and build topology, crossing roads share a node at crossing point
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]], every line has at least one point
+    :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+    :param link_fids: feature id of every line, kept by its parts
+    :return: CompactTopology of split lines, source line index of every link
+    """
+    lines1, lines2, positions1, positions2, points = find_intersections(coords, offsets)
+    new_coords, new_offsets, parents = split_lines(coords, offsets, np.concatenate((lines1, lines2)),
+                                                   np.concatenate((positions1, positions2)),
+                                                   np.concatenate((points, points)))
+    fids = np.asarray(link_fids, dtype=np.int64)[parents] if link_fids is not None else None
+    topology = compact_topology.CompactTopology.from_lines(new_coords, new_offsets, snap_tolerance, fids)
+    return topology, parents
+
+
+def find_layer_intersections(road_layer):
+    """
+    :param road_layer: road layer
+    :return: [(first fid, second fid, (longitude, latitude))]
+    """
+    columns = file_operator.read_layer_columns(road_layer, list())
+    lines1, lines2, _, _, points = find_intersections(columns.coords, columns.offsets)
+    fids = columns.fids
+    return [(fid1, fid2, (lon, lat)) for fid1, fid2, (lon, lat)
+            in zip(fids[lines1].tolist(), fids[lines2].tolist(), points.tolist())]
+
+
+def planarize_layer(road_layer, snap_tolerance=df.SAME_POINT_DISTANCE):
+    """
+    :param road_layer: road layer
+    :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+    :return: CompactTopology of split roads, link_fids are fids of source features
+    """
+    columns = file_operator.read_layer_columns(road_layer, list())
+    coords, offsets, fids = columns.coords, columns.offsets, columns.fids
+    # features without points can not be linked
+    valid = offsets[1:] > offsets[:-1]
+    if not np.all(valid):
+        lengths = (offsets[1:] - offsets[:-1])[valid]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        fids = fids[valid]
+    topology, _ = planarize_lines(coords, offsets, snap_tolerance, fids)
+    return topology
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/7/12 8:30 PM 
+# @Author : yangyuxin
+# @File : map_match_process.py
+# 这个代码文件用隐马尔可夫模型把 GPS 轨迹点匹配到道路上
+# 候选道路用空间索引批量查找，转移概率用路网距离，维特比解码使用滑动窗口支持流式匹配
+
+
+import numpy as np
+import data_define as df
+import distance_process
+import polyline
+import route_process
+import spatial_index
+
+
+SEARCH_RADIUS = 50.0  # candidate link search radius, metre
+GPS_SIGMA = 5.0  # standard deviation of gps error, metre
+TRANSITION_BETA = 5.0  # scale of difference between route distance and gps distance, metre
+MAX_CANDIDATES = 8  # max candidate links of one point
+WINDOW_SIZE = 30  # points kept in viterbi window before the oldest one is decided
+CHUNK_SIZE = 1024  # points whose candidates are searched at one time
+ROUTE_DISTANCE_FACTOR = 3.0  # route search stops at this times of gps distance
+NO_LINK = -1  # link id of point without match
+
+
+class MapMatcher(object):
+    """
+    hmm map matching on CompactTopology.
+    match result of a point is (point index, link id, measure on link, distance to link).
+    """
+    def __init__(self, topology, router=None, search_radius=SEARCH_RADIUS, gps_sigma=GPS_SIGMA,
+                 transition_beta=TRANSITION_BETA, max_candidates=MAX_CANDIDATES, window_size=WINDOW_SIZE):
+        """
+        :param topology: CompactTopology with link coordinates
+        :param router: route_process.Router of topology, None creates a two way router
+        :param search_radius: candidate link search radius. the unit is metre
+        :param gps_sigma: standard deviation of gps error. the unit is metre
+        :param transition_beta: scale of transition probability. the unit is metre
+        :param max_candidates: max candidate links of one point
+        :param window_size: points kept before the oldest one is decided
+        """
+        self.topology = topology
+        self.router = router if router else route_process.Router(topology)
+        self.index = spatial_index.PackedRTree(topology.get_link_boxes())
+        self.search_radius = search_radius
+        self.gps_sigma = gps_sigma
+        self.transition_beta = transition_beta
+        self.max_candidates = max_candidates
+        self.window_size = max(1, window_size)
+        self.lines = polyline.PolylineSet(topology.coords, topology.coord_offsets)
+
+    def find_candidates(self, points):
+        """
+        :param points: gps points [(longitude, latitude)]
+        :return: [(link ids, measures, distances)] of every point, numpy arrays sorted by distance
+        """
+        points = distance_process.to_point_array(points)
+        queries, links = self.index.query_batch(distance_process.calc_buffer_boxes(points, self.search_radius))
+        # all (point, link) pairs are located at once
+        measures, distances, _ = self.lines.locate_points(points[queries], links)
+
+        near = distances <= self.search_radius
+        queries = queries[near]
+        links = links[near]
+        measures = measures[near]
+        distances = distances[near]
+        order = np.lexsort((distances, queries))
+        queries = queries[order]
+        bounds = np.searchsorted(queries, np.arange(points.shape[0] + 1))
+        candidates = list()
+        for i in range(points.shape[0]):
+            part = order[bounds[i]:min(bounds[i + 1], bounds[i] + self.max_candidates)]
+            candidates.append((links[part], measures[part], distances[part]))
+        return candidates
+
+    def _calc_emission(self, distances):
+        return -0.5 * (distances / self.gps_sigma) ** 2
+
+    def _calc_route_distances(self, prev_candidates, candidates, gps_distance):
+        # route distance from every previous candidate to every candidate
+        prev_links, prev_measures, _ = prev_candidates
+        links, measures, _ = candidates
+        topology = self.topology
+        max_distance = gps_distance * ROUTE_DISTANCE_FACTOR + 2 * self.search_radius
+        route = np.full((prev_links.shape[0], links.shape[0]), np.inf, dtype=np.float64)
+
+        # leave previous link from its end nodes, enter link from its end nodes, where link direction allows
+        lengths = topology.link_lengths
+        prev_forward, prev_backward = self.router.get_link_passable(prev_links)
+        forward, backward = self.router.get_link_passable(links)
+        exit_nodes = np.concatenate((topology.link_snodes[prev_links], topology.link_enodes[prev_links]))
+        exit_costs = np.concatenate((np.where(prev_backward, prev_measures, np.inf),
+                                     np.where(prev_forward, lengths[prev_links] - prev_measures, np.inf)))
+        enter_nodes = np.concatenate((topology.link_snodes[links], topology.link_enodes[links]))
+        enter_costs = np.concatenate((np.where(forward, measures, np.inf),
+                                      np.where(backward, lengths[links] - measures, np.inf)))
+        exit_valid = (exit_nodes >= 0) & np.isfinite(exit_costs)
+        enter_valid = (enter_nodes >= 0) & np.isfinite(enter_costs)
+        sources = np.unique(exit_nodes[exit_valid])
+        targets = np.unique(enter_nodes[enter_valid])
+        if sources.shape[0] > 0 and targets.shape[0] > 0:
+            # all exit nodes are searched together
+            matrix = self.router.calc_distance_matrix(sources.tolist(), targets.tolist(), max_distance)
+            network = np.full((exit_nodes.shape[0], enter_nodes.shape[0]), np.inf, dtype=np.float64)
+            network[np.ix_(exit_valid, enter_valid)] = matrix[np.ix_(
+                np.searchsorted(sources, exit_nodes[exit_valid]), np.searchsorted(targets, enter_nodes[enter_valid]))]
+            costs = exit_costs[:, None] + network + enter_costs[None, :]
+            route = costs.reshape(2, prev_links.shape[0], 2, links.shape[0]).min(axis=(0, 2))
+
+        # along the same link by signed measure difference, a one way link is routed around when going back
+        same_link = prev_links[:, None] == links[None, :]
+        along = measures[None, :] - prev_measures[:, None]
+        passable = np.where(along >= 0.0, forward[None, :], backward[None, :])
+        along = np.where(passable, np.abs(along), np.inf)
+        return np.where(same_link, np.minimum(route, along), route)
+
+    def _calc_transition(self, prev_point, point, prev_candidates, candidates):
+        gps_distance = distance_process.calc_point_distance(prev_point, point)
+        route = self._calc_route_distances(prev_candidates, candidates, gps_distance)
+        return -np.abs(route - gps_distance) / self.transition_beta
+
+    def _flush(self, window, keep=0):
+        # decide all states but the last keep ones, by back tracking from best last state
+        if not window:
+            return list()
+        state = int(np.argmax(window[-1][3]))
+        states = [0] * len(window)
+        for i in range(len(window) - 1, -1, -1):
+            states[i] = state
+            back = window[i][4]
+            if back is not None:
+                state = int(back[state])
+        results = list()
+        for i in range(len(window) - keep):
+            index, _, candidates, _, _ = window[i]
+            links, measures, distances = candidates
+            state = states[i]
+            results.append((index, int(links[state]), float(measures[state]), float(distances[state])))
+        del window[:len(window) - keep]
+        if window:
+            window[0] = window[0][:4] + (None,)
+        return results
+
+    def match_stream(self, points):
+        """
+        fixed lag viterbi over a point stream, a point is decided once window_size later points arrive
+        :param points: iterable of gps points (longitude, latitude), in time order
+        :return: generator of (point index, link id, measure, distance), NO_LINK if point has no candidate
+        """
+        # window item is (point index, point, candidates, scores, back pointers)
+        window = list()
+        chunk = list()
+        index = 0
+        for point in points:
+            chunk.append((point[df.INDEX_LON], point[df.INDEX_LAT]))
+            if len(chunk) >= CHUNK_SIZE:
+                for result in self._match_chunk(chunk, index, window):
+                    yield result
+                index += len(chunk)
+                chunk = list()
+        if chunk:
+            for result in self._match_chunk(chunk, index, window):
+                yield result
+        for result in self._flush(window):
+            yield result
+
+    def _match_chunk(self, chunk, start_index, window):
+        all_candidates = self.find_candidates(chunk)
+        results = list()
+        for offset, candidates in enumerate(all_candidates):
+            index = start_index + offset
+            point = chunk[offset]
+            if candidates[0].shape[0] == 0:
+                results.extend(self._flush(window))
+                results.append((index, NO_LINK, 0.0, float('inf')))
+                continue
+
+            emission = self._calc_emission(candidates[2])
+            if not window:
+                window.append((index, point, candidates, emission, None))
+                continue
+            _, prev_point, prev_candidates, prev_scores, _ = window[-1]
+            scores = prev_scores[:, None] + self._calc_transition(prev_point, point, prev_candidates, candidates)
+            back = np.argmax(scores, axis=0)
+            best = scores[back, np.arange(scores.shape[1])]
+            if not np.any(np.isfinite(best)):
+                # no route from previous candidates, start a new chain
+                results.extend(self._flush(window))
+                window.append((index, point, candidates, emission, None))
+                continue
+            scores = best + emission
+            # keep scores in a safe range for long chains
+            scores = scores - np.max(scores[np.isfinite(scores)])
+            window.append((index, point, candidates, scores, back))
+            if len(window) > self.window_size:
+                results.extend(self._flush(window, self.window_size))
+        return results
+
+    def match(self, points):
+        """
+        :param points: gps points [(longitude, latitude)], in time order
+        :return: [(point index, link id, measure, distance)]
+        """
+        return list(self.match_stream(points))
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/9/27 2:20 PM 
+# @Author : yangyuxin
+# @File : network_analysis.py
+# 这个代码文件检查路网的健康状况：连通分量（孤岛）、节点度分布、断头路、孤立节点和未匹配的道路端点
+# 全部在紧凑拓扑的数组上计算，结果可以通过 FileWriter 写成图层
+
+
+import os
+import numpy as np
+import endpoint_snap
+import file_operator
+import compact_topology
+import topo_process_framework
+
+
+COMPONENT_FIELDS = ['link_id', 'fid', 'component', 'comp_links', 'comp_nodes']
+NODE_FIELDS = ['node_id', 'degree', 'component']
+ENDPOINT_FIELDS = ['link_id', 'fid', 'end']
+MISMATCH_FIELDS = ['node_id', 'recorded', 'counted']
+
+END_START = 'start'  # unmatched start point of link
+END_END = 'end'  # unmatched end point of link
+
+
+def to_compact(topology):
+    """
+    :param topology: CompactTopology, or TopoFramework / TopoFrameWork2 after init_topology
+    :return: CompactTopology
+    """
+    if isinstance(topology, compact_topology.CompactTopology):
+        return topology
+    return compact_topology.CompactTopology.from_framework(topology)
+
+
+def calc_components(topology):
+    """
+    connected components by union find over nodes and links, a link without nodes is a component itself
+    :param topology: CompactTopology
+    :return: component of every node, component of every link, link count of every component,
+             node count of every component. components are ordered by link count, the largest is 0
+    """
+    node_num = topology.get_node_num()
+    link_num = topology.get_link_num()
+    # items are nodes and then links, every link joins its end nodes
+    link_items = np.arange(link_num, dtype=np.int64) + node_num
+    items1 = list()
+    items2 = list()
+    for nodes in (topology.link_snodes, topology.link_enodes):
+        matched = nodes != compact_topology.NO_NODE
+        items1.append(link_items[matched])
+        items2.append(nodes[matched])
+    labels = endpoint_snap.calc_connected_labels(node_num + link_num, np.concatenate(items1),
+                                                 np.concatenate(items2))
+    _, components = np.unique(labels, return_inverse=True)
+    components = components.reshape(-1)
+    component_num = int(components.max()) + 1 if components.shape[0] else 0
+    link_counts = np.bincount(components[node_num:], minlength=component_num)
+    node_counts = np.bincount(components[:node_num], minlength=component_num)
+
+    # renumber by size, ties keep first appearance order
+    order = np.lexsort((np.arange(component_num), -node_counts, -link_counts))
+    ranks = np.empty(component_num, dtype=np.int64)
+    ranks[order] = np.arange(component_num)
+    components = ranks[components]
+    return components[:node_num], components[node_num:], link_counts[order], node_counts[order]
+
+
+def calc_degree_histogram(topology):
+    """
+    :param topology: CompactTopology
+    :return: count of nodes of every degree, numpy array indexed by degree
+    """
+    return np.bincount(topology.get_node_degrees())
+
+
+def find_dead_ends(topology):
+    """
+    :param topology: CompactTopology
+    :return: dead end node ids (degree 1), dangling link ids (links at dead end nodes)
+    """
+    degrees = topology.get_node_degrees()
+    nodes = np.flatnonzero(degrees == 1)
+    links = topology.node_links[topology.node_link_offsets[nodes]]
+    return nodes, np.unique(links)
+
+
+def find_isolated_nodes(topology):
+    """
+    :param topology: CompactTopology
+    :return: node ids without links
+    """
+    return np.flatnonzero(topology.get_node_degrees() == 0)
+
+
+def find_unmatched_endpoints(topology):
+    """
+    :param topology: CompactTopology
+    :return: link ids, is start point. every link endpoint without node is one item
+    """
+    starts = np.flatnonzero(topology.link_snodes == compact_topology.NO_NODE)
+    ends = np.flatnonzero(topology.link_enodes == compact_topology.NO_NODE)
+    links = np.concatenate((starts, ends))
+    is_starts = np.concatenate((np.ones(starts.shape[0], dtype=bool), np.zeros(ends.shape[0], dtype=bool)))
+    order = np.argsort(links, kind='stable')
+    return links[order], is_starts[order]
+
+
+def find_mismatched_degree_nodes(topo, topology=None):
+    """
+    nodes whose link_list does not agree with links pointing to them, e.g. after broken incremental updates
+    :param topo: TopoFramework or TopoFrameWork2 after init_topology
+    :param topology: CompactTopology.from_framework(topo), None converts topo
+    :return: node ids in topo.get_nodes() order, recorded degrees len(node.link_list), counted degrees
+    """
+    if topology is None:
+        topology = compact_topology.CompactTopology.from_framework(topo)
+    recorded = np.array([len(node.link_list) for node in topo.get_nodes()], dtype=np.int64)
+    counted = topology.get_node_degrees()
+    nodes = np.flatnonzero(recorded != counted)
+    return nodes, recorded[nodes], counted[nodes]
+
+
+def analyze_network(topology):
+    """
+    :param topology: CompactTopology, or TopoFramework / TopoFrameWork2 after init_topology
+    :return: summary dict of network health
+    """
+    topology = to_compact(topology)
+    _, _, link_counts, node_counts = calc_components(topology)
+    dead_end_nodes, dangling_links = find_dead_ends(topology)
+    unmatched_links, _ = find_unmatched_endpoints(topology)
+    return {
+        'links': topology.get_link_num(),
+        'nodes': topology.get_node_num(),
+        'components': int(link_counts.shape[0]),
+        'largest_component_links': int(link_counts[0]) if link_counts.shape[0] else 0,
+        'largest_component_nodes': int(node_counts[0]) if node_counts.shape[0] else 0,
+        'island_links': int(link_counts[1:].sum()),
+        'degree_histogram': calc_degree_histogram(topology).tolist(),
+        'dead_end_nodes': int(dead_end_nodes.shape[0]),
+        'dangling_links': int(dangling_links.shape[0]),
+        'isolated_nodes': int(find_isolated_nodes(topology).shape[0]),
+        'unmatched_endpoints': int(unmatched_links.shape[0]),
+    }
+
+
+def get_link_geometry(topology, link_id):
+    if topology.coords is not None:
+        return topo_process_framework.line_to_geometry(topology.get_link_points(link_id))
+    feature = topology.get_link_feature(link_id)
+    return feature.GetGeometryRef() if feature else None
+
+
+def iter_link_records(topology, link_ids, columns):
+    """
+    :param topology: CompactTopology
+    :param link_ids: link ids
+    :param columns: {field name: values aligned with link_ids}
+    :return: generator of (field_dict, link geometry) for FileWriter.write_features
+    """
+    names = list(columns.keys())
+    values = [np.asarray(columns[name]).tolist() for name in names]
+    for i, link_id in enumerate(np.asarray(link_ids).tolist()):
+        yield dict((name, column[i]) for name, column in zip(names, values)), get_link_geometry(topology, link_id)
+
+
+def write_network_report(topology, output_dir, extension='.mif', island_only=False):
+    """
+    write network health layers into output_dir:
+    components: links with their component, dead_ends and isolated_nodes: nodes, unmatched_endpoints: points
+    :param topology: CompactTopology, or TopoFramework / TopoFrameWork2 after init_topology
+    :param output_dir: output directory
+    :param extension: file extension of layers
+    :param island_only: components layer only has links outside the largest component
+    :return: {layer name: count of written features}
+    """
+    topology = to_compact(topology)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    counts = dict()
+    fids = topology.link_fids if topology.link_fids is not None else np.full(topology.get_link_num(), -1)
+
+    node_components, link_components, link_counts, node_counts = calc_components(topology)
+    links = np.flatnonzero(link_components > 0) if island_only else np.arange(topology.get_link_num())
+    components = link_components[links]
+    counts['components'] = file_operator.write_records(
+        os.path.join(output_dir, 'components' + extension), COMPONENT_FIELDS,
+        iter_link_records(topology, links, {'link_id': links, 'fid': fids[links], 'component': components,
+                                            'comp_links': link_counts[components],
+                                            'comp_nodes': node_counts[components]}))
+
+    degrees = topology.get_node_degrees()
+    dead_end_nodes, _ = find_dead_ends(topology)
+    isolated_nodes = find_isolated_nodes(topology)
+    for name, nodes in (('dead_ends', dead_end_nodes), ('isolated_nodes', isolated_nodes)):
+        counts[name] = file_operator.write_records(
+            os.path.join(output_dir, name + extension), NODE_FIELDS,
+            file_operator.iter_point_records(topology.node_points[nodes],
+                                             {'node_id': nodes, 'degree': degrees[nodes],
+                                              'component': node_components[nodes]}))
+
+    unmatched_links, is_starts = find_unmatched_endpoints(topology)
+    points = np.array([topology.get_link_points(link_id)[0 if is_start else -1] for link_id, is_start
+                       in zip(unmatched_links.tolist(), is_starts.tolist())], dtype=np.float64).reshape(-1, 2)
+    counts['unmatched_endpoints'] = file_operator.write_records(
+        os.path.join(output_dir, 'unmatched_endpoints' + extension), ENDPOINT_FIELDS,
+        file_operator.iter_point_records(points, {'link_id': unmatched_links, 'fid': fids[unmatched_links],
+                                                  'end': np.where(is_starts, END_START, END_END)}))
+    return counts
+
+
+def write_mismatched_degree_nodes(topo, file_path):
+    """
+    :param topo: TopoFramework or TopoFrameWork2 after init_topology
+    :param file_path: output file path
+    :return: count of written features, None if file can not be created
+    """
+    topology = compact_topology.CompactTopology.from_framework(topo)
+    nodes, recorded, counted = find_mismatched_degree_nodes(topo, topology)
+    return file_operator.write_records(file_path, MISMATCH_FIELDS,
+                                       file_operator.iter_point_records(topology.node_points[nodes],
+                                                                        {'node_id': nodes, 'recorded': recorded,
+                                                                         'counted': counted}))
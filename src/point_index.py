@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/4 9:30 AM 
+# @Author : yangyuxin
+# @File : point_index.py
+# 这个代码文件是点的空间索引，支持半径查询和 k 近邻查询，距离与 distance_process.calc_point_distance 相同
+# 网格按纬度分带，每一带的经度格子数按该带的最高纬度计算，格子在地面上接近正方形，经度方向首尾相接
+# 点按 (带, 格子) 排序，一个查询在每一带中要读取的点是连续的一段
+
+
+import math
+import numpy as np
+import data_define as df
+import distance_process
+import endpoint_snap
+import spatial_index
+
+
+POINTS_PER_CELL = 8  # points of one cell on average when cell size is not given
+MIN_CELL_SIZE = 10.0  # metre
+MAX_CELL_SIZE = 100000.0  # metre
+QUERY_CHUNK_SIZE = 4096  # queries computed at one time
+HALF_CIRCUMFERENCE = math.pi * distance_process.EARTH_RADIUS  # radius covering the whole earth, metre
+METRE_PER_DEGREE = distance_process.EARTH_RADIUS * math.pi / 180.0
+
+
+def calc_auto_cell_size(lons, lats, points_per_cell=POINTS_PER_CELL):
+    """
+    :param lons: longitudes of points
+    :param lats: latitudes of points
+    :param points_per_cell: points of one cell on average in bounding box
+    :return: cell size. the unit is metre
+    """
+    if lons.shape[0] == 0:
+        return MAX_CELL_SIZE
+    mean_cos = math.cos(distance_process.rad(float(np.mean(lats))))
+    width = (float(lons.max()) - float(lons.min())) * METRE_PER_DEGREE * max(mean_cos, df.ZERO_THRESHOLD)
+    height = (float(lats.max()) - float(lats.min())) * METRE_PER_DEGREE
+    area = max(width, MIN_CELL_SIZE) * max(height, MIN_CELL_SIZE)
+    cell_size = math.sqrt(area * points_per_cell / lons.shape[0])
+    return min(max(cell_size, MIN_CELL_SIZE), MAX_CELL_SIZE)
+
+
+class PointIndex(object):
+    """
+    lat band grid of points. distances are haversine distances of calc_distance_array, so results are exact,
+    a point is inside radius if its distance is not larger than radius
+    """
+    def __init__(self, points, cell_size=None):
+        """
+        :param points: points [(longitude, latitude)] or numpy array of shape (n, 2)
+        :param cell_size: cell size, None sizes cells by point density. the unit is metre
+        """
+        points = distance_process.to_point_array(points)
+        lons = points[:, df.INDEX_LON]
+        lats = points[:, df.INDEX_LAT]
+        self.cell_size = float(cell_size) if cell_size else calc_auto_cell_size(lons, lats)
+        self.lat_cell = self.cell_size / METRE_PER_DEGREE
+        self.row_num = max(1, int(math.ceil(180.0 / self.lat_cell)))
+        # cells of every band, band width on its highest latitude is not smaller than cell size
+        band_south = np.arange(self.row_num) * self.lat_cell - 90.0
+        band_max_lats = np.minimum(np.maximum(np.abs(band_south), np.abs(band_south + self.lat_cell)),
+                                   endpoint_snap.MAX_CELL_LATITUDE)
+        self.row_cols = np.maximum(np.floor(360.0 * np.cos(band_max_lats * math.pi / 180.0)
+                                            / self.lat_cell), 1).astype(np.int64)
+        self.row_lon_cells = 360.0 / self.row_cols
+
+        rows = self._get_rows(lats)
+        cols = self._get_cols(lons, rows)
+        keys = self._get_keys(rows, cols)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        self.lons = lons[self.order]
+        self.lats = lats[self.order]
+        self.min_row = int(rows.min()) if rows.shape[0] else 0
+        self.max_row = int(rows.max()) if rows.shape[0] else -1
+
+    def __len__(self):
+        return self.order.shape[0]
+
+    def _get_rows(self, lats):
+        return np.clip(np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / self.lat_cell),
+                       0, self.row_num - 1).astype(np.int64)
+
+    def _get_cols(self, lons, rows):
+        cols = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / self.row_lon_cells[rows]).astype(np.int64)
+        return np.mod(cols, self.row_cols[rows])
+
+    @staticmethod
+    def _get_keys(rows, cols):
+        # row major, cells of one band are continuous
+        return (rows << 32) + cols
+
+    def _find_candidates(self, lons, lats, radiuses):
+        """
+        :param lons: longitudes of query points
+        :param lats: latitudes of query points
+        :param radiuses: search radius of every query. the unit is metre
+        :return: query index of every candidate, sorted position of every candidate. not ordered
+        """
+        lat_buffers = radiuses / METRE_PER_DEGREE
+        lon_buffers, _ = distance_process.calc_degree_buffer(lats, radiuses)
+        # bands touching pole cover all longitudes
+        polar = (lats + lat_buffers >= 90.0) | (lats - lat_buffers <= -90.0)
+        lon_buffers = np.where(polar, 180.0, lon_buffers)
+        first_rows = np.maximum(self._get_rows(lats - lat_buffers), self.min_row)
+        last_rows = np.minimum(self._get_rows(lats + lat_buffers), self.max_row)
+        rows, queries = spatial_index.expand_ranges(first_rows, last_rows + 1)
+        if rows.shape[0] == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        row_cols = self.row_cols[rows]
+        lon_cells = self.row_lon_cells[rows]
+        first_cols = np.floor((lons[queries] - lon_buffers[queries] + 180.0) / lon_cells).astype(np.int64)
+        last_cols = np.floor((lons[queries] + lon_buffers[queries] + 180.0) / lon_cells).astype(np.int64)
+        full = (last_cols - first_cols + 1 >= row_cols) | (lon_buffers[queries] >= 180.0)
+        first_cols = np.where(full, 0, np.mod(first_cols, row_cols))
+        last_cols = np.where(full, row_cols - 1, np.mod(last_cols, row_cols))
+        # column range crossing 180 degree is split into two ranges
+        wrapped = first_cols > last_cols
+        range_rows = np.concatenate((rows, rows[wrapped]))
+        range_queries = np.concatenate((queries, queries[wrapped]))
+        range_firsts = np.concatenate((first_cols, np.zeros(int(wrapped.sum()), dtype=np.int64)))
+        range_lasts = np.concatenate((np.where(wrapped, row_cols - 1, last_cols), last_cols[wrapped]))
+
+        starts = np.searchsorted(self.keys, self._get_keys(range_rows, range_firsts), side='left')
+        ends = np.searchsorted(self.keys, self._get_keys(range_rows, range_lasts), side='right')
+        positions, ranges = spatial_index.expand_ranges(starts, ends)
+        return range_queries[ranges], positions
+
+    def query_radius_batch(self, points, radius, chunk_size=QUERY_CHUNK_SIZE):
+        """
+        :param points: query points [(longitude, latitude)] or numpy array of shape (n, 2)
+        :param radius: search radius, a number or one for every query point. the unit is metre
+        :param chunk_size: queries computed at one time
+        :return: query indexes, point indexes, distances. sorted by query, then distance, then point index
+        """
+        points = distance_process.to_point_array(points)
+        query_num = points.shape[0]
+        radiuses = np.broadcast_to(np.asarray(radius, dtype=np.float64), (query_num,))
+        results = list()
+        for start in range(0, query_num, chunk_size):
+            end = min(start + chunk_size, query_num)
+            lons = points[start:end, df.INDEX_LON]
+            lats = points[start:end, df.INDEX_LAT]
+            chunk_radiuses = radiuses[start:end]
+            queries, positions = self._find_candidates(lons, lats, chunk_radiuses)
+            distances = distance_process.calc_distance_array(lons[queries], lats[queries], self.lons[positions],
+                                                             self.lats[positions], distance_process.PRECISION_HAVERSINE)
+            inside = distances <= chunk_radiuses[queries]
+            queries = queries[inside]
+            indexes = self.order[positions[inside]]
+            distances = distances[inside]
+            order = np.lexsort((indexes, distances, queries))
+            results.append((queries[order] + start, indexes[order], distances[order]))
+        if not results:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.float64)
+        return (np.concatenate([result[0] for result in results]),
+                np.concatenate([result[1] for result in results]),
+                np.concatenate([result[2] for result in results]))
+
+    def query_radius(self, point, radius):
+        """
+        :param point: query point (longitude, latitude)
+        :param radius: search radius. the unit is metre
+        :return: point indexes, distances. sorted by distance
+        """
+        _, indexes, distances = self.query_radius_batch([point], radius)
+        return indexes, distances
+
+    def _get_start_radius(self, k):
+        # radius holding k points if they are spread like points in one cell
+        return self.cell_size * max(0.5, math.sqrt(k / float(POINTS_PER_CELL)))
+
+    def query_knn_batch(self, points, k, max_radius=None, chunk_size=QUERY_CHUNK_SIZE):
+        """
+        radius of every query grows until k points are inside, so the k nearest are exact
+        :param points: query points [(longitude, latitude)] or numpy array of shape (n, 2)
+        :param k: count of nearest points
+        :param max_radius: points farther than it are not returned, None searches the whole earth. the unit is metre
+        :param chunk_size: queries computed at one time
+        :return: point indexes (n, k), distances (n, k). sorted by distance, -1 and inf fill missing ones
+        """
+        points = distance_process.to_point_array(points)
+        query_num = points.shape[0]
+        k = max(1, int(k))
+        indexes = np.full((query_num, k), -1, dtype=np.int64)
+        distances = np.full((query_num, k), np.inf, dtype=np.float64)
+        if query_num == 0 or len(self) == 0:
+            return indexes, distances
+        limit = HALF_CIRCUMFERENCE if max_radius is None else min(float(max_radius), HALF_CIRCUMFERENCE)
+
+        remain = np.arange(query_num)
+        radiuses = np.full(query_num, min(self._get_start_radius(k), limit), dtype=np.float64)
+        while remain.shape[0] > 0:
+            queries, found, found_distances = self.query_radius_batch(points[remain], radiuses[remain], chunk_size)
+            counts = np.bincount(queries, minlength=remain.shape[0])
+            done = (counts >= k) | (radiuses[remain] >= limit)
+            # first k results of every finished query
+            firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            ranks = np.arange(queries.shape[0]) - firsts[queries]
+            take = done[queries] & (ranks < k)
+            rows = remain[queries[take]]
+            indexes[rows, ranks[take]] = found[take]
+            distances[rows, ranks[take]] = found_distances[take]
+
+            remain_counts = counts[~done]
+            remain = remain[~done]
+            # grow radius by expected density, at least twice
+            scales = np.where(remain_counts > 0, np.sqrt(k / np.maximum(remain_counts, 1).astype(np.float64)), 2.0)
+            radiuses[remain] = np.minimum(radiuses[remain] * np.maximum(scales * 1.2, 2.0), limit)
+        return indexes, distances
+
+    def query_knn(self, point, k, max_radius=None):
+        """
+        :param point: query point (longitude, latitude)
+        :param k: count of nearest points
+        :param max_radius: points farther than it are not returned. the unit is metre
+        :return: point indexes, distances. sorted by distance, only found points
+        """
+        indexes, distances = self.query_knn_batch([point], k, max_radius)
+        found = indexes[0] >= 0
+        return indexes[0][found], distances[0][found]
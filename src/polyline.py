@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/6/7 3:12 PM 
+# @Author : yangyuxin
+# @File : polyline.py
+# 这个代码文件用来处理线的线性参考问题，坐标和累计长度只计算一次
+# 长度和里程的单位均为米
+# PolylineSet 把多条线存放在一个坐标数组中，一次定位很多 (点, 线) 对
+
+
+import numpy as np
+import data_define as df
+import distance_process
+import spatial_index
+
+
+LOCATE_CHUNK_SEGMENTS = 1 << 19  # point-segment pairs located at one time
+
+
+def calc_line_measures(coords, offsets):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :return: cumulative length of every point over all lines, it does not grow between two lines
+    """
+    measures = np.zeros(coords.shape[0], dtype=np.float64)
+    if coords.shape[0] <= 1:
+        return measures
+    segment_lengths = distance_process.calc_distance_array(coords[:-1, df.INDEX_LON], coords[:-1, df.INDEX_LAT],
+                                                           coords[1:, df.INDEX_LON], coords[1:, df.INDEX_LAT])
+    boundaries = offsets[1:-1] - 1
+    segment_lengths[boundaries[(boundaries >= 0) & (boundaries < segment_lengths.shape[0])]] = 0.0
+    measures[1:] = np.cumsum(segment_lengths)
+    return measures
+
+
+class Polyline(object):
+    """
+    array backed line with cumulative length prefix array.
+    measure is the length from start point along the line, the unit is metre.
+    """
+    def __init__(self, line):
+        """
+        :param line: line [points] or numpy array of shape (n, 2)
+        """
+        self.points = distance_process.to_point_array(line)
+        if self.points.shape[0] > 1:
+            segment_lengths = distance_process.calc_distance_array(
+                self.points[:-1, df.INDEX_LON], self.points[:-1, df.INDEX_LAT],
+                self.points[1:, df.INDEX_LON], self.points[1:, df.INDEX_LAT])
+            self.measures = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+        else:
+            self.measures = np.zeros(self.points.shape[0], dtype=np.float64)
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    def get_length(self):
+        """
+        :return: length of line. the unit is metre
+        """
+        if self.points.shape[0] == 0:
+            return 0.0
+        return float(self.measures[-1])
+
+    def get_points(self):
+        """
+        :return: line [points]
+        """
+        return [(lon, lat) for lon, lat in self.points.tolist()]
+
+    def _locate_measures(self, measures):
+        # return segment indexes and percents of measures on their segments
+        measures = np.clip(np.asarray(measures, dtype=np.float64), 0.0, self.get_length())
+        indexes = np.searchsorted(self.measures, measures, side='right') - 1
+        indexes = np.clip(indexes, 0, self.points.shape[0] - 2)
+        segment_lengths = self.measures[indexes + 1] - self.measures[indexes]
+        offsets = measures - self.measures[indexes]
+        percents = np.where(segment_lengths > 0.0, offsets / np.where(segment_lengths > 0.0, segment_lengths, 1.0), 0.0)
+        return indexes, np.clip(percents, 0.0, 1.0)
+
+    def interpolate_batch(self, measures):
+        """
+        :param measures: measures along line, clipped to [0, length]
+        :return: points at measures, numpy array of shape (n, 2). None if line is empty
+        """
+        if self.points.shape[0] == 0:
+            return None
+        measures = np.asarray(measures, dtype=np.float64).reshape(-1)
+        if self.points.shape[0] == 1:
+            return np.repeat(self.points, measures.shape[0], axis=0)
+        indexes, percents = self._locate_measures(measures)
+        s_points = self.points[indexes]
+        e_points = self.points[indexes + 1]
+        # same as distance_process.calc_mid_point_by_percent
+        return s_points + percents[:, None] * (e_points - s_points)
+
+    def interpolate(self, measure):
+        """
+        :param measure: measure along line
+        :return: point at measure (longitude, latitude). None if line is empty
+        """
+        points = self.interpolate_batch([measure])
+        if points is None:
+            return None
+        return float(points[0, df.INDEX_LON]), float(points[0, df.INDEX_LAT])
+
+    def locate_points(self, points):
+        """
+        :param points: points [(longitude, latitude)]
+        :return: measures of nearest points on line, distances from points to line. None if line is empty
+        """
+        result = distance_process.calc_nearest_points_on_line(points, self.points)
+        if result is None:
+            return None
+        nearest, indexes, distances = result
+        if self.points.shape[0] == 1:
+            return np.zeros(indexes.shape[0], dtype=np.float64), distances
+        s_points = self.points[indexes]
+        offsets = distance_process.calc_distance_array(s_points[:, 0], s_points[:, 1],
+                                                       nearest[:, 0], nearest[:, 1])
+        segment_lengths = self.measures[indexes + 1] - self.measures[indexes]
+        measures = self.measures[indexes] + np.minimum(offsets, segment_lengths)
+        return measures, distances
+
+    def locate_point(self, point):
+        """
+        :param point: point (longitude, latitude)
+        :return: measure of nearest point on line. None if line is empty
+        """
+        result = self.locate_points([point])
+        if result is None:
+            return None
+        return float(result[0][0])
+
+    def substring_batch(self, ranges):
+        """
+        :param ranges: [(start measure, end measure)]
+        :return: lines [line], empty line if range is empty
+        """
+        ranges = np.asarray(ranges, dtype=np.float64).reshape(-1, 2)
+        if self.points.shape[0] <= 1 or ranges.shape[0] == 0:
+            return [list() for _ in range(ranges.shape[0])]
+
+        length = self.get_length()
+        starts = np.clip(ranges[:, 0], 0.0, length)
+        ends = np.clip(ranges[:, 1], 0.0, length)
+        s_points = self.interpolate_batch(starts).tolist()
+        e_points = self.interpolate_batch(ends).tolist()
+        # vertexes strictly inside (start, end)
+        first_indexes = np.searchsorted(self.measures, starts, side='right')
+        last_indexes = np.searchsorted(self.measures, ends, side='left')
+
+        lines = list()
+        for i in range(ranges.shape[0]):
+            if starts[i] >= ends[i]:
+                lines.append(list())
+                continue
+            part_line = [tuple(s_points[i])]
+            part_line.extend(tuple(point) for point in self.points[first_indexes[i]:last_indexes[i]].tolist())
+            part_line.append(tuple(e_points[i]))
+            lines.append(part_line)
+        return lines
+
+    def substring(self, start, end):
+        """
+        :param start: start measure
+        :param end: end measure
+        :return: part line between two measures
+        """
+        return self.substring_batch([(start, end)])[0]
+
+    def substring_by_percent(self, start_percent, end_percent):
+        """
+        :param start_percent: start percent of line
+        :param end_percent: end percent of line
+        :return: part line between two percents
+        """
+        length = self.get_length()
+        return self.substring(length * start_percent, length * end_percent)
+
+    def get_start_part_by_length(self, length):
+        """
+        :param length: length of start part
+        :return: start part line
+        """
+        if len(self) <= 1 or length <= 0.0:
+            return list()
+        return self.substring(0.0, length)
+
+    def get_end_part_by_length(self, length):
+        """
+        :param length: length of end part
+        :return: end part line, in the direction of line
+        """
+        if len(self) <= 1 or length <= 0.0:
+            return list()
+        line_length = self.get_length()
+        return self.substring(line_length - length, line_length)
+
+    def get_start_part_by_percent(self, percent):
+        """
+        :param percent: percent of start part
+        :return: start part line
+        """
+        if percent <= 0.0:
+            return list()
+        if percent >= 1.0:
+            return self.get_points()
+        return self.get_start_part_by_length(self.get_length() * percent)
+
+    def get_end_part_by_percent(self, percent):
+        """
+        :param percent: percent of end part
+        :return: end part line, in the direction of line
+        """
+        if percent <= 0.0:
+            return list()
+        if percent >= 1.0:
+            return self.get_points()
+        return self.get_end_part_by_length(self.get_length() * percent)
+
+    def split_by_length(self, length):
+        """
+        :param length: length of one part
+        :return: lines [line], the last part holds the remaining length
+        """
+        if len(self) <= 1 or length <= 0.0:
+            return list()
+        line_length = self.get_length()
+        starts = np.arange(0.0, line_length, length)
+        if starts.shape[0] == 0:
+            return [self.get_points()]
+        ends = np.append(starts[1:], line_length)
+        return self.substring_batch(np.stack((starts, ends), axis=1))
+
+
+class PolylineSet(object):
+    """
+    many lines in one coordinate array, in the format of compact_topology.read_line_buffer.
+    nearest points of many (point, line) pairs are computed at once
+    """
+    def __init__(self, coords, offsets):
+        """
+        :param coords: points of all lines, numpy array of shape (n, 2)
+        :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+        """
+        self.coords = coords
+        self.offsets = offsets
+        # cumulative length and unit vector of every point
+        self.measures = calc_line_measures(coords, offsets)
+        self.xyz = distance_process.lonlat_to_xyz_array(coords[:, df.INDEX_LON], coords[:, df.INDEX_LAT])
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def locate_points(self, points, lines, chunk_size=LOCATE_CHUNK_SEGMENTS):
+        """
+        :param points: points, numpy array of shape (n, 2)
+        :param lines: line index of every point
+        :param chunk_size: point-segment pairs computed at one time, a long line is never split
+        :return: measures on lines, distances to lines, nearest points numpy array of shape (n, 2).
+                 distance is inf if line has no point
+        """
+        pair_num = points.shape[0]
+        measures = np.zeros(pair_num, dtype=np.float64)
+        distances = np.full(pair_num, np.inf, dtype=np.float64)
+        nearest = np.array(points, dtype=np.float64).reshape(-1, 2)
+        # chunks hold about chunk_size segments, pairs on lines without segment still cost one
+        segment_ends = np.cumsum(np.maximum(self.offsets[lines + 1] - self.offsets[lines] - 1, 1))
+        start = 0
+        while start < pair_num:
+            limit = (segment_ends[start - 1] if start > 0 else 0) + chunk_size
+            end = max(int(np.searchsorted(segment_ends, limit, side='right')), start + 1)
+            measures[start:end], distances[start:end], nearest[start:end] = self._locate_chunk(
+                points[start:end], lines[start:end])
+            start = end
+        return measures, distances, nearest
+
+    def _locate_chunk(self, points, lines):
+        coords = self.coords
+        xyz = self.xyz
+        pair_num = points.shape[0]
+        measures = np.zeros(pair_num, dtype=np.float64)
+        distances = np.full(pair_num, np.inf, dtype=np.float64)
+        nearest = np.array(points, dtype=np.float64)
+        starts = self.offsets[lines]
+        point_nums = self.offsets[lines + 1] - starts
+        # line of one point is its only point
+        single = point_nums == 1
+        nearest[single] = coords[starts[single]]
+
+        segments, pairs = spatial_index.expand_ranges(starts, starts + np.maximum(point_nums - 1, 0))
+        if segments.shape[0] > 0:
+            p_xyz = distance_process.lonlat_to_xyz_array(points[:, 0], points[:, 1])[pairs]
+            s_xyz = xyz[segments]
+            e_xyz = xyz[segments + 1]
+            segment_distances = distance_process.calc_segment_distances(p_xyz, s_xyz, e_xyz)
+            # first nearest segment of every pair, pairs are in order
+            order = np.lexsort((segments, segment_distances, pairs))
+            firsts = order[np.searchsorted(pairs[order], np.unique(pairs))]
+            rows = pairs[firsts]
+            best = segments[firsts]
+            p_xyz = p_xyz[firsts]
+            s_xyz = s_xyz[firsts]
+            e_xyz = e_xyz[firsts]
+
+            normal = np.cross(s_xyz, e_xyz)
+            normal_length = np.sqrt(np.sum(normal * normal, axis=1))
+            valid = normal_length > df.SAME_POINT_DISTANCE / distance_process.EARTH_RADIUS
+            unit_normal = normal / np.where(valid, normal_length, 1.0)[:, None]
+            inside = (valid & (np.sum(p_xyz * np.cross(unit_normal, s_xyz), axis=1) >= 0.0)
+                      & (np.sum(p_xyz * np.cross(e_xyz, unit_normal), axis=1) >= 0.0))
+            projected = p_xyz - np.sum(p_xyz * unit_normal, axis=1)[:, None] * unit_normal
+            near_end = np.sum(p_xyz * e_xyz, axis=1) > np.sum(p_xyz * s_xyz, axis=1)
+            best_points = np.where(near_end[:, None], coords[best + 1], coords[best])
+            if np.any(inside):
+                best_points[inside] = distance_process.xyz_array_to_lonlat(projected[inside])
+            nearest[rows] = best_points
+
+            segment_lengths = self.measures[best + 1] - self.measures[best]
+            along = distance_process.calc_distance_array(coords[best, 0], coords[best, 1],
+                                                         best_points[:, 0], best_points[:, 1])
+            measures[rows] = self.measures[best] - self.measures[starts[rows]] + np.minimum(along, segment_lengths)
+
+        has_point = point_nums > 0
+        distances[has_point] = distance_process.calc_distance_array(
+            points[has_point, 0], points[has_point, 1], nearest[has_point, 0], nearest[has_point, 1])
+        return measures, distances, nearest
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/9/13 4:50 PM 
+# @Author : yangyuxin
+# @File : query_client.py
+# 这个代码文件是 query_service 的客户端，只依赖标准库，可以被其他服务直接引用
+# 多个请求可以一次发出再按 id 收回结果，服务端会把它们合并成批计算
+
+
+import json
+import socket
+import itertools
+
+
+CONNECT_TIMEOUT = 5.0  # second
+
+
+class QueryError(Exception):
+    """
+    error answered by query service
+    """
+    pass
+
+
+class QueryClient(object):
+    """
+    blocking client of one connection, not shared between threads
+    """
+    def __init__(self, path=None, host='127.0.0.1', port=8765, timeout=CONNECT_TIMEOUT):
+        """
+        :param path: unix socket path, used if it is given
+        :param host: tcp host
+        :param port: tcp port
+        :param timeout: socket timeout. the unit is second
+        """
+        if path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port), timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        self._ids = itertools.count(1)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def request_many(self, requests):
+        """
+        send all requests before reading responses
+        :param requests: [(op, params dict)]
+        :return: [result or QueryError] in request order
+        """
+        ids = list()
+        lines = list()
+        for op, params in requests:
+            request_id = next(self._ids)
+            message = dict(params)
+            message['id'] = request_id
+            message['op'] = op
+            ids.append(request_id)
+            lines.append(json.dumps(message))
+        self.sock.sendall(('\n'.join(lines) + '\n').encode('utf-8'))
+
+        responses = dict()
+        while len(responses) < len(ids):
+            line = self.reader.readline()
+            if not line:
+                raise ConnectionError("connection closed by query service")
+            response = json.loads(line.decode('utf-8'))
+            responses[response.get('id')] = response
+        results = list()
+        for request_id in ids:
+            response = responses[request_id]
+            if 'error' in response:
+                results.append(QueryError(response['error']))
+            else:
+                results.append(response.get('result'))
+        return results
+
+    def request(self, op, params):
+        """
+        :param op: query_service.OP_*
+        :param params: params dict
+        :return: result of request, raise QueryError if service answers error
+        """
+        result = self.request_many([(op, params)])[0]
+        if isinstance(result, QueryError):
+            raise result
+        return result
+
+    def find_nearest_road(self, point, radius=None):
+        """
+        :param point: (longitude, latitude)
+        :param radius: search radius, None uses service default. the unit is metre
+        :return: {"link", "fid", "measure", "distance", "point"}, None if no road is inside radius
+        """
+        params = {'point': list(point)}
+        if radius is not None:
+            params['radius'] = radius
+        return self.request('nearest', params)
+
+    def calc_point_to_road_distance(self, point, link_id):
+        """
+        :param point: (longitude, latitude)
+        :param link_id: link id of service topology
+        :return: distance. the unit is metre
+        """
+        return self.request('distance', {'point': list(point), 'link': link_id})['distance']
+
+    def calc_route_distance(self, source, target, max_distance=None):
+        """
+        :param source: (longitude, latitude)
+        :param target: (longitude, latitude)
+        :param max_distance: route search limit, None uses service default. the unit is metre
+        :return: road network distance between nearest roads of points, None if not reachable
+        """
+        params = {'source': list(source), 'target': list(target)}
+        if max_distance is not None:
+            params['max_distance'] = max_distance
+        return self.request('route', params)['distance']
+
+    def get_stats(self):
+        """
+        :return: {op: {'batches': n, 'requests': n}}
+        """
+        return self.request('stats', {})
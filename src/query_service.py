@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/9/13 3:40 PM 
+# @Author : yangyuxin
+# @File : query_service.py
+# 这个代码文件是本机的道路查询服务，拓扑和空间索引只加载一次，提供最近道路、点到道路距离和路网距离查询
+# 同时到达的请求按类型合并成一批，用向量化的方式一起计算，协议为一行一个 json，支持 unix socket 和本机 tcp
+#
+# python src/query_service.py --road-file road.shp --cache-dir road_cache --unix /tmp/road_query.sock
+
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import concurrent.futures
+import numpy as np
+import data_define as df
+import distance_process
+import file_operator
+import compact_topology
+import polyline
+import route_process
+import spatial_index
+import topology_cache
+
+
+SEARCH_RADIUS = 50.0  # default nearest road search radius, metre
+MAX_SEARCH_RADIUS = 5000.0  # max search radius of one request, metre
+ROUTE_MAX_DISTANCE = 50000.0  # default route search limit, metre
+BATCH_SIZE = 256  # max requests of one batch
+BATCH_WAIT = 0.002  # time waiting for more requests after the first one of a batch, second
+MAX_LINE_SIZE = 1024 * 1024  # max bytes of one request line
+
+OP_NEAREST = 'nearest'  # {"point": [lon, lat], "radius": metre} -> nearest road
+OP_DISTANCE = 'distance'  # {"point": [lon, lat], "link": link id} -> distance to the road
+OP_ROUTE = 'route'  # {"source": [lon, lat], "target": [lon, lat], "max_distance": metre} -> road network distance
+
+
+def parse_point(value):
+    """
+    :param value: [longitude, latitude]
+    :return: (longitude, latitude)
+    """
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("point must be [longitude, latitude]")
+    lon, lat = float(value[df.INDEX_LON]), float(value[df.INDEX_LAT])
+    if not (-180.0 <= lon <= 180.0 and -90.0 <= lat <= 90.0):
+        raise ValueError("point out of range: %r" % (value,))
+    return lon, lat
+
+
+def parse_number(value, default, max_value=None):
+    if value is None:
+        return default
+    value = float(value)
+    if not value >= 0.0:
+        raise ValueError("number must not be negative: %r" % value)
+    return min(value, max_value) if max_value is not None else value
+
+
+class QueryEngine(object):
+    """
+    batch queries on CompactTopology, every method answers many requests at once.
+    results are plain python values and can be dumped into json directly.
+    """
+    def __init__(self, topology, router=None, search_radius=SEARCH_RADIUS):
+        """
+        :param topology: CompactTopology with link coordinates
+        :param router: route_process.Router of topology, None creates a two way router
+        :param search_radius: default nearest road search radius. the unit is metre
+        """
+        self.topology = topology
+        self.router = router if router else route_process.Router(topology)
+        self.index = spatial_index.PackedRTree(topology.get_link_boxes())
+        self.lines = polyline.PolylineSet(topology.coords, topology.coord_offsets)
+        self.search_radius = search_radius
+
+    def find_nearest_links(self, points, radiuses):
+        """
+        :param points: points, numpy array of shape (n, 2)
+        :param radiuses: search radius of every point, numpy array. the unit is metre
+        :return: link ids, measures, distances, nearest points. link id is -1 if no road is inside radius
+        """
+        point_num = points.shape[0]
+        nearest_points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        nearest_links = np.full(point_num, -1, dtype=np.int64)
+        nearest_measures = np.zeros(point_num, dtype=np.float64)
+        nearest_distances = np.full(point_num, np.inf, dtype=np.float64)
+        if point_num == 0 or self.topology.get_link_num() == 0:
+            return nearest_links, nearest_measures, nearest_distances, nearest_points
+        queries, links = self.index.query_batch(distance_process.calc_buffer_boxes(points, radiuses))
+        measures, distances, located = self.lines.locate_points(points[queries], links)
+
+        near = distances <= radiuses[queries]
+        queries = queries[near]
+        # nearest link of every point is the first one ordered by distance
+        order = np.lexsort((links[near], distances[near], queries))
+        firsts = order[np.searchsorted(queries[order], np.unique(queries))]
+        rows = queries[firsts]
+        nearest_links[rows] = links[near][firsts]
+        nearest_measures[rows] = measures[near][firsts]
+        nearest_distances[rows] = distances[near][firsts]
+        nearest_points[rows] = located[near][firsts]
+        return nearest_links, nearest_measures, nearest_distances, nearest_points
+
+    def _make_link_result(self, link_id, measure, distance, point):
+        fids = self.topology.link_fids
+        return {
+            'link': link_id,
+            'fid': int(fids[link_id]) if fids is not None else None,
+            'measure': measure,
+            'distance': distance if np.isfinite(distance) else None,
+            'point': point if np.isfinite(distance) else None,
+        }
+
+    def query_nearest(self, requests):
+        """
+        :param requests: [{"point": [lon, lat], "radius": metre}]
+        :return: [{"link", "fid", "measure", "distance", "point"} or None]
+        """
+        points = np.array([parse_point(request.get('point')) for request in requests], dtype=np.float64).reshape(-1, 2)
+        radiuses = np.array([parse_number(request.get('radius'), self.search_radius, MAX_SEARCH_RADIUS)
+                             for request in requests], dtype=np.float64)
+        links, measures, distances, nearest = self.find_nearest_links(points, radiuses)
+        results = list()
+        for link_id, measure, distance, point in zip(links.tolist(), measures.tolist(), distances.tolist(),
+                                                     nearest.tolist()):
+            results.append(self._make_link_result(link_id, measure, distance, point) if link_id >= 0 else None)
+        return results
+
+    def query_distance(self, requests):
+        """
+        :param requests: [{"point": [lon, lat], "link": link id}]
+        :return: [{"link", "fid", "measure", "distance", "point"}]
+        """
+        points = np.array([parse_point(request.get('point')) for request in requests], dtype=np.float64).reshape(-1, 2)
+        links = np.array([int(request.get('link', -1)) for request in requests], dtype=np.int64)
+        if np.any((links < 0) | (links >= self.topology.get_link_num())):
+            raise ValueError("unknown link id")
+        measures, distances, nearest = self.lines.locate_points(points, links)
+        return [self._make_link_result(link_id, measure, distance, point)
+                for link_id, measure, distance, point in zip(links.tolist(), measures.tolist(), distances.tolist(),
+                                                             nearest.tolist())]
+
+    def query_route(self, requests):
+        """
+        road network distance between nearest roads of source and target.
+        parts of the source and target roads are passed in any direction
+        :param requests: [{"source": [lon, lat], "target": [lon, lat], "max_distance": metre}]
+        :return: [{"distance", "source_link", "target_link"}], distance is None if not reachable
+        """
+        request_num = len(requests)
+        sources = [parse_point(request.get('source')) for request in requests]
+        targets = [parse_point(request.get('target')) for request in requests]
+        max_distances = [parse_number(request.get('max_distance'), ROUTE_MAX_DISTANCE) for request in requests]
+        points = np.array(sources + targets, dtype=np.float64).reshape(-1, 2)
+        radiuses = np.full(points.shape[0], self.search_radius, dtype=np.float64)
+        links, measures, _, _ = self.find_nearest_links(points, radiuses)
+        s_links, t_links = links[:request_num], links[request_num:]
+        s_measures, t_measures = measures[:request_num], measures[request_num:]
+
+        topology = self.topology
+        lengths = topology.link_lengths
+        # (node, cost) leaving source road from its two ends, entering target road from its two ends
+        exits = list()
+        enters = list()
+        node_targets = dict()
+        for i in range(request_num):
+            s_link, t_link = int(s_links[i]), int(t_links[i])
+            if s_link < 0 or t_link < 0:
+                exits.append(list())
+                enters.append(list())
+                continue
+            s_measure, t_measure = float(s_measures[i]), float(t_measures[i])
+            exits.append([(int(topology.link_snodes[s_link]), s_measure),
+                          (int(topology.link_enodes[s_link]), float(lengths[s_link]) - s_measure)])
+            enters.append([(int(topology.link_snodes[t_link]), t_measure),
+                           (int(topology.link_enodes[t_link]), float(lengths[t_link]) - t_measure)])
+            for exit_node, _ in exits[i]:
+                if exit_node < 0:
+                    continue
+                node_target = node_targets.setdefault(exit_node, [set(), 0.0])
+                node_target[0].update(node for node, _ in enters[i] if node >= 0)
+                node_target[1] = max(node_target[1], max_distances[i])
+
+        # one search from every exit node serves all requests leaving from it
+        node_distances = dict()
+        for exit_node, (target_nodes, max_distance) in node_targets.items():
+            node_distances[exit_node] = self.router.shortest_distances(exit_node, target_nodes, max_distance)
+
+        results = list()
+        for i in range(request_num):
+            s_link, t_link = int(s_links[i]), int(t_links[i])
+            if s_link < 0 or t_link < 0:
+                results.append({'distance': None, 'source_link': None if s_link < 0 else s_link,
+                                'target_link': None if t_link < 0 else t_link})
+                continue
+            best = float('inf')
+            if s_link == t_link:
+                best = abs(float(t_measures[i]) - float(s_measures[i]))
+            for exit_node, exit_cost in exits[i]:
+                reach = node_distances.get(exit_node)
+                if not reach:
+                    continue
+                for enter_node, enter_cost in enters[i]:
+                    if enter_node in reach:
+                        best = min(best, exit_cost + reach[enter_node] + enter_cost)
+            distance = best if best <= max_distances[i] else None
+            results.append({'distance': distance, 'source_link': s_link, 'target_link': t_link})
+        return results
+
+    def run_batch(self, op, requests):
+        """
+        :param op: OP_*
+        :param requests: request dicts of one op
+        :return: [result] in request order, a bad request fails the whole batch with ValueError or TypeError
+        """
+        if op == OP_NEAREST:
+            return self.query_nearest(requests)
+        if op == OP_DISTANCE:
+            return self.query_distance(requests)
+        if op == OP_ROUTE:
+            return self.query_route(requests)
+        raise ValueError("unknown op: %s" % op)
+
+
+class MicroBatcher(object):
+    """
+    requests of one op waiting together are answered by one engine call.
+    the first request waits at most max_wait for others, and the engine runs in executor so new requests
+    keep arriving while a batch is computed
+    """
+    def __init__(self, engine, op, executor, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT):
+        self.engine = engine
+        self.op = op
+        self.executor = executor
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.batch_count = 0
+        self.request_count = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def submit(self, request):
+        """
+        :param request: request dict
+        :return: result of request
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((request, future))
+        return await future
+
+    async def _collect(self):
+        items = [await self.queue.get()]
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch:
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0.0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            items = await self._collect()
+            items = [item for item in items if not item[1].cancelled()]
+            if not items:
+                continue
+            requests = [request for request, _ in items]
+            try:
+                results = await loop.run_in_executor(self.executor, self.engine.run_batch, self.op, requests)
+            except (ValueError, TypeError):
+                # one bad request fails the batch, answer every request alone to find it
+                results = list()
+                for request in requests:
+                    try:
+                        results.append(await loop.run_in_executor(self.executor, self.engine.run_batch,
+                                                                  self.op, [request]))
+                    except (ValueError, TypeError) as e:
+                        results.append(e)
+                results = [result if isinstance(result, Exception) else result[0] for result in results]
+            except Exception as e:
+                results = [e] * len(items)
+            self.batch_count += 1
+            self.request_count += len(items)
+            for (_, future), result in zip(items, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class QueryServer(object):
+    """
+    json lines server. request {"id": any, "op": OP_*, ...params}, response {"id": id, "result": result}
+    or {"id": id, "error": message}. requests of one connection are answered as soon as they are done,
+    responses are matched by id
+    """
+    def __init__(self, engine, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT, workers=1):
+        """
+        :param engine: QueryEngine
+        :param max_batch: max requests of one batch
+        :param max_wait: time waiting for more requests after the first one of a batch. the unit is second
+        :param workers: threads running engine batches
+        """
+        self.engine = engine
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers))
+        self.batchers = dict((op, MicroBatcher(engine, op, self.executor, max_batch, max_wait))
+                             for op in (OP_NEAREST, OP_DISTANCE, OP_ROUTE))
+        self.server = None
+
+    async def start(self, path=None, host='127.0.0.1', port=None):
+        """
+        :param path: unix socket path, used if it is given
+        :param host: tcp host, keep it local
+        :param port: tcp port, 0 picks a free port
+        :return: asyncio server
+        """
+        for batcher in self.batchers.values():
+            batcher.start()
+        if path:
+            if os.path.exists(path):
+                os.remove(path)
+            self.server = await asyncio.start_unix_server(self._handle, path=path, limit=MAX_LINE_SIZE)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, limit=MAX_LINE_SIZE)
+        return self.server
+
+    def get_address(self):
+        """
+        :return: unix socket path or (host, port)
+        """
+        sockname = self.server.sockets[0].getsockname()
+        return sockname if isinstance(sockname, str) else tuple(sockname[:2])
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self):
+        """
+        :return: {op: {'batches': n, 'requests': n}}
+        """
+        return dict((op, {'batches': batcher.batch_count, 'requests': batcher.request_count})
+                    for op, batcher in self.batchers.items())
+
+    async def _answer(self, message):
+        request_id = None
+        try:
+            request = json.loads(message)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a json object")
+            request_id = request.get('id')
+            op = request.get('op')
+            if op == 'stats':
+                return {'id': request_id, 'result': self.get_stats()}
+            batcher = self.batchers.get(op)
+            if batcher is None:
+                raise ValueError("unknown op: %s" % op)
+            return {'id': request_id, 'result': await batcher.submit(request)}
+        except (ValueError, TypeError, KeyError) as e:
+            return {'id': request_id, 'error': str(e)}
+        except Exception as e:
+            return {'id': request_id, 'error': '%s: %s' % (type(e).__name__, e)}
+
+    async def _respond(self, message, writer, lock):
+        response = await self._answer(message)
+        data = (json.dumps(response) + '\n').encode('utf-8')
+        async with lock:
+            writer.write(data)
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # line longer than limit
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._respond(line.decode('utf-8'), writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+def load_engine(road_file, cache_dir=None, snap_tolerance=df.SAME_POINT_DISTANCE, search_radius=SEARCH_RADIUS):
+    """
+    :param road_file: road data file path
+    :param cache_dir: topology cache directory, None builds topology in memory
+    :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+    :param search_radius: default nearest road search radius. the unit is metre
+    :return: QueryEngine, None if road file can not be read
+    """
+    if cache_dir:
+        topology = topology_cache.load_or_build_topology(road_file, cache_dir, snap_tolerance)
+    else:
+        reader = file_operator.FileReader(road_file)
+        topology = None
+        if reader.is_valid():
+            topology = compact_topology.CompactTopology.from_layer(reader.get_lyr_file(), snap_tolerance)
+    if topology is None:
+        return None
+    return QueryEngine(topology, search_radius=search_radius)
+
+
+async def serve(engine, path=None, host='127.0.0.1', port=None, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT):
+    """
+    run server until cancelled
+    """
+    server = QueryServer(engine, max_batch, max_wait)
+    await server.start(path, host, port)
+    print('serving on %s' % (server.get_address(),))
+    sys.stdout.flush()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='local road query service')
+    parser.add_argument('--road-file', required=True, help='road data file')
+    parser.add_argument('--cache-dir', help='topology cache directory, shared by restarts')
+    parser.add_argument('--unix', help='unix socket path')
+    parser.add_argument('--host', default='127.0.0.1', help='tcp host when unix socket is not used')
+    parser.add_argument('--port', type=int, default=8765, help='tcp port when unix socket is not used')
+    parser.add_argument('--snap-tolerance', type=float, default=df.SAME_POINT_DISTANCE, help='metre')
+    parser.add_argument('--search-radius', type=float, default=SEARCH_RADIUS, help='metre')
+    parser.add_argument('--max-batch', type=int, default=BATCH_SIZE, help='max requests of one batch')
+    parser.add_argument('--max-wait', type=float, default=BATCH_WAIT, help='batch wait, second')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine = load_engine(args.road_file, args.cache_dir, args.snap_tolerance, args.search_radius)
+    if engine is None:
+        print('can not read road file: %s' % args.road_file)
+        return 1
+    try:
+        asyncio.run(serve(engine, args.unix, args.host, args.port, args.max_batch, args.max_wait))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
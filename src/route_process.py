@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/7/5 2:18 PM 
+# @Author : yangyuxin
+# @File : route_process.py
+# 这个代码文件在建好的拓扑上做最短路径计算，道路长度只计算一次
+# 返回的距离均为米
+
+
+import heapq
+import numpy as np
+import distance_process
+import compact_topology
+import spatial_index
+
+
+DIRECTION_BOTH = 0  # link can be passed in both direction
+DIRECTION_FORWARD = 1  # link can only be passed from start node to end node
+DIRECTION_BACKWARD = 2  # link can only be passed from end node to start node
+MATRIX_CHUNK_ELEMENTS = 1 << 20  # source-edge pairs relaxed at one time in bounded distance matrix
+
+
+class Router(object):
+    """
+    shortest path on CompactTopology, graph arrays are copied into python lists for fast access
+    """
+    def __init__(self, topology, link_directions=None):
+        """
+        :param topology: CompactTopology
+        :param link_directions: direction of every link, DIRECTION_*. None means every link is two way
+        """
+        self.topology = topology
+        self.link_directions = None if link_directions is None else np.asarray(link_directions)
+        node_links = topology.node_links
+        node_neighbours = topology.node_neighbours
+        entry_nodes = np.repeat(np.arange(topology.get_node_num()), topology.get_node_degrees())
+        from_start = topology.link_snodes[node_links] == entry_nodes
+        to_start = topology.link_snodes[node_links] == node_neighbours
+        connected = node_neighbours != compact_topology.NO_NODE
+        if link_directions is None:
+            forward = connected
+            backward = connected
+        else:
+            directions = np.asarray(link_directions)[node_links]
+            # pass link from entry node to neighbour, and from neighbour to entry node
+            forward = connected & ((directions == DIRECTION_BOTH)
+                                   | ((directions == DIRECTION_FORWARD) & from_start)
+                                   | ((directions == DIRECTION_BACKWARD) & ~from_start))
+            backward = connected & ((directions == DIRECTION_BOTH)
+                                    | ((directions == DIRECTION_FORWARD) & to_start)
+                                    | ((directions == DIRECTION_BACKWARD) & ~to_start))
+        self._forward_graph = self._build_graph(forward)
+        self._backward_graph = self._build_graph(backward)
+        self._lengths = topology.link_lengths.tolist()
+        # forward graph in arrays, edges of node i are [edge_offsets[i], edge_offsets[i + 1])
+        self._edge_offsets = np.searchsorted(entry_nodes[forward], np.arange(topology.get_node_num() + 1))
+        self._edge_ends = node_neighbours[forward]
+        self._edge_lengths = topology.link_lengths[node_links[forward]]
+        self._points = topology.node_points.tolist()
+
+    @classmethod
+    def from_framework(cls, topo, link_directions=None):
+        """
+        :param topo: TopoFramework or TopoFrameWork2 after init_topology
+        :param link_directions: direction of every link in topo.get_links() order
+        :return: Router
+        """
+        return cls(compact_topology.CompactTopology.from_framework(topo), link_directions)
+
+    def _build_graph(self, mask):
+        # [[(neighbour, link)]] of every node
+        graph = [list() for _ in range(self.topology.get_node_num())]
+        entry_nodes = np.repeat(np.arange(self.topology.get_node_num()), self.topology.get_node_degrees())
+        for node, neighbour, link in zip(entry_nodes[mask].tolist(),
+                                         self.topology.node_neighbours[mask].tolist(),
+                                         self.topology.node_links[mask].tolist()):
+            graph[node].append((neighbour, link))
+        return graph
+
+    def _heuristic(self, node, target):
+        # haversine whatever the global tier is, a plane distance may be longer than the links and break A*
+        return distance_process.calc_point_distance(self._points[node], self._points[target],
+                                                    distance_process.PRECISION_HAVERSINE)
+
+    def _search(self, graph, source, targets=None, max_distance=None, target=None, use_heuristic=False):
+        # dijkstra or A*, stop when all targets are settled
+        distances = {source: 0.0}
+        prev = {source: (None, None)}
+        settled = set()
+        remain = set(targets) if targets is not None else None
+        start_cost = self._heuristic(source, target) if use_heuristic else 0.0
+        heap = [(start_cost, 0.0, source)]
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if remain is not None:
+                remain.discard(node)
+                if not remain:
+                    break
+            if node == target:
+                break
+            for neighbour, link in graph[node]:
+                new_distance = distance + self._lengths[link]
+                if max_distance is not None and new_distance > max_distance:
+                    continue
+                if new_distance < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = new_distance
+                    prev[neighbour] = (node, link)
+                    cost = new_distance + self._heuristic(neighbour, target) if use_heuristic else new_distance
+                    heapq.heappush(heap, (cost, new_distance, neighbour))
+        return distances, prev, settled
+
+    @staticmethod
+    def _make_path(prev, node):
+        nodes = list()
+        links = list()
+        while node is not None:
+            nodes.append(node)
+            node, link = prev[node]
+            if link is not None:
+                links.append(link)
+        nodes.reverse()
+        links.reverse()
+        return nodes, links
+
+    def shortest_path(self, source, target):
+        """
+        dijkstra
+        :param source: source node id
+        :param target: target node id
+        :return: distance, [node ids], [link ids]. None if target is not reachable
+        """
+        distances, prev, settled = self._search(self._forward_graph, source, target=target)
+        if target not in settled:
+            return None
+        nodes, links = self._make_path(prev, target)
+        return distances[target], nodes, links
+
+    def astar_shortest_path(self, source, target):
+        """
+        A* with haversine distance to target as heuristic
+        :param source: source node id
+        :param target: target node id
+        :return: distance, [node ids], [link ids]. None if target is not reachable
+        """
+        distances, prev, settled = self._search(self._forward_graph, source, target=target, use_heuristic=True)
+        if target not in settled:
+            return None
+        nodes, links = self._make_path(prev, target)
+        return distances[target], nodes, links
+
+    def bidirectional_shortest_path(self, source, target):
+        """
+        bidirectional dijkstra
+        :param source: source node id
+        :param target: target node id
+        :return: distance, [node ids], [link ids]. None if target is not reachable
+        """
+        if source == target:
+            return 0.0, [source], list()
+        graphs = (self._forward_graph, self._backward_graph)
+        distances = ({source: 0.0}, {target: 0.0})
+        prevs = ({source: (None, None)}, {target: (None, None)})
+        settled = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best = float('inf')
+        meet = None
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            distance, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+            for neighbour, link in graphs[side][node]:
+                new_distance = distance + self._lengths[link]
+                if new_distance < distances[side].get(neighbour, float('inf')):
+                    distances[side][neighbour] = new_distance
+                    prevs[side][neighbour] = (node, link)
+                    heapq.heappush(heaps[side], (new_distance, neighbour))
+                other_distance = distances[1 - side].get(neighbour)
+                if other_distance is not None and distances[side][neighbour] + other_distance < best:
+                    best = distances[side][neighbour] + other_distance
+                    meet = neighbour
+        if meet is None:
+            return None
+
+        nodes, links = self._make_path(prevs[0], meet)
+        back_nodes, back_links = self._make_path(prevs[1], meet)
+        back_nodes.reverse()
+        back_links.reverse()
+        return best, nodes + back_nodes[1:], links + back_links
+
+    def shortest_distances(self, source, targets=None, max_distance=None):
+        """
+        one to many dijkstra
+        :param source: source node id
+        :param targets: target node ids, search stops when all are settled. None searches all nodes
+        :param max_distance: nodes farther than it are not searched. the unit is metre
+        :return: {node id: distance}
+        """
+        distances, _, settled = self._search(self._forward_graph, source, targets, max_distance)
+        return dict((node, distances[node]) for node in settled)
+
+    def get_link_passable(self, link_ids):
+        """
+        :param link_ids: link ids
+        :return: forward mask, backward mask. forward is from start node to end node
+        """
+        link_ids = np.asarray(link_ids, dtype=np.int64)
+        if self.link_directions is None:
+            passable = np.ones(link_ids.shape[0], dtype=bool)
+            return passable, passable
+        directions = self.link_directions[link_ids]
+        return directions != DIRECTION_BACKWARD, directions != DIRECTION_FORWARD
+
+    def calc_distance_matrix(self, sources, targets, max_distance=None):
+        """
+        many to many travel distance. with max_distance all sources are searched together on nodes within
+        max_distance, otherwise one dijkstra is run for every source
+        :param sources: source node ids
+        :param targets: target node ids
+        :param max_distance: nodes farther than it are not searched. the unit is metre
+        :return: numpy array of shape (len(sources), len(targets)), inf if not reachable
+        """
+        sources = list(sources)
+        targets = list(targets)
+        matrix = np.full((len(sources), len(targets)), np.inf, dtype=np.float64)
+        if max_distance is None:
+            for i, source in enumerate(sources):
+                distances = self.shortest_distances(source, targets, max_distance)
+                for j, target in enumerate(targets):
+                    if target in distances:
+                        matrix[i, j] = distances[target]
+            return matrix
+        if not sources or not targets:
+            return matrix
+
+        # every path not longer than max_distance is inside the nodes within max_distance of some source
+        region = np.array(sorted(self._find_region(sources, max_distance)), dtype=np.int64)
+        edges, edge_starts = spatial_index.expand_ranges(self._edge_offsets[region], self._edge_offsets[region + 1])
+        edge_ends = np.minimum(np.searchsorted(region, self._edge_ends[edges]), region.shape[0] - 1)
+        inside = region[edge_ends] == self._edge_ends[edges]
+        edge_starts = edge_starts[inside]
+        edge_ends = edge_ends[inside]
+        edge_lengths = self._edge_lengths[edges[inside]]
+        target_positions = np.minimum(np.searchsorted(region, targets), region.shape[0] - 1)
+        found = region[target_positions] == np.asarray(targets)
+
+        source_positions = np.searchsorted(region, sources)
+        chunk_size = max(1, MATRIX_CHUNK_ELEMENTS // max(1, edge_starts.shape[0]))
+        for start in range(0, len(sources), chunk_size):
+            chunk_sources = source_positions[start:start + chunk_size]
+            distances = self._relax_region(chunk_sources, region.shape[0], edge_starts, edge_ends, edge_lengths,
+                                           max_distance)
+            matrix[start:start + chunk_sources.shape[0], found] = distances[:, target_positions[found]]
+        return matrix
+
+    def _find_region(self, sources, max_distance):
+        # nodes not farther than max_distance from any source, by one dijkstra from all sources
+        distances = dict((source, 0.0) for source in sources)
+        heap = [(0.0, source) for source in distances]
+        settled = set()
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            for neighbour, link in self._forward_graph[node]:
+                new_distance = distance + self._lengths[link]
+                if new_distance <= max_distance and new_distance < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = new_distance
+                    heapq.heappush(heap, (new_distance, neighbour))
+        return settled
+
+    @staticmethod
+    def _relax_region(sources, node_num, edge_starts, edge_ends, edge_lengths, max_distance):
+        # bellman ford of all sources at once, only edges leaving nodes improved in last round are relaxed.
+        # every distance is a sum along one path as in dijkstra, so results are the same
+        distances = np.full((sources.shape[0], node_num), np.inf, dtype=np.float64)
+        distances[np.arange(sources.shape[0]), sources] = 0.0
+        active = np.zeros(node_num, dtype=bool)
+        active[sources] = True
+        while True:
+            edges = np.flatnonzero(active[edge_starts])
+            if edges.shape[0] == 0:
+                break
+            order = np.argsort(edge_ends[edges], kind='stable')
+            edges = edges[order]
+            reached = distances[:, edge_starts[edges]] + edge_lengths[edges]
+            reached[reached > max_distance] = np.inf
+            ends, firsts = np.unique(edge_ends[edges], return_index=True)
+            best = np.minimum.reduceat(reached, firsts, axis=1)
+            current = distances[:, ends]
+            improved = best < current
+            distances[:, ends] = np.where(improved, best, current)
+            active[:] = False
+            active[ends[np.any(improved, axis=0)]] = True
+        return distances
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/8/23 9:40 AM 
+# @Author : yangyuxin
+# @File : simplify_process.py
+# 这个代码文件在球面上对线做抽稀，容差的单位为米，起点和终点总是保留，拓扑关系不变
+# 多条线存放在一个坐标数组中批量处理，格式与 compact_topology.read_line_buffer 相同
+
+
+import math
+import heapq
+import numpy as np
+import data_define as df
+import distance_process
+import spatial_index
+
+
+def simplify_lines(coords, offsets, tolerance):
+    """
+    douglas peucker of many lines at once, every round splits all open ranges of all lines
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param tolerance: max distance from removed point to simplified line. the unit is metre
+    :return: kept mask of coords, numpy bool array (n,). first and last point of every line are kept
+    """
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    keep = np.zeros(coords.shape[0], dtype=bool)
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    has_point = ends >= starts
+    keep[starts[has_point]] = True
+    keep[ends[has_point]] = True
+    if coords.shape[0] == 0:
+        return keep
+
+    xyz = distance_process.lonlat_to_xyz_array(coords[:, df.INDEX_LON], coords[:, df.INDEX_LAT])
+    # open ranges, both ends are kept and points between them are not decided
+    open_ranges = ends - starts >= 2
+    starts = starts[open_ranges]
+    ends = ends[open_ranges]
+    while starts.shape[0] > 0:
+        indexes, positions = spatial_index.expand_ranges(starts + 1, ends)
+        distances = distance_process.calc_segment_distances(xyz[indexes], xyz[starts[positions]],
+                                                            xyz[ends[positions]])
+        # farthest point of every range, ranges are in index order so positions are sorted
+        range_firsts = np.searchsorted(positions, np.arange(starts.shape[0]))
+        max_distances = np.maximum.reduceat(distances, range_firsts)
+        far = max_distances > tolerance
+        if not np.any(far):
+            break
+        is_max = distances == max_distances[positions]
+        # first farthest point of every range
+        candidates = np.flatnonzero(is_max & far[positions])
+        first = np.ones(candidates.shape[0], dtype=bool)
+        first[1:] = positions[candidates[1:]] != positions[candidates[:-1]]
+        splits = indexes[candidates[first]]
+        keep[splits] = True
+
+        split_starts = starts[far]
+        split_ends = ends[far]
+        starts = np.concatenate((split_starts, splits))
+        ends = np.concatenate((splits, split_ends))
+        open_ranges = ends - starts >= 2
+        starts = starts[open_ranges]
+        ends = ends[open_ranges]
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        ends = ends[order]
+    return keep
+
+
+def calc_triangle_areas(a_xyz, b_xyz, c_xyz):
+    """
+    :param a_xyz: first corners, unit vectors of shape (n, 3)
+    :param b_xyz: second corners, unit vectors of shape (n, 3)
+    :param c_xyz: third corners, unit vectors of shape (n, 3)
+    :return: area of every small triangle. the unit is square metre
+    """
+    cross = np.cross(b_xyz - a_xyz, c_xyz - a_xyz)
+    return 0.5 * np.sqrt(np.sum(cross * cross, axis=-1)) * distance_process.EARTH_RADIUS ** 2
+
+
+def calc_triangle_area(a_xyz, b_xyz, c_xyz):
+    """
+    scalar version of calc_triangle_areas, for single updates where numpy call overhead dominates
+    :param a_xyz: first corner (x, y, z)
+    :param b_xyz: second corner (x, y, z)
+    :param c_xyz: third corner (x, y, z)
+    :return: area of small triangle. the unit is square metre
+    """
+    ux, uy, uz = b_xyz[0] - a_xyz[0], b_xyz[1] - a_xyz[1], b_xyz[2] - a_xyz[2]
+    vx, vy, vz = c_xyz[0] - a_xyz[0], c_xyz[1] - a_xyz[1], c_xyz[2] - a_xyz[2]
+    x = uy * vz - uz * vy
+    y = uz * vx - ux * vz
+    z = ux * vy - uy * vx
+    return 0.5 * math.sqrt(x * x + y * y + z * z) * distance_process.EARTH_RADIUS ** 2
+
+
+def simplify_line_visvalingam(line, min_area):
+    """
+    visvalingam whyatt, point of smallest effective triangle is removed until all triangles are not smaller than min_area
+    :param line: line [points] or numpy array of shape (n, 2)
+    :param min_area: min effective area of kept point. the unit is square metre
+    :return: kept mask of line points, numpy bool array (n,)
+    """
+    points = distance_process.to_point_array(line)
+    point_num = points.shape[0]
+    keep = np.ones(point_num, dtype=bool)
+    if point_num <= 2:
+        return keep
+
+    xyz = distance_process.lonlat_to_xyz_array(points[:, df.INDEX_LON], points[:, df.INDEX_LAT])
+    areas = np.full(point_num, np.inf, dtype=np.float64)
+    areas[1:-1] = calc_triangle_areas(xyz[:-2], xyz[1:-1], xyz[2:])
+    # removal order depends on every earlier removal, the loop works on python lists and scalar math
+    xyz_list = xyz.tolist()
+    kept = [True] * point_num
+    prevs = list(range(-1, point_num - 1))
+    nexts = list(range(1, point_num + 1))
+    heap = [(area, i) for i, area in enumerate(areas[1:-1].tolist(), 1)]
+    heapq.heapify(heap)
+    current = areas.tolist()
+    max_removed = 0.0
+    while heap:
+        area, i = heapq.heappop(heap)
+        if not kept[i] or area != current[i]:
+            continue
+        # effective area never decreases, later points are not judged smaller than removed ones
+        area = max(area, max_removed)
+        if area >= min_area:
+            break
+        max_removed = area
+        kept[i] = False
+        prev = prevs[i]
+        next_index = nexts[i]
+        nexts[prev] = next_index
+        prevs[next_index] = prev
+        for j in (prev, next_index):
+            if j <= 0 or j >= point_num - 1:
+                continue
+            new_area = calc_triangle_area(xyz_list[prevs[j]], xyz_list[j], xyz_list[nexts[j]])
+            current[j] = new_area
+            heapq.heappush(heap, (new_area, j))
+    return np.array(kept, dtype=bool)
+
+
+def simplify_lines_visvalingam(coords, offsets, min_area):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param min_area: min effective area of kept point. the unit is square metre
+    :return: kept mask of coords, numpy bool array (n,). first and last point of every line are kept
+    """
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    keep = np.ones(coords.shape[0], dtype=bool)
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        if end - start > 2:
+            keep[start:end] = simplify_line_visvalingam(coords[start:end], min_area)
+    return keep
+
+
+def apply_keep_mask(coords, offsets, keep):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param keep: kept mask of coords
+    :return: kept coords, new offsets
+    """
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    kept_before = np.concatenate(([0], np.cumsum(keep)))
+    return coords[keep], kept_before[offsets]
+
+
+def simplify_line(line, tolerance):
+    """
+    :param line: line [points]
+    :param tolerance: max distance from removed point to simplified line. the unit is metre
+    :return: simplified line [points], first and last point are kept
+    """
+    if len(line) <= 2:
+        return list(line)
+    keep = simplify_lines(line, [0, len(line)], tolerance)
+    return [point for point, kept in zip(line, keep.tolist()) if kept]
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/6/14 10:26 AM 
+# @Author : yangyuxin
+# @File : spatial_index.py
+# 这个代码文件实现了一次性批量构建的静态空间索引(STR packed R-tree)
+# box 格式与 topo_process_framework 相同 [x_min, y_min, x_max, y_max]
+
+
+import math
+import numpy as np
+
+
+NODE_SIZE = 16  # max children of one tree node
+QUERY_CHUNK_SIZE = 4096  # boxes queried at one time in batch query
+REBUILD_SIZE = 4096  # dynamic index keeps at least this many changed items before rebuild
+REBUILD_RATIO = 0.1  # dynamic index is rebuilt when changed items are more than this ratio of tree
+EXTRA_SCAN_SIZE = 1024  # inserted items of dynamic index scanned linearly, more are packed into a small tree
+SCAN_CHUNK_ELEMENTS = 1 << 20  # query and item box pairs compared at one time in linear scan
+MIN_CAPACITY = 16  # min item capacity of dynamic index
+
+
+def to_box_array(boxes):
+    """
+    :param boxes: boxes [[x_min, y_min, x_max, y_max]]
+    :return: numpy array of shape (n, 4)
+    """
+    array = np.asarray(boxes, dtype=np.float64)
+    if array.size == 0:
+        return np.empty((0, 4), dtype=np.float64)
+    return array.reshape(-1, 4)
+
+
+def to_object_array(items):
+    """
+    :param items: item objects
+    :return: numpy object array, items are not unpacked even if they are sequences
+    """
+    if isinstance(items, np.ndarray) and items.dtype == object:
+        return items
+    array = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+def expand_ranges(starts, ends):
+    """
+    :param starts: range start indexes
+    :param ends: range end indexes, exclusive
+    :return: all indexes of ranges, range position of every index
+    """
+    lengths = np.maximum(ends - starts, 0)
+    total = int(lengths.sum())
+    positions = np.repeat(np.arange(lengths.shape[0]), lengths)
+    if total == 0:
+        return np.empty(0, dtype=np.int64), positions
+    offsets = np.cumsum(lengths) - lengths
+    indexes = np.arange(total) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    return indexes, positions
+
+
+def calc_line_boxes(coords, offsets):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :return: box of every line, numpy array of shape (n, 4). box of line without point is zeros
+    """
+    boxes = np.zeros((offsets.shape[0] - 1, 4), dtype=np.float64)
+    starts = offsets[:-1]
+    has_point = offsets[1:] > starts
+    if np.any(has_point):
+        starts = starts[has_point]
+        boxes[has_point, 0] = np.minimum.reduceat(coords[:, 0], starts)
+        boxes[has_point, 1] = np.minimum.reduceat(coords[:, 1], starts)
+        boxes[has_point, 2] = np.maximum.reduceat(coords[:, 0], starts)
+        boxes[has_point, 3] = np.maximum.reduceat(coords[:, 1], starts)
+    return boxes
+
+
+def is_box_intersect(boxes1, boxes2):
+    """
+    :param boxes1: numpy array of shape (n, 4)
+    :param boxes2: numpy array of shape (n, 4) or (4,)
+    :return: is every box pair intersect, boundary touch is intersect
+    """
+    return ((boxes1[..., 0] <= boxes2[..., 2]) & (boxes1[..., 2] >= boxes2[..., 0])
+            & (boxes1[..., 1] <= boxes2[..., 3]) & (boxes1[..., 3] >= boxes2[..., 1]))
+
+
+class PackedRTree(object):
+    """
+    static R-tree bulk loaded by sort-tile-recursive, stored level by level in arrays.
+    items are identified by their index in the input boxes.
+    """
+    def __init__(self, boxes, items=None, node_size=NODE_SIZE):
+        """
+        :param boxes: item boxes [[x_min, y_min, x_max, y_max]]
+        :param items: item objects returned by intersect, same size as boxes. None returns item indexes
+        :param node_size: max children of one tree node
+        """
+        boxes = to_box_array(boxes)
+        self.node_size = max(2, int(node_size))
+        self.items = items
+        self.item_num = boxes.shape[0]
+        self.ids = self._sort_tile_recursive(boxes)
+        # level 0 holds item boxes, last level holds root box
+        self.level_boxes = [boxes[self.ids]]
+        while self.level_boxes[-1].shape[0] > 1:
+            child_boxes = self.level_boxes[-1]
+            starts = np.arange(0, child_boxes.shape[0], self.node_size)
+            parent_boxes = np.empty((starts.shape[0], 4), dtype=np.float64)
+            parent_boxes[:, 0] = np.minimum.reduceat(child_boxes[:, 0], starts)
+            parent_boxes[:, 1] = np.minimum.reduceat(child_boxes[:, 1], starts)
+            parent_boxes[:, 2] = np.maximum.reduceat(child_boxes[:, 2], starts)
+            parent_boxes[:, 3] = np.maximum.reduceat(child_boxes[:, 3], starts)
+            self.level_boxes.append(parent_boxes)
+
+    def _sort_tile_recursive(self, boxes):
+        if boxes.shape[0] == 0:
+            return np.empty(0, dtype=np.int64)
+        center_x = (boxes[:, 0] + boxes[:, 2]) / 2.0
+        center_y = (boxes[:, 1] + boxes[:, 3]) / 2.0
+        leaf_num = int(math.ceil(boxes.shape[0] / float(self.node_size)))
+        slice_num = int(math.ceil(math.sqrt(leaf_num)))
+        slice_capacity = slice_num * self.node_size
+        order_x = np.argsort(center_x, kind='stable')
+        slice_ids = np.arange(boxes.shape[0]) // slice_capacity
+        order = np.lexsort((center_y[order_x], slice_ids))
+        return order_x[order]
+
+    def __len__(self):
+        return self.item_num
+
+    def get_bounds(self):
+        """
+        :return: union box of all items [x_min, y_min, x_max, y_max], None if tree is empty
+        """
+        if self.item_num == 0:
+            return None
+        return self.level_boxes[-1][0].tolist()
+
+    def query(self, box):
+        """
+        :param box: [x_min, y_min, x_max, y_max]
+        :return: indexes of items whose box intersect with box, numpy array
+        """
+        _, ids = self.query_batch([box])
+        return ids
+
+    def query_batch(self, boxes, chunk_size=QUERY_CHUNK_SIZE):
+        """
+        :param boxes: query boxes [[x_min, y_min, x_max, y_max]]
+        :param chunk_size: boxes queried at one time, limits temporary memory
+        :return: query indexes, item indexes. every pair is a intersect result, sorted by query index
+        """
+        boxes = to_box_array(boxes)
+        if self.item_num == 0 or boxes.shape[0] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        query_list = list()
+        id_list = list()
+        for start in range(0, boxes.shape[0], chunk_size):
+            chunk = boxes[start:start + chunk_size]
+            # frontier holds (query, node) pairs of current level
+            queries = np.arange(chunk.shape[0])
+            nodes = np.zeros(chunk.shape[0], dtype=np.int64)
+            for level in range(len(self.level_boxes) - 1, -1, -1):
+                level_boxes = self.level_boxes[level]
+                hit = is_box_intersect(level_boxes[nodes], chunk[queries])
+                queries = queries[hit]
+                nodes = nodes[hit]
+                if level == 0 or nodes.shape[0] == 0:
+                    break
+                child_num = self.level_boxes[level - 1].shape[0]
+                starts = nodes * self.node_size
+                ends = np.minimum(starts + self.node_size, child_num)
+                nodes, positions = expand_ranges(starts, ends)
+                queries = queries[positions]
+            query_list.append(queries + start)
+            id_list.append(self.ids[nodes])
+
+        queries = np.concatenate(query_list)
+        ids = np.concatenate(id_list)
+        order = np.argsort(queries, kind='stable')
+        return queries[order], ids[order]
+
+    def intersect(self, box):
+        """
+        same as pyqtree.Index.intersect
+        :param box: [x_min, y_min, x_max, y_max]
+        :return: items whose box intersect with box
+        """
+        ids = self.query(box)
+        if self.items is None:
+            return ids.tolist()
+        return [self.items[i] for i in ids.tolist()]
+
+    def intersect_batch(self, boxes):
+        """
+        :param boxes: query boxes [[x_min, y_min, x_max, y_max]]
+        :return: [items] for every query box
+        """
+        boxes = to_box_array(boxes)
+        queries, ids = self.query_batch(boxes)
+        bounds = np.searchsorted(queries, np.arange(boxes.shape[0] + 1))
+        ids = ids.tolist()
+        results = list()
+        for i in range(boxes.shape[0]):
+            part_ids = ids[bounds[i]:bounds[i + 1]]
+            if self.items is None:
+                results.append(part_ids)
+            else:
+                results.append([self.items[j] for j in part_ids])
+        return results
+
+
+class DynamicIndex(object):
+    """
+    PackedRTree with incremental updates.
+    inserted items are packed into a second small tree, the last few are scanned linearly.
+    removed items are masked out until next rebuild. item ids are positions in items, renumbered by rebuild
+    """
+    def __init__(self, boxes, items, node_size=NODE_SIZE, rebuild_size=REBUILD_SIZE, rebuild_ratio=REBUILD_RATIO):
+        """
+        :param boxes: item boxes [[x_min, y_min, x_max, y_max]]
+        :param items: item objects, same size as boxes
+        :param node_size: max children of one tree node
+        :param rebuild_size: tree is rebuilt when changed items are more than it
+        :param rebuild_ratio: and more than this ratio of items in tree
+        """
+        self.node_size = node_size
+        self.rebuild_size = rebuild_size
+        self.rebuild_ratio = rebuild_ratio
+        self._build(to_box_array(boxes), to_object_array(items))
+
+    def _build(self, boxes, items):
+        item_num = boxes.shape[0]
+        capacity = max(item_num, MIN_CAPACITY)
+        self.tree = PackedRTree(boxes, None, self.node_size)
+        # box, item and alive flag of every item id, inserted items are appended
+        self.boxes = np.empty((capacity, 4), dtype=np.float64)
+        self.boxes[:item_num] = boxes
+        self.items = np.empty(capacity, dtype=object)
+        self.items[:item_num] = items
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.alive[:item_num] = True
+        self.item_num = item_num
+        self.item_ids = dict(zip(map(id, items), range(item_num)))
+        self.removed_num = 0
+        # ids [tree_num, extra_num) are in extra tree, ids [extra_num, item_num) are scanned linearly
+        self.tree_num = item_num
+        self.extra_tree = None
+        self.extra_num = item_num
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def _need_rebuild(self):
+        changed = self.item_num - self.tree_num + self.removed_num
+        return changed > max(self.rebuild_size, self.rebuild_ratio * self.tree_num)
+
+    def _grow(self):
+        capacity = self.boxes.shape[0] * 2
+        boxes = np.empty((capacity, 4), dtype=np.float64)
+        boxes[:self.item_num] = self.boxes[:self.item_num]
+        items = np.empty(capacity, dtype=object)
+        items[:self.item_num] = self.items[:self.item_num]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.item_num] = self.alive[:self.item_num]
+        self.boxes, self.items, self.alive = boxes, items, alive
+
+    def insert(self, item, box):
+        """
+        :param item: item object
+        :param box: [x_min, y_min, x_max, y_max]
+        """
+        if self.item_num == self.boxes.shape[0]:
+            self._grow()
+        item_id = self.item_num
+        self.boxes[item_id] = box
+        self.items[item_id] = item
+        self.alive[item_id] = True
+        self.item_ids[id(item)] = item_id
+        self.item_num += 1
+        if self.item_num - self.extra_num > EXTRA_SCAN_SIZE:
+            # scanned items are packed into extra tree with all inserted items
+            self.extra_tree = PackedRTree(self.boxes[self.tree_num:self.item_num], None, self.node_size)
+            self.extra_num = self.item_num
+        if self._need_rebuild():
+            self.rebuild()
+
+    def remove(self, item):
+        """
+        :param item: item object
+        :return: is item found
+        """
+        item_id = self.item_ids.pop(id(item), None)
+        if item_id is None:
+            return False
+        self.alive[item_id] = False
+        self.removed_num += 1
+        if self._need_rebuild():
+            self.rebuild()
+        return True
+
+    def rebuild(self):
+        # pack all alive items into a new tree
+        item_ids = np.flatnonzero(self.alive[:self.item_num])
+        self._build(self.boxes[item_ids], self.items[item_ids])
+
+    def query_batch(self, boxes, chunk_size=QUERY_CHUNK_SIZE):
+        """
+        :param boxes: query boxes [[x_min, y_min, x_max, y_max]]
+        :param chunk_size: boxes queried at one time, limits temporary memory
+        :return: query indexes, item ids. every pair is a intersect result, sorted by query index
+        """
+        boxes = to_box_array(boxes)
+        queries, ids = self.tree.query_batch(boxes, chunk_size)
+        query_list = [queries]
+        id_list = [ids]
+        if self.extra_tree is not None:
+            extra_queries, extra_ids = self.extra_tree.query_batch(boxes, chunk_size)
+            query_list.append(extra_queries)
+            id_list.append(extra_ids + self.tree_num)
+        scan_num = self.item_num - self.extra_num
+        if scan_num > 0 and boxes.shape[0] > 0:
+            scan_boxes = self.boxes[self.extra_num:self.item_num]
+            step = max(1, SCAN_CHUNK_ELEMENTS // scan_num)
+            for start in range(0, boxes.shape[0], step):
+                hit_queries, hit_items = np.nonzero(is_box_intersect(boxes[start:start + step, None, :],
+                                                                     scan_boxes[None, :, :]))
+                query_list.append(hit_queries + start)
+                id_list.append(hit_items + self.extra_num)
+        if len(query_list) > 1:
+            queries = np.concatenate(query_list)
+            ids = np.concatenate(id_list)
+            order = np.argsort(queries, kind='stable')
+            queries = queries[order]
+            ids = ids[order]
+        if self.removed_num:
+            alive = self.alive[ids]
+            queries = queries[alive]
+            ids = ids[alive]
+        return queries, ids
+
+    def intersect(self, box):
+        """
+        same as pyqtree.Index.intersect
+        :param box: [x_min, y_min, x_max, y_max]
+        :return: items whose box intersect with box
+        """
+        _, ids = self.query_batch([box])
+        return self.items[ids].tolist()
+
+    def intersect_batch(self, boxes):
+        """
+        :param boxes: query boxes [[x_min, y_min, x_max, y_max]]
+        :return: [items] for every query box
+        """
+        boxes = to_box_array(boxes)
+        queries, ids = self.query_batch(boxes)
+        bounds = np.searchsorted(queries, np.arange(boxes.shape[0] + 1))
+        items = self.items[ids].tolist()
+        return [items[bounds[i]:bounds[i + 1]] for i in range(boxes.shape[0])]
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/11 3:10 PM 
+# @Author : yangyuxin
+# @File : spatial_join.py
+# 这个代码文件把点图层连接到一定距离内的所有线上，输出 (点 id, 线 id, 距离, 线上的里程)
+# 先用线的外包框索引筛选候选，再一次性计算所有候选 (点, 线) 的最近点，点按块处理，可以用多进程并行
+# 结果按块以生成器返回，或者批量写入图层
+
+
+import collections
+import multiprocessing
+import numpy as np
+import distance_process
+import file_operator
+import polyline
+import spatial_index
+
+
+JOIN_CHUNK_SIZE = 65536  # points joined at one time
+PENDING_CHUNKS = 2  # chunks waiting in pool for every worker process
+
+JOIN_FIELDS = ['point_id', 'link_id', 'distance', 'measure']
+
+
+class LineJoiner(object):
+    """
+    lines with their box index, joins points to all lines within a distance
+    """
+    def __init__(self, coords, offsets, line_ids=None):
+        """
+        :param coords: points of all lines, numpy array of shape (n, 2)
+        :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+        :param line_ids: id of every line in results, None uses line index
+        """
+        self.lines = polyline.PolylineSet(coords, offsets)
+        self.line_ids = np.arange(offsets.shape[0] - 1) if line_ids is None else np.asarray(line_ids)
+        self.index = spatial_index.PackedRTree(spatial_index.calc_line_boxes(coords, offsets))
+
+    @classmethod
+    def from_columns(cls, columns, id_field=None):
+        """
+        :param columns: file_operator.FeatureColumns of lines
+        :param id_field: field used as line id, None uses feature id
+        :return: LineJoiner
+        """
+        line_ids = columns.fids if id_field is None else columns.columns[id_field]
+        return cls(columns.coords, columns.offsets, line_ids)
+
+    def __len__(self):
+        return self.line_ids.shape[0]
+
+    def join(self, points, distance, point_ids=None):
+        """
+        :param points: points, numpy array of shape (n, 2)
+        :param distance: join distance, a number or one for every point. the unit is metre
+        :param point_ids: id of every point in results, None uses point index
+        :return: point ids, line ids, distances, measures on lines, nearest points on lines numpy array of shape (k, 2).
+                 one item for every (point, line) pair not farther than distance, sorted by point, distance, line
+        """
+        points = distance_process.to_point_array(points)
+        point_num = points.shape[0]
+        point_ids = np.arange(point_num) if point_ids is None else np.asarray(point_ids)
+        distances = np.broadcast_to(np.asarray(distance, dtype=np.float64), (point_num,))
+        queries, lines = self.index.query_batch(distance_process.calc_buffer_boxes(points, distances))
+        measures, pair_distances, nearest = self.lines.locate_points(points[queries], lines)
+
+        near = pair_distances <= distances[queries]
+        queries = queries[near]
+        lines = lines[near]
+        pair_distances = pair_distances[near]
+        order = np.lexsort((lines, pair_distances, queries))
+        return (point_ids[queries[order]], self.line_ids[lines[order]], pair_distances[order],
+                measures[near][order], nearest[near][order])
+
+
+_worker_joiner = None  # LineJoiner of worker process
+
+
+def init_worker(joiner, precision):
+    global _worker_joiner
+    distance_process.set_precision(precision)
+    _worker_joiner = joiner
+
+
+def join_chunk(chunk):
+    """
+    :param chunk: (points, point ids, distance)
+    :return: result of LineJoiner.join
+    """
+    points, point_ids, distance = chunk
+    return _worker_joiner.join(points, distance, point_ids)
+
+
+def iter_point_chunks(points, distance, point_ids=None, chunk_size=JOIN_CHUNK_SIZE):
+    """
+    :param points: points, numpy array of shape (n, 2)
+    :param distance: join distance, a number or one for every point. the unit is metre
+    :param point_ids: id of every point, None uses point index
+    :param chunk_size: points of one chunk
+    :return: generator of (points, point ids, distance)
+    """
+    points = distance_process.to_point_array(points)
+    point_num = points.shape[0]
+    point_ids = np.arange(point_num) if point_ids is None else np.asarray(point_ids)
+    distances = np.broadcast_to(np.asarray(distance, dtype=np.float64), (point_num,))
+    for start in range(0, point_num, chunk_size):
+        end = min(start + chunk_size, point_num)
+        yield points[start:end], point_ids[start:end], distances[start:end]
+
+
+def iter_layer_point_chunks(layer, distance, id_field=None, chunk_size=JOIN_CHUNK_SIZE):
+    """
+    :param layer: ogr layer of points, the first point of other geometry is used
+    :param distance: join distance. the unit is metre
+    :param id_field: field used as point id, None uses feature id
+    :param chunk_size: features of one chunk
+    :return: generator of (points, point ids, distance), features without geometry are skipped
+    """
+    field_names = list() if id_field is None else [id_field]
+    for columns in file_operator.iter_layer_columns(layer, chunk_size, field_names):
+        point_ids = columns.fids if id_field is None else columns.columns[id_field]
+        has_point = columns.offsets[1:] > columns.offsets[:-1]
+        yield columns.coords[columns.offsets[:-1][has_point]], point_ids[has_point], distance
+
+
+def iter_join(joiner, chunks, processes=1):
+    """
+    :param joiner: LineJoiner
+    :param chunks: iterable of (points, point ids, distance)
+    :param processes: worker process count, None uses all cpus, 1 runs in current process
+    :return: generator of LineJoiner.join result of every chunk, in chunk order
+    """
+    if processes == 1:
+        for points, point_ids, distance in chunks:
+            yield joiner.join(points, distance, point_ids)
+        return
+
+    pool = multiprocessing.Pool(processes, init_worker, (joiner, distance_process.get_precision()))
+    try:
+        # chunks are read only a little ahead of workers, so memory does not grow with point count
+        max_pending = PENDING_CHUNKS * (processes or multiprocessing.cpu_count())
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(join_chunk, (chunk,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def join_points_to_lines(points, coords, offsets, distance, point_ids=None, line_ids=None,
+                         chunk_size=JOIN_CHUNK_SIZE, processes=1):
+    """
+    all lines within distance of every point, replaces nested calc_point_to_line_distance loops
+    :param points: points, numpy array of shape (n, 2)
+    :param coords: points of all lines, numpy array of shape (m, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]]
+    :param distance: join distance, a number or one for every point. the unit is metre
+    :param point_ids: id of every point, None uses point index
+    :param line_ids: id of every line, None uses line index
+    :param chunk_size: points joined at one time
+    :param processes: worker process count, None uses all cpus, 1 runs in current process
+    :return: point ids, line ids, distances, measures, nearest points. see LineJoiner.join
+    """
+    joiner = LineJoiner(coords, offsets, line_ids)
+    results = list(iter_join(joiner, iter_point_chunks(points, distance, point_ids, chunk_size), processes))
+    return concat_results(results)
+
+
+def concat_results(results):
+    """
+    :param results: [result of LineJoiner.join]
+    :return: one result of all
+    """
+    if not results:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64), \
+            np.empty((0, 2), dtype=np.float64)
+    return tuple(np.concatenate([result[i] for result in results]) for i in range(5))
+
+
+def iter_join_layers(point_file, line_file, distance, point_id_field=None, line_id_field=None,
+                     chunk_size=JOIN_CHUNK_SIZE, processes=1):
+    """
+    lines are read at once, points are read chunk by chunk
+    :param point_file: point data file path
+    :param line_file: line data file path
+    :param distance: join distance. the unit is metre
+    :param point_id_field: field used as point id, None uses feature id
+    :param line_id_field: field used as line id, None uses feature id
+    :param chunk_size: points read and joined at one time
+    :param processes: worker process count, None uses all cpus, 1 runs in current process
+    :return: generator of LineJoiner.join result of every point chunk
+    """
+    line_reader = file_operator.FileReader(line_file)
+    point_reader = file_operator.FileReader(point_file)
+    if not line_reader.is_valid():
+        raise IOError("can not read line file: %s" % line_file)
+    if not point_reader.is_valid():
+        raise IOError("can not read point file: %s" % point_file)
+    field_names = list() if line_id_field is None else [line_id_field]
+    joiner = LineJoiner.from_columns(file_operator.read_layer_columns(line_reader.get_lyr_file(), field_names),
+                                     line_id_field)
+    chunks = iter_layer_point_chunks(point_reader.get_lyr_file(), distance, point_id_field, chunk_size)
+    for result in iter_join(joiner, chunks, processes):
+        yield result
+
+
+def iter_join_records(results):
+    """
+    :param results: iterable of LineJoiner.join result
+    :return: generator of (field_dict, nearest point geometry) for FileWriter.write_features
+    """
+    for point_ids, line_ids, distances, measures, nearest in results:
+        for record in file_operator.iter_point_records(nearest, {'point_id': point_ids, 'link_id': line_ids,
+                                                                 'distance': distances, 'measure': measures}):
+            yield record
+
+
+def write_join_layers(point_file, line_file, output_file, distance, point_id_field=None, line_id_field=None,
+                      chunk_size=JOIN_CHUNK_SIZE, processes=1):
+    """
+    join point file to line file and write (point_id, link_id, distance, measure) at nearest points on lines
+    :param output_file: output file path
+    :return: count of written features, None if output file can not be created
+    """
+    results = iter_join_layers(point_file, line_file, distance, point_id_field, line_id_field, chunk_size, processes)
+    return file_operator.write_records(output_file, JOIN_FIELDS, iter_join_records(results))
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/9/20 10:15 AM 
+# @Author : yangyuxin
+# @File : tiled_topology.py
+# 这个代码文件按空间分块构建紧凑拓扑，每个子进程只读取一个分块的要素，内存峰值由分块大小决定
+# 道路属于起点所在的分块，端点在所在分块内聚合成节点，靠近分块边界的节点最后在主进程中合并
+
+
+import math
+import multiprocessing
+import numpy as np
+import data_define as df
+import distance_process
+import endpoint_snap
+import file_operator
+import compact_topology
+
+
+TILE_FEATURES = 200000  # features of one tile on average when tile size is not given
+
+
+class TileGrid(object):
+    """
+    regular grid over layer extent, tile (col, row) covers [x_min + col * width, x_min + (col + 1) * width).
+    points on or beyond the extent are in border tiles
+    """
+    def __init__(self, extent, tile_width, tile_height):
+        """
+        :param extent: [x_min, y_min, x_max, y_max]
+        :param tile_width: tile width in degree of longitude
+        :param tile_height: tile height in degree of latitude
+        """
+        self.x_min, self.y_min, self.x_max, self.y_max = [float(value) for value in extent]
+        self.tile_width = max(float(tile_width), df.ZERO_THRESHOLD)
+        self.tile_height = max(float(tile_height), df.ZERO_THRESHOLD)
+        self.cols = max(1, int(math.ceil((self.x_max - self.x_min) / self.tile_width)))
+        self.rows = max(1, int(math.ceil((self.y_max - self.y_min) / self.tile_height)))
+
+    @classmethod
+    def from_layer(cls, layer, tile_size=None, tile_features=TILE_FEATURES):
+        """
+        :param layer: road layer
+        :param tile_size: tile size in degree, None sizes tiles by feature count
+        :param tile_features: features of one tile on average, used when tile_size is None
+        :return: TileGrid
+        """
+        x_min, x_max, y_min, y_max = layer.GetExtent()
+        extent = [x_min, y_min, x_max, y_max]
+        if tile_size is None:
+            tile_num = max(1, int(math.ceil(layer.GetFeatureCount() / float(max(1, tile_features)))))
+            side = int(math.ceil(math.sqrt(tile_num)))
+            return cls(extent, (x_max - x_min) / side, (y_max - y_min) / side)
+        return cls(extent, tile_size, tile_size)
+
+    def __len__(self):
+        return self.cols * self.rows
+
+    def get_tile_box(self, tile):
+        """
+        :param tile: tile index, row * cols + col
+        :return: [x_min, y_min, x_max, y_max]
+        """
+        row, col = divmod(tile, self.cols)
+        x_min = self.x_min + col * self.tile_width
+        y_min = self.y_min + row * self.tile_height
+        return [x_min, y_min, x_min + self.tile_width, y_min + self.tile_height]
+
+    def get_point_tiles(self, lons, lats):
+        """
+        :param lons: longitudes of points
+        :param lats: latitudes of points
+        :return: tile index of every point, numpy array
+        """
+        cols = np.clip(np.floor((np.asarray(lons, dtype=np.float64) - self.x_min) / self.tile_width),
+                       0, self.cols - 1).astype(np.int64)
+        rows = np.clip(np.floor((np.asarray(lats, dtype=np.float64) - self.y_min) / self.tile_height),
+                       0, self.rows - 1).astype(np.int64)
+        return rows * self.cols + cols
+
+    def get_parameters(self):
+        return [self.x_min, self.y_min, self.x_max, self.y_max], self.tile_width, self.tile_height
+
+
+class TileResult(object):
+    """
+    topology part of one tile, it is small and can be sent back from worker process.
+    links are the ones starting in tile, endpoints and nodes are the ones located in tile
+    """
+    def __init__(self, tile, link_fids, coords, offsets, link_lengths,
+                 endpoint_keys, endpoint_nodes, node_points, boundary_points, boundary_point_nodes):
+        """
+        :param tile: tile index
+        :param link_fids: fid of every link
+        :param coords: points of all links, None if coords are not kept
+        :param offsets: link i is coords[offsets[i]:offsets[i + 1]], None if coords are not kept
+        :param link_lengths: length of every link. the unit is metre
+        :param endpoint_keys: fid * 2 for start point, fid * 2 + 1 for end point
+        :param endpoint_nodes: local node of every endpoint
+        :param node_points: local node points, numpy array of shape (n, 2)
+        :param boundary_points: endpoints near tile edge, they may be snapped with endpoints of other tiles
+        :param boundary_point_nodes: local node of every boundary point
+        """
+        self.tile = tile
+        self.link_fids = link_fids
+        self.coords = coords
+        self.offsets = offsets
+        self.link_lengths = link_lengths
+        self.endpoint_keys = endpoint_keys
+        self.endpoint_nodes = endpoint_nodes
+        self.node_points = node_points
+        self.boundary_points = boundary_points
+        self.boundary_point_nodes = boundary_point_nodes
+
+
+def build_tile(task):
+    """
+    :param task: (file path, tile, grid parameters, snap tolerance, keep coords, distance precision)
+    :return: TileResult
+    """
+    file_path, tile, (extent, tile_width, tile_height), snap_tolerance, keep_coords, precision = task
+    distance_process.set_precision(precision)
+    grid = TileGrid(extent, tile_width, tile_height)
+    box = grid.get_tile_box(tile)
+    reader = file_operator.FileReader(file_path)
+    if not reader.is_valid():
+        raise IOError("can not read road file: %s" % file_path)
+    # features crossing tile box, their endpoints may be in other tiles
+    columns = file_operator.read_layer_columns(reader.get_lyr_file(), list(), box=box)
+    coords, offsets, fids = columns.coords, columns.offsets, columns.fids
+    valid = offsets[1:] > offsets[:-1]
+    if not np.all(valid):
+        lengths = (offsets[1:] - offsets[:-1])[valid]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        fids = fids[valid]
+    s_points = coords[offsets[:-1]]
+    e_points = coords[offsets[1:] - 1]
+
+    # links starting in tile are kept
+    own = grid.get_point_tiles(s_points[:, 0], s_points[:, 1]) == tile
+    own_links = np.flatnonzero(own)
+    starts = offsets[own_links]
+    ends = offsets[own_links + 1]
+    lengths = ends - starts
+    own_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    own_indexes = np.repeat(starts - own_offsets[:-1], lengths) + np.arange(own_offsets[-1])
+    own_coords = coords[own_indexes]
+    link_lengths = distance_process.calc_lines_length(own_coords, own_offsets)
+
+    # endpoints located in tile are snapped into local nodes
+    endpoints = np.empty((2 * fids.shape[0], 2), dtype=np.float64)
+    endpoints[0::2] = s_points
+    endpoints[1::2] = e_points
+    endpoint_keys = np.repeat(fids * 2, 2) + np.tile([0, 1], fids.shape[0])
+    inside = grid.get_point_tiles(endpoints[:, 0], endpoints[:, 1]) == tile
+    endpoints = endpoints[inside]
+    endpoint_keys = endpoint_keys[inside]
+    groups, group_firsts = endpoint_snap.snap_points(endpoints[:, 0], endpoints[:, 1], snap_tolerance)
+    node_points = endpoints[group_firsts]
+
+    # endpoints near tile edge may be near endpoints of neighbour tiles
+    lon_buffers, lat_buffers = distance_process.calc_degree_buffer(endpoints[:, 1], snap_tolerance)
+    near_edge = ((endpoints[:, 0] - box[0] <= lon_buffers) | (box[2] - endpoints[:, 0] <= lon_buffers)
+                 | (endpoints[:, 1] - box[1] <= lat_buffers) | (box[3] - endpoints[:, 1] <= lat_buffers))
+    # all endpoints of a boundary node take part in stitching
+    is_boundary = np.zeros(group_firsts.shape[0], dtype=bool)
+    is_boundary[groups[near_edge]] = True
+    on_boundary = is_boundary[groups]
+    return TileResult(tile, fids[own_links], own_coords if keep_coords else None,
+                      own_offsets if keep_coords else None, link_lengths,
+                      endpoint_keys, groups, node_points, endpoints[on_boundary], groups[on_boundary])
+
+
+def stitch_tiles(results, snap_tolerance=df.SAME_POINT_DISTANCE, layer=None):
+    """
+    join tile parts into one topology, boundary nodes of different tiles not farther than tolerance are merged
+    :param results: [TileResult]
+    :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+    :param layer: road layer for lazy feature access
+    :return: CompactTopology
+    """
+    results = sorted(results, key=lambda result: result.tile)
+    node_bases = np.concatenate(([0], np.cumsum([result.node_points.shape[0] for result in results])))
+    node_num = int(node_bases[-1])
+
+    # boundary endpoints of all tiles, pairs inside one tile are already in one node
+    boundary_points = np.concatenate([result.boundary_points for result in results]).reshape(-1, 2)
+    boundary_nodes = np.concatenate([result.boundary_point_nodes + node_bases[i]
+                                     for i, result in enumerate(results)]).astype(np.int64)
+    items1, items2 = endpoint_snap.find_near_pairs(boundary_points[:, 0], boundary_points[:, 1], snap_tolerance)
+    labels = endpoint_snap.calc_connected_labels(node_num, boundary_nodes[items1], boundary_nodes[items2])
+    node_firsts, node_ids = np.unique(labels, return_inverse=True)
+    node_ids = node_ids.reshape(-1)
+    node_points = np.concatenate([result.node_points for result in results]).reshape(-1, 2)[node_firsts]
+
+    # every endpoint is located in exactly one tile
+    endpoint_keys = np.concatenate([result.endpoint_keys for result in results]).astype(np.int64)
+    endpoint_nodes = node_ids[np.concatenate([result.endpoint_nodes + node_bases[i]
+                                              for i, result in enumerate(results)]).astype(np.int64)]
+    order = np.argsort(endpoint_keys, kind='stable')
+    endpoint_keys = endpoint_keys[order]
+    endpoint_nodes = endpoint_nodes[order]
+
+    link_fids = np.concatenate([result.link_fids for result in results]).astype(np.int64)
+    link_lengths = np.concatenate([result.link_lengths for result in results]).astype(np.float64)
+
+    def find_nodes(keys):
+        positions = np.minimum(np.searchsorted(endpoint_keys, keys), max(endpoint_keys.shape[0] - 1, 0))
+        if endpoint_keys.shape[0] == 0:
+            return np.full(keys.shape[0], compact_topology.NO_NODE, dtype=np.int64)
+        return np.where(endpoint_keys[positions] == keys, endpoint_nodes[positions], compact_topology.NO_NODE)
+
+    link_snodes = find_nodes(link_fids * 2)
+    link_enodes = find_nodes(link_fids * 2 + 1)
+
+    coords = None
+    offsets = None
+    if results and all(result.coords is not None for result in results):
+        coords = np.concatenate([result.coords for result in results]).reshape(-1, 2)
+        coord_bases = np.cumsum([0] + [result.offsets[-1] for result in results])
+        offsets = np.concatenate([[0]] + [result.offsets[1:] + coord_bases[i]
+                                          for i, result in enumerate(results)]).astype(np.int64)
+    return compact_topology.CompactTopology(link_snodes, link_enodes, node_points, link_lengths,
+                                            link_fids, coords, offsets, layer)
+
+
+def build_tiled_topology(file_path, snap_tolerance=df.SAME_POINT_DISTANCE, tile_size=None,
+                         tile_features=TILE_FEATURES, processes=None, keep_coords=True):
+    """
+    build topology of a large road file tile by tile, every worker process reads one tile at a time
+    :param file_path: road data file path, opened again by every worker
+    :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+    :param tile_size: tile size in degree, None sizes tiles by feature count
+    :param tile_features: features of one tile on average, used when tile_size is None
+    :param processes: worker process count, None uses all cpus, 1 runs in current process
+    :param keep_coords: keep link coordinates in topology, False keeps only graph arrays
+    :return: CompactTopology, links are ordered by tile. None if road file can not be read
+    """
+    reader = file_operator.FileReader(file_path)
+    if not reader.is_valid():
+        return None
+    layer = reader.get_lyr_file()
+    grid = TileGrid.from_layer(layer, tile_size, tile_features)
+    parameters = grid.get_parameters()
+    precision = distance_process.get_precision()
+    tasks = [(file_path, tile, parameters, snap_tolerance, keep_coords, precision) for tile in range(len(grid))]
+
+    if processes == 1:
+        results = [build_tile(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            # small tiles are gathered as they finish
+            results = list(pool.imap_unordered(build_tile, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    return stitch_tiles(results, snap_tolerance, layer)
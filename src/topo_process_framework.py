@@ -9,10 +9,20 @@ import os
 import sys
 import ogr
 
-import pyqtree
+import numpy as np
 import data_define as df
 import distance_process
+import endpoint_snap
 import file_operator
+import instrument
+import spatial_index
+
+
+KEY_MODE_STRING = 0  # node key is "longitude|latitude" string
+KEY_MODE_INTEGER = 1  # node key is packed int64 of quantized longitude and latitude
+# key offsets of the eight neighbour steps, near ones first
+NEIGHBOUR_KEY_OFFSETS = [(col << 32) + row for col, row in
+                         [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]]
 
 
 class Node(object):
@@ -55,58 +65,95 @@ class TopoFramework(object):
         self.link_list = list()
         self.node_list = list()
         self.spatial_index = None
+        self.snap_tolerance = None
+        self._link_positions = None
+        self._node_positions = None
+        self._feature_positions = None
 
     def __del__(self):
         for feature in self.road_features:
             feature.Destory()
 
-    def init_topology(self):
-        # init spatial index
-        qt_box = None
-        for feature in self.road_features:
-            box = get_feature_box(feature)
-            qt_box = max(qt_box, box) if qt_box else box
-        self.spatial_index = pyqtree.Index(qt_box)
+    def init_topology(self, grid_snap=False, snap_tolerance=df.SAME_POINT_DISTANCE):
+        """
+        :param grid_snap: build nodes by grid hash of all endpoints in one pass
+        :param snap_tolerance: endpoints not farther than it share one node in grid snap mode. the unit is metre
+        """
+        # init spatial index, bulk load all link boxes at once
+        with instrument.phase('init_topology.index', len(self.road_features)):
+            boxes = [get_feature_box(feature) for feature in self.road_features]
+            self.link_list.extend(Link(feature) for feature in self.road_features)
+            self.spatial_index = spatial_index.DynamicIndex(boxes, self.link_list)
+
+        if grid_snap:
+            self.snap_tolerance = snap_tolerance
+            self._create_nodes_by_grid(snap_tolerance)
+            return
 
-        # add link feature in index
-        for feature in self.road_features:
-            box = get_feature_box(feature)
-            link = Link(feature)
-            self.spatial_index.insert(link, box)
-            self.link_list.append(link)
+        # build topology relationship, nodes are created and linked together
+        self._create_nodes_by_index()
 
-        # build topology relationship
+    def _get_link_endpoints(self):
+        # read only two endpoints of every link, link i owns endpoint 2i and 2i+1
+        endpoints = list()
         for link in self.link_list:
             geometry = link.feature.GetGeometryRef()
-            points = geometry.GetPoints()
-            s_point = points[0]
-            e_point = points[-1]
-            if not link.snode:
-                self._create_node(s_point)
-            if not link.enode:
-                self._create_node(e_point)
-
-    def _create_node(self, point):
-        if self.spatial_index is None:
-            return
-
-        feature = file_operator.create_feature({}, point_to_geometry(point))
-        node = Node(feature)
-
-        box = get_point_box(point, df.ZERO_THRESHOLD)
-        near_links = self.spatial_index.intersect(box)
-        for near_link in near_links:
-            near_geometry = near_link.feature.GetGeometryRef()
-            near_points = near_geometry.GetPoints()
-            near_s_point = near_points[0]
-            near_e_point = near_points[-1]
-            if is_same_point(near_s_point, point):
-                node.link_list.append(near_link)
-                near_link.snode = node
-            if is_same_point(near_e_point, point):
-                node.link_list.append(near_link)
-                near_link.enode = node
-        self.node_list.append(node)
+            s_point = geometry.GetPoint(0)
+            e_point = geometry.GetPoint(geometry.GetPointCount() - 1)
+            endpoints.append((s_point[df.INDEX_LON], s_point[df.INDEX_LAT]))
+            endpoints.append((e_point[df.INDEX_LON], e_point[df.INDEX_LAT]))
+        return np.array(endpoints, dtype=np.float64).reshape(-1, 2)
+
+    def _create_nodes_by_index(self):
+        with instrument.phase('init_topology.node', len(self.link_list)):
+            endpoints = self._get_link_endpoints()
+            # all endpoint boxes are queried at once, same endpoints of near links are compared as is_same_point
+            boxes = np.concatenate((endpoints - df.ZERO_THRESHOLD, endpoints + df.ZERO_THRESHOLD), axis=1)
+            queries, links = self.spatial_index.query_batch(boxes)
+            queries = np.repeat(queries, 2)
+            near_endpoints = np.stack((2 * links, 2 * links + 1), axis=1).reshape(-1)
+            same = np.all(endpoints[queries] == endpoints[near_endpoints], axis=1)
+            queries = queries[same]
+            near_endpoints = near_endpoints[same].tolist()
+            bounds = np.searchsorted(queries, np.arange(endpoints.shape[0] + 1)).tolist()
+
+            # endpoints are visited in link order, the first endpoint without node creates a node
+            # for all same endpoints near it
+            endpoint_nodes = [None] * endpoints.shape[0]
+            for i, point in enumerate(endpoints.tolist()):
+                if endpoint_nodes[i] is not None:
+                    continue
+                node = Node(file_operator.create_feature({}, point_to_geometry(point)))
+                for near_endpoint in near_endpoints[bounds[i]:bounds[i + 1]]:
+                    endpoint_nodes[near_endpoint] = node
+                    node.link_list.append(self.link_list[near_endpoint // 2])
+                self.node_list.append(node)
+
+        with instrument.phase('init_topology.link', len(self.link_list)):
+            for i, link in enumerate(self.link_list):
+                link.snode = endpoint_nodes[2 * i]
+                link.enode = endpoint_nodes[2 * i + 1]
+
+    def _create_nodes_by_grid(self, snap_tolerance):
+        with instrument.phase('init_topology.node', len(self.link_list)):
+            endpoints = self._get_link_endpoints()
+
+            groups, group_firsts = endpoint_snap.snap_points(endpoints[:, 0], endpoints[:, 1], snap_tolerance)
+            nodes = list()
+            for point in endpoints[group_firsts].tolist():
+                feature = file_operator.create_feature({}, point_to_geometry(point))
+                nodes.append(Node(feature))
+
+        with instrument.phase('init_topology.link', len(self.link_list)):
+            groups = groups.tolist()
+            for i, link in enumerate(self.link_list):
+                snode = nodes[groups[2 * i]]
+                enode = nodes[groups[2 * i + 1]]
+                link.snode = snode
+                link.enode = enode
+                snode.link_list.append(link)
+                enode.link_list.append(link)
+            self.node_list.extend(nodes)
 
     def get_links(self):
         return self.link_list
@@ -114,17 +161,199 @@ class TopoFramework(object):
     def get_nodes(self):
         return self.node_list
 
+    def search_links(self, box):
+        """
+        :param box: [x_min, y_min, x_max, y_max]
+        :return: links whose box intersect with box
+        """
+        if self.spatial_index is None:
+            return list()
+        return self.spatial_index.intersect(box)
+
+    def search_links_batch(self, boxes):
+        """
+        :param boxes: [[x_min, y_min, x_max, y_max]]
+        :return: [links] for every box
+        """
+        if self.spatial_index is None:
+            return [list() for _ in boxes]
+        return self.spatial_index.intersect_batch(boxes)
+
+    def add_link(self, feature):
+        """
+        :param feature: road feature, ogr.Feature
+        :return: new link, connected to nodes at its endpoints
+        """
+        self._init_positions()
+        link = Link(feature)
+        append_item(self.road_features, self._feature_positions, feature)
+        self._attach_link(link)
+        return link
+
+    def remove_link(self, link):
+        """
+        :param link: link in topology, nodes left without link are removed
+        """
+        self._detach_link(link)
+        remove_item(self.road_features, self._feature_positions, link.feature)
+
+    def update_link(self, link, feature):
+        """
+        :param link: link in topology
+        :param feature: new road feature of link, ogr.Feature
+        :return: link, connected again by its new endpoints
+        """
+        self._detach_link(link)
+        # old feature of link is replaced, stale features are not kept
+        replace_item(self.road_features, self._feature_positions, link.feature, feature)
+        link.feature = feature
+        self._attach_link(link)
+        return link
+
+    def apply_changes(self, inserts=(), deletes=(), updates=()):
+        """
+        update topology locally, order of link list and node list is not kept
+        :param inserts: new road features
+        :param deletes: links to remove
+        :param updates: [(link, new road feature)]
+        :return: new links of inserts
+        """
+        for link in deletes:
+            self.remove_link(link)
+        for link, feature in updates:
+            self.update_link(link, feature)
+        return [self.add_link(feature) for feature in inserts]
+
+    def _init_positions(self):
+        # positions in link list and node list, for removing in constant time
+        if self.spatial_index is None:
+            self.spatial_index = spatial_index.DynamicIndex([], [])
+        if self._link_positions is None:
+            self._link_positions = dict((id(link), i) for i, link in enumerate(self.link_list))
+            self._node_positions = dict((id(node), i) for i, node in enumerate(self.node_list))
+            self._feature_positions = dict((id(feature), i) for i, feature in enumerate(self.road_features))
+
+    def _is_same_endpoint(self, point1, point2):
+        if self.snap_tolerance is None:
+            return is_same_point(point1, point2)
+        return distance_process.calc_point_distance(point1, point2,
+                                                    distance_process.PRECISION_HAVERSINE) <= self.snap_tolerance
+
+    def _get_endpoint_box(self, point):
+        if self.snap_tolerance is None:
+            return get_point_box(point, df.ZERO_THRESHOLD)
+        lon_buffer, lat_buffer = distance_process.calc_degree_buffer(point[df.INDEX_LAT], self.snap_tolerance)
+        x = point[df.INDEX_LON]
+        y = point[df.INDEX_LAT]
+        return [x - float(lon_buffer), y - float(lat_buffer), x + float(lon_buffer), y + float(lat_buffer)]
+
+    def _attach_link(self, link):
+        self._init_positions()
+        self.spatial_index.insert(link, get_feature_box(link.feature))
+        append_item(self.link_list, self._link_positions, link)
+        s_point, e_point = get_feature_endpoints(link.feature)
+        link.snode = self._find_endpoint_node(s_point)
+        link.snode.link_list.append(link)
+        link.enode = self._find_endpoint_node(e_point)
+        link.enode.link_list.append(link)
+
+    def _find_endpoint_node(self, point):
+        # nodes of all near link endpoints at point are merged into one
+        nodes = list()
+        for near_link in self.spatial_index.intersect(self._get_endpoint_box(point)):
+            near_s_point, near_e_point = get_feature_endpoints(near_link.feature)
+            for near_point, near_node in ((near_s_point, near_link.snode), (near_e_point, near_link.enode)):
+                if near_node is None or any(near_node is node for node in nodes):
+                    continue
+                if self._is_same_endpoint(near_point, point):
+                    nodes.append(near_node)
+        if not nodes:
+            node = Node(file_operator.create_feature({}, point_to_geometry(point)))
+            append_item(self.node_list, self._node_positions, node)
+            return node
+        for other in nodes[1:]:
+            self._merge_node(nodes[0], other)
+        return nodes[0]
+
+    def _merge_node(self, node, other):
+        for link in other.link_list:
+            if link.snode is other:
+                link.snode = node
+            if link.enode is other:
+                link.enode = node
+            node.link_list.append(link)
+        other.link_list = list()
+        remove_item(self.node_list, self._node_positions, other)
+
+    def _detach_link(self, link):
+        self._init_positions()
+        self.spatial_index.remove(link)
+        remove_item(self.link_list, self._link_positions, link)
+        nodes = [link.snode] if link.snode is link.enode else [link.snode, link.enode]
+        link.snode = None
+        link.enode = None
+        for node in nodes:
+            if node is None or id(node) not in self._node_positions:
+                continue
+            node.link_list = [node_link for node_link in node.link_list if node_link is not link]
+            if not node.link_list:
+                remove_item(self.node_list, self._node_positions, node)
+            elif self.snap_tolerance is not None:
+                self._split_node(node)
+
+    def _split_node(self, node):
+        # endpoints chained by a removed link may be out of tolerance now
+        ends = list()
+        for link in set(node.link_list):
+            s_point, e_point = get_feature_endpoints(link.feature)
+            if link.snode is node:
+                ends.append((link, True, s_point))
+            if link.enode is node:
+                ends.append((link, False, e_point))
+        points = np.array([point for _, _, point in ends], dtype=np.float64).reshape(-1, 2)
+        groups, group_firsts = endpoint_snap.snap_points(points[:, 0], points[:, 1], self.snap_tolerance)
+        if group_firsts.shape[0] <= 1:
+            return
+        nodes = [node] + [Node(file_operator.create_feature({}, point_to_geometry(ends[first][2])))
+                          for first in group_firsts[1:].tolist()]
+        for new_node in nodes:
+            new_node.link_list = list()
+        for (link, is_start, _), group in zip(ends, groups.tolist()):
+            if is_start:
+                link.snode = nodes[group]
+            else:
+                link.enode = nodes[group]
+            nodes[group].link_list.append(link)
+        for new_node in nodes[1:]:
+            append_item(self.node_list, self._node_positions, new_node)
+
 
 class TopoFrameWork2(object):
     """
     use road features and node features to build relationship
     """
-    def __init__(self, road_layer, node_layer):
+    def __init__(self, road_layer, node_layer, key_mode=KEY_MODE_STRING, probe_neighbours=False,
+                 key_resolution=df.NODE_KEY_RESOLUTION):
+        """
+        :param road_layer: road features
+        :param node_layer: node features
+        :param key_mode: KEY_MODE_STRING or KEY_MODE_INTEGER
+        :param probe_neighbours: integer key mode only, road endpoint without node at its key
+                                 is matched to node at neighbour key
+        :param key_resolution: integer key mode only, degree of one key step
+        """
         self.road_features = [feature for feature in road_layer]
         self.node_features = [feature for feature in node_layer]
+        self.key_mode = key_mode
+        self.probe_neighbours = probe_neighbours and key_mode == KEY_MODE_INTEGER
+        self.key_resolution = key_resolution
         self.key_node_dict = dict()
         self.link_list = list()
         self.node_list = list()
+        self._link_positions = None
+        self._node_positions = None
+        self._feature_positions = None
+        self._key_pending_dict = None
 
     def __del__(self):
         for feature in self.road_features:
@@ -134,44 +363,259 @@ class TopoFrameWork2(object):
 
     def init_topology(self):
         # init node key relationship
-        for feature in self.node_features:
-            node = Node(feature)
-            key = self._get_node_key(feature)
-            self.key_node_dict[key] = node
-            self.node_list.append(node)
+        with instrument.phase('init_topology.node', len(self.node_features)):
+            node_keys = self._get_node_keys(self.node_features)
+            for feature, key in zip(self.node_features, node_keys):
+                node = Node(feature)
+                self.key_node_dict[key] = node
+                self.node_list.append(node)
 
         # build topology relationship
-        for feature in self.road_features:
-            snode_key = self._get_snode_key(feature)
-            enode_key = self._get_enode_key(feature)
-            snode = self.key_node_dict.get(snode_key, None)
-            enode = self.key_node_dict.get(enode_key, None)
-            link = Link(feature, snode, enode)
-            if snode:
-                snode.link_list.append(link)
-            if enode:
-                enode.link_list.append(link)
+        with instrument.phase('init_topology.link', len(self.road_features)):
+            snode_keys, enode_keys = self._get_link_keys(self.road_features)
+            for feature, snode_key, enode_key in zip(self.road_features, snode_keys, enode_keys):
+                snode = self._find_key_node(snode_key)
+                enode = self._find_key_node(enode_key)
+                link = Link(feature, snode, enode)
+                self.link_list.append(link)
+                if snode:
+                    snode.link_list.append(link)
+                if enode:
+                    enode.link_list.append(link)
+
+    def get_links(self):
+        return self.link_list
+
+    def get_nodes(self):
+        return self.node_list
+
+    def add_link(self, feature):
+        """
+        :param feature: road feature, ogr.Feature
+        :return: new link, connected to nodes with same key
+        """
+        self._init_positions()
+        link = Link(feature)
+        append_item(self.road_features, self._feature_positions, feature)
+        self._attach_link(link)
+        return link
+
+    def remove_link(self, link):
+        """
+        :param link: link in topology
+        """
+        self._detach_link(link)
+        remove_item(self.road_features, self._feature_positions, link.feature)
+
+    def update_link(self, link, feature):
+        """
+        :param link: link in topology
+        :param feature: new road feature of link, ogr.Feature
+        :return: link, connected again by its new endpoints
+        """
+        self._detach_link(link)
+        # old feature of link is replaced, stale features are not kept
+        replace_item(self.road_features, self._feature_positions, link.feature, feature)
+        link.feature = feature
+        self._attach_link(link)
+        return link
+
+    def add_node(self, feature):
+        """
+        :param feature: node feature, ogr.Feature
+        :return: new node, links waiting for its key are connected
+        """
+        self._init_positions()
+        node = Node(feature)
+        self.node_features.append(feature)
+        key = self._get_node_key(feature)
+        self.key_node_dict[key] = node
+        append_item(self.node_list, self._node_positions, node)
+        keys = [key]
+        if self.probe_neighbours:
+            keys.extend(key + offset for offset in NEIGHBOUR_KEY_OFFSETS)
+        for pending_key in keys:
+            for link, is_start in self._key_pending_dict.pop(pending_key, list()):
+                if is_start:
+                    link.snode = node
+                else:
+                    link.enode = node
+                node.link_list.append(link)
+        return node
+
+    def remove_node(self, node):
+        """
+        :param node: node in topology, its links keep waiting for a node with same key
+        """
+        self._init_positions()
+        key = self._get_node_key(node.feature)
+        if self.key_node_dict.get(key) is node:
+            del self.key_node_dict[key]
+        remove_item(self.node_list, self._node_positions, node)
+        for link in node.link_list:
+            if link.snode is node:
+                link.snode = None
+                link_key = self._get_snode_key(link.feature)
+                self._key_pending_dict.setdefault(link_key, list()).append((link, True))
+            if link.enode is node:
+                link.enode = None
+                link_key = self._get_enode_key(link.feature)
+                self._key_pending_dict.setdefault(link_key, list()).append((link, False))
+        node.link_list = list()
+
+    def apply_changes(self, inserts=(), deletes=(), updates=()):
+        """
+        update topology locally, order of link list and node list is not kept
+        :param inserts: new road features
+        :param deletes: links to remove
+        :param updates: [(link, new road feature)]
+        :return: new links of inserts
+        """
+        for link in deletes:
+            self.remove_link(link)
+        for link, feature in updates:
+            self.update_link(link, feature)
+        return [self.add_link(feature) for feature in inserts]
+
+    def _init_positions(self):
+        # positions in lists and links waiting for node, built on first update
+        if self._link_positions is not None:
+            return
+        self._link_positions = dict((id(link), i) for i, link in enumerate(self.link_list))
+        self._node_positions = dict((id(node), i) for i, node in enumerate(self.node_list))
+        self._feature_positions = dict((id(feature), i) for i, feature in enumerate(self.road_features))
+        self._key_pending_dict = dict()
+        pending_links = [link for link in self.link_list if link.snode is None or link.enode is None]
+        snode_keys, enode_keys = self._get_link_keys([link.feature for link in pending_links])
+        for link, snode_key, enode_key in zip(pending_links, snode_keys, enode_keys):
+            if link.snode is None:
+                self._key_pending_dict.setdefault(snode_key, list()).append((link, True))
+            if link.enode is None:
+                self._key_pending_dict.setdefault(enode_key, list()).append((link, False))
+
+    def _attach_link(self, link):
+        self._init_positions()
+        append_item(self.link_list, self._link_positions, link)
+        for key, is_start in ((self._get_snode_key(link.feature), True), (self._get_enode_key(link.feature), False)):
+            node = self._find_key_node(key)
+            if is_start:
+                link.snode = node
+            else:
+                link.enode = node
+            if node:
+                node.link_list.append(link)
+            else:
+                self._key_pending_dict.setdefault(key, list()).append((link, is_start))
+
+    def _detach_link(self, link):
+        self._init_positions()
+        remove_item(self.link_list, self._link_positions, link)
+        for key, node in ((self._get_snode_key(link.feature), link.snode),
+                          (self._get_enode_key(link.feature), link.enode)):
+            if node:
+                node.link_list = [node_link for node_link in node.link_list if node_link is not link]
+            elif key in self._key_pending_dict:
+                pending = [item for item in self._key_pending_dict[key] if item[0] is not link]
+                if pending:
+                    self._key_pending_dict[key] = pending
+                else:
+                    del self._key_pending_dict[key]
+        link.snode = None
+        link.enode = None
+
+    def _find_key_node(self, key):
+        node = self.key_node_dict.get(key, None)
+        if node is None and self.probe_neighbours:
+            for offset in NEIGHBOUR_KEY_OFFSETS:
+                node = self.key_node_dict.get(key + offset, None)
+                if node is not None:
+                    break
+        return node
+
+    def _get_node_keys(self, features):
+        # keys of all node features, integer keys are built in one pass
+        if self.key_mode != KEY_MODE_INTEGER:
+            return [self._get_node_key(feature) for feature in features]
+        points = [feature.GetGeometryRef().GetPoint() for feature in features]
+        points = np.array([point[:2] for point in points], dtype=np.float64).reshape(-1, 2)
+        return calc_point_keys(points[:, df.INDEX_LON], points[:, df.INDEX_LAT], self.key_resolution).tolist()
+
+    def _get_link_keys(self, features):
+        # start node keys, end node keys of all road features
+        if self.key_mode != KEY_MODE_INTEGER:
+            return ([self._get_snode_key(feature) for feature in features],
+                    [self._get_enode_key(feature) for feature in features])
+        endpoints = np.array([get_feature_endpoints(feature) for feature in features],
+                             dtype=np.float64).reshape(-1, 2, 2)
+        snode_keys = calc_point_keys(endpoints[:, 0, df.INDEX_LON], endpoints[:, 0, df.INDEX_LAT], self.key_resolution)
+        enode_keys = calc_point_keys(endpoints[:, 1, df.INDEX_LON], endpoints[:, 1, df.INDEX_LAT], self.key_resolution)
+        return snode_keys.tolist(), enode_keys.tolist()
+
+    def _get_point_key(self, pt):
+        if self.key_mode == KEY_MODE_INTEGER:
+            return int(calc_point_keys([pt[df.INDEX_LON]], [pt[df.INDEX_LAT]], self.key_resolution)[0])
+        key = "|".join([str(pt[df.INDEX_LON]), str(pt[df.INDEX_LAT])])
+        return key
 
     def _get_node_key(self, feature):
         # use geometry as key. you can identify your own key.
         geometry = feature.GetGeometryRef()
         pt = geometry.GetPoint()
-        key = "|".join([str(pt[df.INDEX_LON]), str(pt[df.INDEX_LAT])])
-        return key
+        return self._get_point_key(pt)
 
     def _get_snode_key(self, feature):
         # use geometry as key. you can identify your own key.
         geometry = feature.GetGeometryRef()
         pt = geometry.GetPoint(0)
-        key = "|".join([str(pt[df.INDEX_LON]), str(pt[df.INDEX_LAT])])
-        return key
+        return self._get_point_key(pt)
 
     def _get_enode_key(self, feature):
         # use geometry as key. you can identify your own key.
         geometry = feature.GetGeometryRef()
         pt = geometry.GetPoint(geometry.GetPointCount() - 1)
-        key = "|".join([str(pt[df.INDEX_LON]), str(pt[df.INDEX_LAT])])
-        return key
+        return self._get_point_key(pt)
+
+
+def calc_point_keys(lons, lats, resolution=df.NODE_KEY_RESOLUTION):
+    """
+    :param lons: longitudes of points
+    :param lats: latitudes of points
+    :param resolution: degree of one key step
+    :return: packed int64 keys of coordinates rounded to resolution
+    """
+    cols = np.floor(np.asarray(lons, dtype=np.float64) / resolution + 0.5)
+    rows = np.floor(np.asarray(lats, dtype=np.float64) / resolution + 0.5)
+    return endpoint_snap.calc_cell_keys(cols, rows)
+
+
+def append_item(items, positions, item):
+    # positions: {id(item): index in items}
+    positions[id(item)] = len(items)
+    items.append(item)
+
+
+def remove_item(items, positions, item):
+    # move last item into the hole, order of items is not kept
+    index = positions.pop(id(item))
+    last = items.pop()
+    if last is not item:
+        items[index] = last
+        positions[id(last)] = index
+
+
+def replace_item(items, positions, item, new_item):
+    # new item takes the place of item
+    index = positions.pop(id(item))
+    items[index] = new_item
+    positions[id(new_item)] = index
+
+
+def get_feature_endpoints(feature):
+    # return start point and end point (longitude, latitude) of line feature
+    geometry = feature.GetGeometryRef()
+    s_point = geometry.GetPoint(0)
+    e_point = geometry.GetPoint(geometry.GetPointCount() - 1)
+    return (s_point[df.INDEX_LON], s_point[df.INDEX_LAT]), (e_point[df.INDEX_LON], e_point[df.INDEX_LAT])
 
 
 def get_feature_box(feature, buffer=0.0):
@@ -214,3 +658,10 @@ def point_to_geometry(point):
     geometry = ogr.Geometry(ogr.wkbPoint)
     geometry.AddPoint(point[df.INDEX_LON], point[df.INDEX_LAT])
     return geometry
+
+
+def line_to_geometry(line):
+    geometry = ogr.Geometry(ogr.wkbLineString)
+    for point in line:
+        geometry.AddPoint(point[df.INDEX_LON], point[df.INDEX_LAT])
+    return geometry
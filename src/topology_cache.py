@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/8/2 11:15 AM 
+# @Author : yangyuxin
+# @File : topology_cache.py
+# 这个代码文件把建好的紧凑拓扑保存到磁盘，重新加载时使用内存映射
+# 缓存用源文件指纹判断是否失效，同一台机器上的多个进程可以共享一份只读拓扑
+
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import data_define as df
+import distance_process
+import file_operator
+import compact_topology
+
+
+CACHE_VERSION = 1
+META_FILE_NAME = 'meta.json'
+CURRENT_FILE_NAME = 'current'  # holds name of version directory in use, replaced atomically
+VERSION_PREFIX = 'v.'  # complete version directory, name sorts by finish time
+TEMP_PREFIX = 'tmp.'  # version directory being written
+KEEP_VERSIONS = 2  # newest versions kept, readers may still be opening the previous one
+# (array name, array is optional)
+ARRAY_NAMES = [
+    ('link_snodes', False),
+    ('link_enodes', False),
+    ('node_points', False),
+    ('link_lengths', False),
+    ('node_link_offsets', False),
+    ('node_links', False),
+    ('node_neighbours', False),
+    ('link_fids', True),
+    ('coords', True),
+    ('coord_offsets', True),
+]
+# companion files of one data source, they change together with the main file
+COMPANION_EXTENSIONS = ['.shp', '.shx', '.dbf', '.prj', '.tab', '.dat', '.map', '.id', '.mif', '.mid']
+
+
+def calc_file_fingerprint(file_path, snap_tolerance=df.SAME_POINT_DISTANCE):
+    """
+    :param file_path: source data file path
+    :param snap_tolerance: snap tolerance used to build topology
+    :return: fingerprint string of file content state and build parameters
+    """
+    stem = os.path.splitext(file_path)[0]
+    paths = [file_path] + [stem + extension for extension in COMPANION_EXTENSIONS]
+    digest = hashlib.sha1()
+    # link lengths depend on distance precision tier
+    digest.update(('version=%d;tolerance=%r;precision=%d;' % (CACHE_VERSION, float(snap_tolerance),
+                                                               distance_process.get_precision())).encode('utf-8'))
+    for path in sorted(set(paths)):
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        digest.update(('%s;%d;%d;' % (os.path.basename(path), stat.st_size, int(stat.st_mtime * 1000000))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_version_dir(cache_dir):
+    """
+    :param cache_dir: cache directory
+    :return: version directory in use, cache_dir itself if it has no version
+    """
+    try:
+        with open(os.path.join(cache_dir, CURRENT_FILE_NAME), 'r') as current_file:
+            name = current_file.read().strip()
+    except (IOError, OSError):
+        return cache_dir
+    return os.path.join(cache_dir, name) if name else cache_dir
+
+
+def save_topology(topology, cache_dir, fingerprint):
+    """
+    write topology arrays into a new version directory of cache directory, then point cache at it.
+    readers always see a complete version, old versions are removed after the switch
+    :param topology: CompactTopology
+    :param cache_dir: cache directory
+    :param fingerprint: fingerprint of source data
+    :return: version directory
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    try:
+        os.makedirs(cache_dir)
+    except OSError:
+        # created by another builder
+        if not os.path.isdir(cache_dir):
+            raise
+    temp_dir = os.path.join(cache_dir, '%s%d' % (TEMP_PREFIX, os.getpid()))
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir)
+
+    arrays = dict()
+    for name, _ in ARRAY_NAMES:
+        array = getattr(topology, name)
+        if array is None:
+            continue
+        np.save(os.path.join(temp_dir, name + '.npy'), np.ascontiguousarray(array))
+        arrays[name] = True
+    meta = {
+        'version': CACHE_VERSION,
+        'fingerprint': fingerprint,
+        'node_num': int(topology.get_node_num()),
+        'link_num': int(topology.get_link_num()),
+        'arrays': sorted(arrays.keys()),
+    }
+    with open(os.path.join(temp_dir, META_FILE_NAME), 'w') as meta_file:
+        json.dump(meta, meta_file)
+
+    # version name is unique and taken when writing is finished, concurrent builders never rename onto each other
+    version_name = '%s%016d.%d' % (VERSION_PREFIX, int(time.time() * 1000000), os.getpid())
+    version_dir = os.path.join(cache_dir, version_name)
+    os.rename(temp_dir, version_dir)
+    current_temp = os.path.join(cache_dir, '%s%s.%d' % (TEMP_PREFIX, CURRENT_FILE_NAME, os.getpid()))
+    with open(current_temp, 'w') as current_file:
+        current_file.write(version_name)
+    os.replace(current_temp, os.path.join(cache_dir, CURRENT_FILE_NAME))
+    remove_old_versions(cache_dir)
+    return version_dir
+
+
+def remove_old_versions(cache_dir, keep=KEEP_VERSIONS):
+    """
+    remove version directories older than the newest keep ones, the version in use is always kept.
+    arrays mapped by readers stay readable after their files are removed
+    :param cache_dir: cache directory
+    :param keep: count of newest versions kept
+    """
+    version_dir = get_version_dir(cache_dir)
+    if version_dir == cache_dir:
+        return
+    current = os.path.basename(version_dir)
+    names = sorted(name for name in os.listdir(cache_dir) if name.startswith(VERSION_PREFIX))
+    for name in names[:max(len(names) - keep, 0)]:
+        if name != current:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    # arrays of cache written before versions, meta first so it is never read as complete
+    for name in [META_FILE_NAME] + [array_name + '.npy' for array_name, _ in ARRAY_NAMES]:
+        path = os.path.join(cache_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def read_cache_meta(cache_dir):
+    """
+    :param cache_dir: cache directory
+    :return: meta dict, None if cache is missing or broken
+    """
+    meta_path = os.path.join(cache_dir, META_FILE_NAME)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as meta_file:
+            return json.load(meta_file)
+    except ValueError:
+        return None
+
+
+def load_topology(cache_dir, fingerprint=None, mmap_mode='r', layer=None):
+    """
+    :param cache_dir: cache directory
+    :param fingerprint: expected fingerprint, None skips the check
+    :param mmap_mode: numpy memory map mode, 'r' shares read only pages between processes. None reads into memory
+    :param layer: road layer for lazy feature access
+    :return: CompactTopology, None if cache is missing or invalid
+    """
+    cache_dir = get_version_dir(cache_dir)
+    meta = read_cache_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return None
+    if fingerprint is not None and meta.get('fingerprint') != fingerprint:
+        return None
+
+    arrays = dict()
+    for name, optional in ARRAY_NAMES:
+        path = os.path.join(cache_dir, name + '.npy')
+        if name not in meta['arrays'] or not os.path.exists(path):
+            if not optional:
+                return None
+            arrays[name] = None
+            continue
+        try:
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        except (IOError, OSError):
+            # old version removed while it is read
+            return None
+
+    adjacency = (arrays['node_link_offsets'], arrays['node_links'], arrays['node_neighbours'])
+    return compact_topology.CompactTopology(arrays['link_snodes'], arrays['link_enodes'], arrays['node_points'],
+                                            arrays['link_lengths'], arrays['link_fids'], arrays['coords'],
+                                            arrays['coord_offsets'], layer, None, adjacency)
+
+
+def load_or_build_topology(file_path, cache_dir, snap_tolerance=df.SAME_POINT_DISTANCE, mmap_mode='r'):
+    """
+    load topology from cache, build and save it when cache is missing or source file changed
+    :param file_path: road data file path
+    :param cache_dir: cache directory
+    :param snap_tolerance: endpoints not farther than it share one node. the unit is metre
+    :param mmap_mode: numpy memory map mode of loaded arrays
+    :return: CompactTopology, None if road file can not be read
+    """
+    fingerprint = calc_file_fingerprint(file_path, snap_tolerance)
+    topology = load_topology(cache_dir, fingerprint, mmap_mode)
+    if topology is not None:
+        return topology
+
+    reader = file_operator.FileReader(file_path)
+    if not reader.is_valid():
+        return None
+    layer = reader.get_lyr_file()
+    topology = compact_topology.CompactTopology.from_layer(layer, snap_tolerance)
+    save_topology(topology, cache_dir, fingerprint)
+    loaded = load_topology(cache_dir, fingerprint, mmap_mode, layer)
+    # cache replaced by another process before it is read again, the built topology is still right
+    return topology if loaded is None else loaded
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/9/6 10:30 AM 
+# @Author : yangyuxin
+# @File : turn_angle_process.py
+# 这个代码文件一次性计算每条道路两端的方向角，并生成每个节点所有道路对的转向角表
+# 角度与 angle_process 相同，从正北顺时针，单位为度。转向角 0 为直行，90 为右转，180 为掉头，270 为左转
+
+
+import numpy as np
+import data_define as df
+import distance_process
+import angle_process
+import compact_topology
+import polyline
+import spatial_index
+
+
+BEARING_LENGTH = 20.0  # length from link end used to get link direction, metre
+
+
+def interpolate_lines(coords, offsets, measures, line_indexes, targets):
+    """
+    :param coords: points of all lines, numpy array of shape (n, 2)
+    :param offsets: line i is coords[offsets[i]:offsets[i + 1]], every line has at least two points
+    :param measures: result of polyline.calc_line_measures
+    :param line_indexes: line of every target
+    :param targets: cumulative length of every target, inside its line
+    :return: points at targets, numpy array of shape (k, 2)
+    """
+    starts = offsets[line_indexes]
+    ends = offsets[line_indexes + 1] - 1
+    # segment of target is (k - 1, k)
+    k = np.clip(np.searchsorted(measures, targets, side='left'), starts + 1, ends)
+    lengths = measures[k] - measures[k - 1]
+    percents = np.where(lengths > 0.0, (targets - measures[k - 1]) / np.where(lengths > 0.0, lengths, 1.0), 0.0)
+    percents = np.clip(percents, 0.0, 1.0)
+    return coords[k - 1] + percents[:, None] * (coords[k] - coords[k - 1])
+
+
+def calc_link_end_angles(coords, offsets, length=BEARING_LENGTH):
+    """
+    direction of every link leaving its two ends, line from end point to the point length away along link
+    :param coords: points of all links, numpy array of shape (n, 2)
+    :param offsets: link i is coords[offsets[i]:offsets[i + 1]]
+    :param length: length from link end used to get direction. the unit is metre
+    :return: angles leaving start point, angles leaving end point. nan if link has no length
+    """
+    coords = distance_process.to_point_array(coords)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    link_num = offsets.shape[0] - 1
+    start_angles = np.full(link_num, np.nan, dtype=np.float64)
+    end_angles = np.full(link_num, np.nan, dtype=np.float64)
+    measures = polyline.calc_line_measures(coords, offsets)
+    links = np.flatnonzero(offsets[1:] - offsets[:-1] >= 2)
+    s_measures = measures[offsets[links]]
+    e_measures = measures[offsets[links + 1] - 1]
+    has_length = e_measures > s_measures
+    links = links[has_length]
+    s_measures = s_measures[has_length]
+    e_measures = e_measures[has_length]
+    s_points = coords[offsets[links]]
+    e_points = coords[offsets[links + 1] - 1]
+
+    parts = np.minimum(length, e_measures - s_measures)
+    s_targets = interpolate_lines(coords, offsets, measures, links, s_measures + parts)
+    e_targets = interpolate_lines(coords, offsets, measures, links, e_measures - parts)
+    start_angles[links] = angle_process.calc_angle_array(s_points[:, 0], s_points[:, 1],
+                                                         s_targets[:, 0], s_targets[:, 1])
+    end_angles[links] = angle_process.calc_angle_array(e_points[:, 0], e_points[:, 1],
+                                                       e_targets[:, 0], e_targets[:, 1])
+    return start_angles, end_angles
+
+
+def calc_slot_is_start(topology):
+    """
+    :param topology: CompactTopology
+    :return: is adjacency slot the start of its link, numpy bool array in node_links order.
+             a self loop link has two slots at its node, the first one is its start
+    """
+    link_num = topology.get_link_num()
+    ends = np.concatenate((topology.link_snodes, topology.link_enodes))
+    sources = np.arange(2 * link_num)
+    valid = ends != compact_topology.NO_NODE
+    # same stable order as CompactTopology adjacency
+    order = np.argsort(ends[valid], kind='stable')
+    return sources[valid][order] < link_num
+
+
+class TurnTable(object):
+    """
+    turn angles of all link pairs of every node.
+    turns of node i are angles[turn_offsets[i]:turn_offsets[i + 1]], a degree * degree matrix in row major order.
+    row is the slot of link coming in, column is the slot of link going out, slot order is node_links order.
+    """
+    def __init__(self, topology, length=BEARING_LENGTH):
+        """
+        :param topology: CompactTopology with link coordinates
+        :param length: length from link end used to get link direction. the unit is metre
+        """
+        self.topology = topology
+        start_angles, end_angles = calc_link_end_angles(topology.coords, topology.coord_offsets, length)
+        node_links = topology.node_links
+        # direction leaving node through every slot
+        is_start = calc_slot_is_start(topology)
+        self.slot_angles = np.where(is_start, start_angles[node_links], end_angles[node_links])
+
+        degrees = topology.get_node_degrees()
+        squares = degrees * degrees
+        self.turn_offsets = np.concatenate(([0], np.cumsum(squares))).astype(np.int64)
+        turns, nodes = spatial_index.expand_ranges(self.turn_offsets[:-1], self.turn_offsets[1:])
+        local = turns - self.turn_offsets[nodes]
+        node_degrees = degrees[nodes]
+        slot_offsets = topology.node_link_offsets[nodes]
+        from_slots = slot_offsets + local // np.maximum(node_degrees, 1)
+        to_slots = slot_offsets + local % np.maximum(node_degrees, 1)
+        # coming in is the opposite of leaving
+        self.angles = angle_process.calc_turn_angle_array(self.slot_angles[from_slots] + 180.0,
+                                                          self.slot_angles[to_slots])
+
+    def get_node_turns(self, node_id):
+        """
+        :param node_id: node id
+        :return: link ids of slots, turn angle matrix of shape (degree, degree)
+        """
+        links = self.topology.get_node_links(node_id)
+        matrix = self.angles[self.turn_offsets[node_id]:self.turn_offsets[node_id + 1]]
+        return links, matrix.reshape(links.shape[0], links.shape[0])
+
+    def get_turn_angle(self, node_id, from_link, to_link):
+        """
+        :param node_id: node id, passed node
+        :param from_link: link id coming into node
+        :param to_link: link id going out of node
+        :return: turn angle, clockwise. the unit is degree. None if a link is not at node, nan if angle is unknown
+        """
+        links = self.topology.get_node_links(node_id).tolist()
+        if from_link not in links or to_link not in links:
+            return None
+        from_slot = links.index(from_link)
+        to_slot = links.index(to_link)
+        if from_link == to_link and links.count(from_link) > 1:
+            # self loop comes in from one end and goes out from its other end
+            to_slot = len(links) - 1 - links[::-1].index(to_link)
+        return float(self.angles[self.turn_offsets[node_id] + from_slot * len(links) + to_slot])
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 10:05 AM 
+# @Author : yangyuxin
+# @File : conftest.py
+# 测试直接导入 src 下的模块，与程序中的导入方式相同
+
+
+import os
+import sys
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 10:40 AM 
+# @Author : yangyuxin
+# @File : test_angle_process.py
+# calc_line_angle 四个象限的结果与 calc_angle_array 一致，calc_line2line_angle 不把 0 度当作没有角度
+
+
+import numpy as np
+import angle_process
+
+
+def test_line_angle_quadrants():
+    # north east, south east, south west, north west of start point
+    for delta_lon, delta_lat, expected in [(1.0, 1.0, 45.0), (1.0, -1.0, 135.0),
+                                           (-1.0, -1.0, 225.0), (-1.0, 1.0, 315.0)]:
+        line = [[116.0, 39.0], [116.0 + delta_lon, 39.0 + delta_lat]]
+        assert abs(angle_process.calc_line_angle(line) - expected) < 1e-9
+
+
+def test_line_angle_axes():
+    for e_pt, expected in [([116.0, 40.0], 0.0), ([117.0, 39.0], 90.0), ([116.0, 38.0], 180.0),
+                           ([115.0, 39.0], 270.0), ([116.0, 39.0], 0.0)]:
+        assert angle_process.calc_line_angle([[116.0, 39.0], e_pt]) == expected
+
+
+def test_line_angle_matches_array():
+    rng = np.random.RandomState(7)
+    starts = rng.uniform([115.0, 39.0], [117.0, 41.0], (200, 2))
+    ends = starts + rng.uniform(-0.01, 0.01, (200, 2))
+    expected = angle_process.calc_angle_array(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+    for i in range(200):
+        assert abs(angle_process.calc_line_angle([starts[i], ends[i]]) - expected[i]) < 1e-9
+
+
+def test_line2line_angle_with_north_line():
+    # a north line has angle 0, it was treated as missing
+    north = [[116.0, 39.0], [116.0, 39.1]]
+    east = [[116.0, 39.1], [116.1, 39.1]]
+    assert angle_process.calc_line2line_angle(north, east) == 90.0
+    assert angle_process.calc_line2line_angle(east, north) == 270.0
+    assert angle_process.calc_line2line_angle(north, north) == 0.0
+
+
+def test_line2line_angle_without_angle():
+    line = [[116.0, 39.0], [116.1, 39.1]]
+    assert angle_process.calc_line2line_angle([[116.0, 39.0]], line) is None
+    assert angle_process.calc_line2line_angle(line, []) is None
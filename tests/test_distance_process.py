@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 10:20 AM 
+# @Author : yangyuxin
+# @File : test_distance_process.py
+# xyz_to_lonlat 返回角度，逐段最近点与向量化的 calc_nearest_points_on_line 结果一致
+
+
+import math
+import numpy as np
+import distance_process
+
+
+def test_xyz_to_lonlat_returns_degree():
+    # longitudes of all quadrants, old acos formula failed or lost the sign on most of them
+    for lon, lat in [(116.3, 39.9), (-73.9, 40.7), (151.2, -33.9), (-58.4, -34.6), (0.0, 0.0), (179.9, 89.9)]:
+        x, y, z = distance_process.lonlat_to_xyz(lon, lat)
+        result = distance_process.xyz_to_lonlat(x, y, z)
+        assert abs(result[0] - lon) < 1e-9
+        assert abs(result[1] - lat) < 1e-9
+
+
+def test_xyz_to_lonlat_not_unit_vector():
+    x, y, z = distance_process.lonlat_to_xyz(-120.5, 35.25)
+    result = distance_process.xyz_to_lonlat(2.0 * x, 2.0 * y, 2.0 * z)
+    assert abs(result[0] + 120.5) < 1e-9
+    assert abs(result[1] - 35.25) < 1e-9
+
+
+def test_nearest_point_on_segment_inside():
+    # point north of the middle of an east west segment projects to the middle
+    result = distance_process.calc_nearest_point_on_line_segment((116.05, 39.91), (116.0, 39.9), (116.1, 39.9))
+    assert abs(result[0] - 116.05) < 1e-6
+    assert abs(result[1] - 39.9) < 1e-3
+
+
+def test_nearest_point_on_segment_outside():
+    # projection beyond an end of segment is the nearer end, not a point on the great circle
+    s_point, e_point = (116.0, 39.9), (116.1, 39.9)
+    assert distance_process.calc_nearest_point_on_line_segment((115.9, 39.95), s_point, e_point) == s_point
+    assert distance_process.calc_nearest_point_on_line_segment((116.3, 39.85), s_point, e_point) == e_point
+
+
+def test_nearest_point_on_line_matches_vectorized():
+    last_precision = distance_process.set_precision(distance_process.PRECISION_HAVERSINE)
+    try:
+        rng = np.random.RandomState(15)
+        line = [(116.0 + 0.01 * i, 39.9 + 0.005 * ((i * 7) % 5)) for i in range(12)]
+        points = np.column_stack((rng.uniform(115.98, 116.13, 200), rng.uniform(39.88, 39.94, 200)))
+        nearest, _, _ = distance_process.calc_nearest_points_on_line(points, line)
+        for point, expected in zip(points.tolist(), nearest.tolist()):
+            result = distance_process.calc_nearest_point_on_line(tuple(point), line)
+            assert distance_process.calc_point_distance(result, tuple(expected)) < 1e-3
+    finally:
+        distance_process.set_precision(last_precision)
+
+
+def test_precision_scope_restores_precision():
+    last_precision = distance_process.get_precision()
+    with distance_process.precision_scope(distance_process.PRECISION_LOCAL_PLANAR):
+        assert distance_process.get_precision() == distance_process.PRECISION_LOCAL_PLANAR
+    assert distance_process.get_precision() == last_precision
+
+
+def test_is_same_point_ignores_precision():
+    # 0.0998 m apart near the top of a latitude band, band center projection stretches it over SAME_POINT_DISTANCE
+    lat = 80.099
+    point1 = (10.0, lat)
+    point2 = (10.0 + 0.0998 / (distance_process.EARTH_RADIUS * math.pi / 180.0 * math.cos(math.radians(lat))), lat)
+    assert distance_process.is_same_point(point1, point2)
+    with distance_process.precision_scope(distance_process.PRECISION_LOCAL_PLANAR):
+        assert distance_process.calc_point_distance(point1, point2) > 0.1
+        assert distance_process.is_same_point(point1, point2)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 11:00 AM 
+# @Author : yangyuxin
+# @File : test_endpoint_snap.py
+# calc_connected_labels 和 snap_points 的分组与逐对比较的暴力分组一致
+
+
+import numpy as np
+import distance_process
+import endpoint_snap
+
+
+def calc_brute_labels(item_num, items1, items2):
+    # label of every item is the smallest item of its group, groups are found by repeated merging
+    labels = list(range(item_num))
+    changed = True
+    while changed:
+        changed = False
+        for item1, item2 in zip(items1, items2):
+            label = min(labels[item1], labels[item2])
+            for item in (item1, item2):
+                if labels[item] != label:
+                    old_label = labels[item]
+                    labels = [label if value == old_label else value for value in labels]
+                    changed = True
+    return labels
+
+
+def calc_brute_groups(lons, lats, tolerance):
+    # compare every pair with the same haversine distance find_near_pairs uses
+    items1, items2 = np.triu_indices(lons.shape[0], 1)
+    distances = distance_process.calc_distance_array(lons[items1], lats[items1], lons[items2], lats[items2],
+                                                     distance_process.PRECISION_HAVERSINE)
+    # distances are rounded up by 0.00005 metre, 0 tolerance only groups same coordinate
+    if tolerance > 0.0:
+        near = distances <= tolerance
+    else:
+        near = (lons[items1] == lons[items2]) & (lats[items1] == lats[items2])
+    labels = calc_brute_labels(lons.shape[0], items1[near].tolist(), items2[near].tolist())
+    group_firsts = sorted(set(labels))
+    return [group_firsts.index(label) for label in labels], group_firsts
+
+
+def test_connected_labels_match_brute_force():
+    rng = np.random.RandomState(3)
+    for item_num, pair_num in [(1, 0), (10, 3), (50, 30), (200, 150), (200, 400)]:
+        items1 = rng.randint(0, item_num, pair_num)
+        items2 = rng.randint(0, item_num, pair_num)
+        labels = endpoint_snap.calc_connected_labels(item_num, items1, items2)
+        assert labels.tolist() == calc_brute_labels(item_num, items1.tolist(), items2.tolist())
+
+
+def test_snap_points_match_brute_force():
+    rng = np.random.RandomState(5)
+    for lat, tolerance in [(39.9, 5.0), (39.9, 1.0), (-33.9, 3.0), (70.0, 5.0)]:
+        # about 100 m x 100 m area, so chains of near points are common
+        lons = 116.0 + rng.uniform(0.0, 0.001 / np.cos(np.radians(lat)), 300)
+        lats = lat + rng.uniform(0.0, 0.001, 300)
+        groups, group_firsts = endpoint_snap.snap_points(lons, lats, tolerance)
+        brute_groups, brute_firsts = calc_brute_groups(lons, lats, tolerance)
+        assert groups.tolist() == brute_groups
+        assert group_firsts.tolist() == brute_firsts
+
+
+def test_snap_points_zero_tolerance():
+    rng = np.random.RandomState(9)
+    points = np.round(rng.uniform(0.0, 1.0, (300, 2)), 1) + [116.0, 39.0]
+    groups, group_firsts = endpoint_snap.snap_points(points[:, 0], points[:, 1], 0.0)
+    brute_groups, brute_firsts = calc_brute_groups(points[:, 0], points[:, 1], 0.0)
+    assert groups.tolist() == brute_groups
+    assert group_firsts.tolist() == brute_firsts
+
+
+def test_snap_points_empty():
+    for tolerance in [0.0, 1.0]:
+        groups, group_firsts = endpoint_snap.snap_points([], [], tolerance)
+        assert groups.shape[0] == 0
+        assert group_firsts.shape[0] == 0
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 4:10 PM 
+# @Author : yangyuxin
+# @File : test_map_match_process.py
+# 同一条道路上的转移按里程差的符号判断方向，单行道向后时绕行
+
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ogr')
+
+import compact_topology
+import map_match_process
+import route_process
+
+
+def make_square():
+    # four links around a square of about 85 m x 55 m, link 0 goes east along the south side
+    lines = [[(116.0, 39.9), (116.001, 39.9)], [(116.001, 39.9), (116.001, 39.9005)],
+             [(116.001, 39.9005), (116.0, 39.9005)], [(116.0, 39.9005), (116.0, 39.9)]]
+    coords = np.array([point for line in lines for point in line], dtype=np.float64)
+    offsets = np.array([0, 2, 4, 6, 8], dtype=np.int64)
+    return compact_topology.CompactTopology.from_lines(coords, offsets)
+
+
+def calc_same_link_route(link_directions, prev_measure, measure):
+    topology = make_square()
+    matcher = map_match_process.MapMatcher(topology, route_process.Router(topology, link_directions))
+    links = np.array([0], dtype=np.int64)
+    prev_candidates = (links, np.array([prev_measure]), np.zeros(1))
+    candidates = (links, np.array([measure]), np.zeros(1))
+    return float(matcher._calc_route_distances(prev_candidates, candidates, 50.0)[0, 0]), topology
+
+
+def test_same_link_forward():
+    route, _ = calc_same_link_route([route_process.DIRECTION_FORWARD] * 4, 20.0, 60.0)
+    assert abs(route - 40.0) < 1e-6
+
+
+def test_same_link_back_on_two_way_link():
+    route, _ = calc_same_link_route(None, 60.0, 20.0)
+    assert abs(route - 40.0) < 1e-6
+
+
+def test_same_link_back_on_one_way_link_goes_around():
+    route, topology = calc_same_link_route([route_process.DIRECTION_FORWARD] * 4, 60.0, 20.0)
+    around = float(np.sum(topology.link_lengths)) - 40.0
+    assert abs(route - around) < 1e-6
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 11:40 AM 
+# @Author : yangyuxin
+# @File : test_route_process.py
+# 双向 dijkstra 的距离和路径与单向 dijkstra 一致，包括单行道和不连通的情况
+
+
+import numpy as np
+import pytest
+
+pytest.importorskip('ogr')
+
+import compact_topology
+import route_process
+
+
+def make_random_network(rng, node_num, link_num):
+    # straight links between random nodes, about 1 km x 1 km
+    points = np.column_stack((116.0 + rng.uniform(0.0, 0.012, node_num), 39.9 + rng.uniform(0.0, 0.009, node_num)))
+    snodes = rng.randint(0, node_num, link_num)
+    enodes = (snodes + rng.randint(1, node_num, link_num)) % node_num
+    coords = np.stack((points[snodes], points[enodes]), axis=1).reshape(-1, 2)
+    offsets = np.arange(0, 2 * link_num + 1, 2, dtype=np.int64)
+    return compact_topology.CompactTopology.from_lines(coords, offsets)
+
+
+def check_path(router, result, source, target):
+    distance, nodes, links = result
+    assert nodes[0] == source and nodes[-1] == target
+    assert len(links) == len(nodes) - 1
+    assert abs(sum(router.topology.link_lengths[link] for link in links) - distance) < 1e-6
+    for node, next_node, link in zip(nodes[:-1], nodes[1:], links):
+        assert (next_node, link) in router._forward_graph[node]
+
+
+def test_bidirectional_match_dijkstra():
+    rng = np.random.RandomState(13)
+    for link_directions in [None, 'random']:
+        topology = make_random_network(rng, 80, 120)
+        if link_directions == 'random':
+            link_directions = rng.randint(0, 3, topology.get_link_num())
+        router = route_process.Router(topology, link_directions)
+        node_num = topology.get_node_num()
+        for source, target in zip(rng.randint(0, node_num, 200), rng.randint(0, node_num, 200)):
+            expected = router.shortest_path(source, target)
+            result = router.bidirectional_shortest_path(source, target)
+            if expected is None:
+                assert result is None
+                continue
+            assert abs(result[0] - expected[0]) < 1e-6
+            check_path(router, result, source, target)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*- 
+# @Time : 2020/10/18 11:20 AM 
+# @Author : yangyuxin
+# @File : test_spatial_index.py
+# PackedRTree.query_batch 的结果与逐个外包框比较的暴力结果一致
+
+
+import numpy as np
+import spatial_index
+
+
+def make_boxes(rng, num, size):
+    mins = rng.uniform(0.0, 100.0, (num, 2))
+    return np.hstack((mins, mins + rng.uniform(0.0, size, (num, 2))))
+
+
+def query_brute(item_boxes, query_boxes):
+    pairs = list()
+    for i, query_box in enumerate(query_boxes):
+        for j, item_box in enumerate(item_boxes):
+            if (item_box[0] <= query_box[2] and item_box[2] >= query_box[0]
+                    and item_box[1] <= query_box[3] and item_box[3] >= query_box[1]):
+                pairs.append((i, j))
+    return pairs
+
+
+def test_query_batch_match_brute_force():
+    rng = np.random.RandomState(11)
+    for item_num, node_size, chunk_size in [(1, 16, 100), (17, 2, 100), (500, 16, 7), (2000, 4, 1000)]:
+        item_boxes = make_boxes(rng, item_num, 5.0)
+        query_boxes = make_boxes(rng, 100, 10.0)
+        tree = spatial_index.PackedRTree(item_boxes, node_size=node_size)
+        queries, ids = tree.query_batch(query_boxes, chunk_size)
+        assert np.all(np.diff(queries) >= 0)
+        assert sorted(zip(queries.tolist(), ids.tolist())) == query_brute(item_boxes, query_boxes)
+
+
+def test_query_batch_boundary_touch():
+    tree = spatial_index.PackedRTree([[0.0, 0.0, 1.0, 1.0], [2.0, 2.0, 3.0, 3.0]])
+    queries, ids = tree.query_batch([[1.0, 1.0, 2.0, 2.0], [1.5, 1.5, 1.8, 1.8]])
+    assert queries.tolist() == [0, 0]
+    assert sorted(ids.tolist()) == [0, 1]
+
+
+def test_query_batch_empty():
+    tree = spatial_index.PackedRTree(np.empty((0, 4)))
+    queries, ids = tree.query_batch([[0.0, 0.0, 1.0, 1.0]])
+    assert queries.shape[0] == 0 and ids.shape[0] == 0
+    tree = spatial_index.PackedRTree([[0.0, 0.0, 1.0, 1.0]])
+    queries, ids = tree.query_batch(np.empty((0, 4)))
+    assert queries.shape[0] == 0 and ids.shape[0] == 0